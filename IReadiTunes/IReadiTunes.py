@@ -1,574 +1,1608 @@
-# -*- coding: utf-8 -*-
-"""
-Tool to get any information about iTunes tracks and playlists quickly and easily.
-Mickael <mickael2054dev@gmail.com>
-MIT License
-"""
-
-import xml.etree.ElementTree as ET
-from urllib.parse import unquote, urlparse
-import urllib.request
-from datetime import datetime
-
-
-def lib_init():
-    """Initilize the library, must be called at the very beginning"""
-    lib_class = Library()
-    return lib_class
-
-
-class Library(object):
-
-    def __init__(self):
-        """Constructor"""
-        self.lib = 0
-        self.playlists = []
-        self.playlist_by_persistent_id = {}
-        self.track_map = {}
-        self.song_list = []
-        self.movie_list = []
-        self.podcast_list = []
-        self.tvshow_list = []
-        self.audiobook_list = []
-
-    def parse(self, path_to_XML_file):
-        """Reads xml file and generate tracks list"""
-        tree = ET.parse(path_to_XML_file)
-        self.lib = tree.getroot()
-        self.read_tracks()
-        self.read_playlists()
-        self.generate_playlist_dislay_paths()
-
-    def get_plist_attr_value(self, attr_name, attr):
-        if attr.tag == 'string':
-            return attr.text
-        elif attr.tag == 'true':
-            return True
-        elif attr.tag == 'false':
-            return False
-        elif attr.tag == 'integer':
-            if attr.text is not None:
-                return int(attr.text)
-            else:
-                return None
-        elif attr.tag == 'date':
-            datetime_object = datetime.strptime(attr.text, "%Y-%m-%dT%H:%M:%SZ")
-            return datetime_object
-        elif attr.tag == 'data' and attr.text is not None and type(attr.text) is str:
-            return attr.text
-        else:
-            print("What to do for plist attribute '%s' of type '%s', value '%s'" % (attr_name, attr.tag, str(attr.text)))
-            return attr.text
-
-    def read_playlists(self):
-        """Generate tracks list"""
-        attribut_name_list = [ "Name", "Description", "Master", "Playlist ID", "Playlist Persistent ID", "Visible",
-                               "All Items", "Distinguished Kind", "Music", 'Movies', 'TV Shows', 'Podcasts',
-                               'Audiobooks', 'Folder', 'Parent Persistent ID', 'Purchased Music', 'Smart Criteria',
-                               'Smart Info']
-
-        # Docs are here??? https://developer.apple.com/documentation/ituneslibrary/itlibdistinguishedplaylistkind
-        ITLibDistinguishedPlaylistKindNone = 0
-        ITLibDistinguishedPlaylistKindMovies = 1
-        ITLibDistinguishedPlaylistKindTVShows = 2
-        ITLibDistinguishedPlaylistKindMusic = 3
-        ITLibDistinguishedPlaylistKindAudioBooks = 4
-        ITLibDistinguishedPlaylistKindRingtones = 5
-
-        ITLibDistinguishedPlaylistKindPodcasts = 7
-
-        ITLibDistinguishedPlaylistKindVoiceMemos = 14
-
-        ITLibDistinguishedPlaylistKindPurchases = 16
-
-        ITLibDistinguishedPlaylistKindiTunesU = 26
-
-        ITLibDistinguishedPlaylistKind90sMusic = 42
-        ITLibDistinguishedPlaylistKindMyTopRated = 43
-        ITLibDistinguishedPlaylistKindTop25MostPlayed = 44
-        ITLibDistinguishedPlaylistKindRecentlyPlayed = 45
-        ITLibDistinguishedPlaylistKindRecentlyAdded = 46
-        ITLibDistinguishedPlaylistKindMusicVideos = 47
-        ITLibDistinguishedPlaylistKindClassicalMusic = 48
-        ITLibDistinguishedPlaylistKindLibraryMusicVideos = 49
-
-        ITLibDistinguishedPlaylistKindHomeVideos = 50
-        ITLibDistinguishedPlaylistKindApplications = 51
-        ITLibDistinguishedPlaylistKindLovedSongs = 52
-        ITLibDistinguishedPlaylistKindMusicShowsAndMovies = 53
-
-        distinguishedKindMap = {
-            "None": ITLibDistinguishedPlaylistKindNone,
-            "Movies": ITLibDistinguishedPlaylistKindMovies,
-            "TVShows": ITLibDistinguishedPlaylistKindTVShows,
-            "Music": ITLibDistinguishedPlaylistKindMusic,
-            "AudioBooks": ITLibDistinguishedPlaylistKindAudioBooks,
-            "Ringtones": ITLibDistinguishedPlaylistKindRingtones,
-            "Podcasts": ITLibDistinguishedPlaylistKindPodcasts,
-            "VoiceMemos": ITLibDistinguishedPlaylistKindVoiceMemos,
-            "Purchases": ITLibDistinguishedPlaylistKindPurchases,
-            "iTunesU": ITLibDistinguishedPlaylistKindiTunesU,
-            "90sMusic": ITLibDistinguishedPlaylistKind90sMusic,
-            "MyTopRated": ITLibDistinguishedPlaylistKindMyTopRated,
-            "Top25MostPlayed": ITLibDistinguishedPlaylistKindTop25MostPlayed,
-            "RecentlyPlayed": ITLibDistinguishedPlaylistKindRecentlyPlayed,
-            "RecentlyAdded": ITLibDistinguishedPlaylistKindRecentlyAdded,
-            "MusicVideos": ITLibDistinguishedPlaylistKindMusicVideos,
-            "ClassicalMusic": ITLibDistinguishedPlaylistKindClassicalMusic,
-            "LibraryMusicVideos": ITLibDistinguishedPlaylistKindLibraryMusicVideos,
-            "HomeVideos": ITLibDistinguishedPlaylistKindHomeVideos,
-            "Applications": ITLibDistinguishedPlaylistKindApplications,
-            "LovedSongs": ITLibDistinguishedPlaylistKindLovedSongs,
-            "MusicShowsAndMovies": ITLibDistinguishedPlaylistKindMusicShowsAndMovies
-        }
-
-        # create an inverse map
-        distinguishedKindMapInverse = {}
-        for k, v in distinguishedKindMap.items():
-            distinguishedKindMapInverse[v] = k
-
-        class PlayList:
-            def __init__(self, name, description, master, playlist_id, playlist_persistent_id, visible, all_items,
-                         distinguished_kind, music, movies, tv_shows, podcasts, audiobooks, folder,
-                         parent_persistent_id, purchased_music, smart_criteria, smart_info):
-                self.extra_attributes = {}
-                self.tracks = []
-                self.name = name
-                self.description = description
-                self.master = master
-                self.playlist_id = playlist_id
-                self.playlist_persistent_id = playlist_persistent_id
-                self.visible = visible
-                self.all_items = all_items
-                self.distinguished_kind = distinguished_kind
-                self.music = music
-                self.movies = movies
-                self.tv_shows = tv_shows
-                self.podcasts = podcasts
-                self.audiobooks = audiobooks
-                self.folder = folder
-                self.parent_persistent_id = parent_persistent_id
-                self.purchased_music = purchased_music
-                self.smart_criteria = smart_criteria
-                self.smart_info = smart_info
-
-            def set_track_indexes(self, library, track_list):
-                for track_id in track_list:
-                    self.tracks.append( (track_id, library.track_map[track_id] ))
-
-            def add_extra_attribute(self, key, value):
-                self.extra_attributes[key] = value
-
-            def add_extra_attributes(self, attributes):
-                for key, value in attributes.items():
-                    self.extra_attributes[key] = value
-
-            def get_as_dict(self, add_distingished_kind_label = False):
-                playlist_dict = {}
-
-                def add_non_None_attribute(key, value):
-                    if value is not None:
-                        playlist_dict[key] = value
-
-                add_non_None_attribute('name', self.name)
-                add_non_None_attribute('description', self.description)
-                add_non_None_attribute('master', self.master)
-                add_non_None_attribute('playlist_id', self.playlist_id)
-                add_non_None_attribute('playlist_persistent_id', self.playlist_persistent_id)
-                add_non_None_attribute('visible', self.visible)
-                add_non_None_attribute('all_items', self.all_items)
-                add_non_None_attribute('distinguished_kind', self.distinguished_kind)
-                add_non_None_attribute('music', self.music)
-                add_non_None_attribute('movies', self.movies)
-                add_non_None_attribute('tv_shows', self.tv_shows)
-                add_non_None_attribute('podcasts', self.podcasts)
-                add_non_None_attribute('audiobooks', self.audiobooks)
-                add_non_None_attribute('folder', self.folder)
-                add_non_None_attribute('parent_persistent_id', self.parent_persistent_id)
-                add_non_None_attribute('purchased_music', self.purchased_music)
-                add_non_None_attribute('smart_criteria', self.smart_criteria)
-                add_non_None_attribute('smart_info', self.smart_info)
-                add_non_None_attribute('display_path', self.display_path)
-
-                #add the individual tracks
-                if self.tracks:
-                    playlist_dict['tracks'] = []
-                    for id, track in self.tracks:
-                        track_dict = track.get_as_dict()
-                        playlist_dict['tracks'].append(track_dict)
-                """ this code puts just the track file name
-                if self.tracks:
-                    playlist_dict['tracks'] = []
-                    for id, track in self.tracks:
-                        if track.location:
-                            playlist_dict['tracks'].append(track.location)
-                """
-
-
-                for key, value in self.extra_attributes.items():
-                    playlist_dict[key] = value
-
-                # if they want a text representation, look it up
-                if add_distingished_kind_label and 'distinguished_kind' in playlist_dict:
-                    if playlist_dict['distinguished_kind'] in distinguishedKindMapInverse:
-                        playlist_dict['distinguished_kind_label'] = distinguishedKindMapInverse[playlist_dict['distinguished_kind']]
-
-                return playlist_dict
-
-        attribut_name_list_len = len(attribut_name_list)
-
-        missing_attribute_tags = {}
-
-        """Creates playlists list"""
-        main_dict = self.lib.findall('dict')
-
-        sub_array = main_dict[0].findall('array')
-        sub_array_childrens = list(sub_array[0])
-
-        for array in sub_array_childrens:
-            playlist_attributes = list(array)
-            att_list = [None] * attribut_name_list_len
-
-            extra_attributes = {}
-            track_list = []
-            for att_ind in range(0, len(playlist_attributes), 2):
-                if playlist_attributes[att_ind].text == "Playlist Items" and playlist_attributes[att_ind+1].tag == "array":
-                    tracks_sub_array = list(playlist_attributes[att_ind+1])
-
-                    for k in range(len(tracks_sub_array)):
-                        track_tags = list(tracks_sub_array[k])
-                        assert len(track_tags) == 2
-                        assert track_tags[0].tag == 'key' and track_tags[0].text == "Track ID"
-                        assert track_tags[1].tag == 'integer'
-                        track_list.append(int(track_tags[1].text))
-
-                        #self.complete_playlist.append([cur_playlist_name, track_tags[1].text])
-                else:
-                    try:
-                        #print("Looking at "+playlist_attributes[att_ind].text)
-                        tag_index = attribut_name_list.index(playlist_attributes[att_ind].text)
-                    except ValueError:
-                        missing_attribute_tags[playlist_attributes[att_ind].text] = True
-                        extra_attributes[playlist_attributes[att_ind].text] = self.get_plist_attr_value(playlist_attributes[att_ind].text, playlist_attributes[att_ind+1])
-                        continue
-                    att_list[tag_index] = self.get_plist_attr_value(playlist_attributes[att_ind].text, playlist_attributes[att_ind+1])
-
-            new_playlist = PlayList(*att_list)
-            new_playlist.set_track_indexes(self, track_list)
-            if len(extra_attributes) > 0:
-                new_playlist.add_extra_attributes(extra_attributes)
-            self.playlists.append(new_playlist)
-            self.playlist_by_persistent_id[new_playlist.playlist_persistent_id] = new_playlist
-
-        if len(missing_attribute_tags) > 0:
-            print("missing attribute handling: ", missing_attribute_tags.keys())
-
-    def generate_playlist_dislay_paths(self):
-        def make_legal_filename(filename):
-            for char in "/\\:*?\"'<>|[]":
-                filename = filename.replace(char, '_')
-            filename = filename.strip(', _.')
-            return filename
-
-        for playlist in self.playlists:
-            playlist_name = make_legal_filename(playlist.name)
-            if playlist_name == 'Downloaded':
-                if playlist.distinguished_kind == 65:
-                    playlist_name += "_music"
-                elif playlist.distinguished_kind == 66:
-                    playlist_name += "_movies"
-                elif playlist.distinguished_kind == 67:
-                    playlist_name += "_tv_shows"
-                else:
-                    playlist_name += "_"+str(playlist.distinguished_kind)
-
-            display_path  = "/"+playlist_name
-            parent_id = playlist.parent_persistent_id
-            while parent_id:
-                parent_playlist = self.playlist_by_persistent_id[parent_id]
-                display_path = '/' + make_legal_filename(parent_playlist.name) + display_path
-                parent_id = parent_playlist.parent_persistent_id
-            playlist.display_path = display_path
-
-    def get_playlists(self):
-        """Returns playlists list"""
-        return self.playlists
-
-    def get_song_list(self):
-        """Returns playlists list"""
-        return self.song_list
-
-    def get_movie_list(self):
-        """Returns playlists list"""
-        return self.movie_list
-
-    def get_podcast_list(self):
-        """Returns playlists list"""
-        return self.podcast_list
-
-    def get_tvshow_list(self):
-        """Returns playlists list"""
-        return self.tvshow_list
-
-    def get_audiobook_list(self):
-        """Returns playlists list"""
-        return self.audiobook_list
-
-
-    def read_tracks(self):
-        """Generate tracks list"""
-        attribut_name_list = ["Track ID", "Size", "Total Time", "Date Modified",
-                              "Date Added", "Bit Rate", "Sample Rate", "Play Count",
-                              "Play Date", "Play Date UTC", "Skip Count", "Skip Date",
-                              "Rating", "Album Rating", "Persistent ID", "Track Type",
-                              "File Folder Count", "Library Folder Count", "Name",
-                              "Artist", "Kind", "Location", "Album", 'Genre', 'Year',
-                              'Release Date', 'Artwork Count', 'Sort Artist', 'Sort Name',
-                              'Content Rating', 'Purchased', 'Has Video', 'HD', 'Movie',
-                              'Album Artist', 'Composer', 'Disc Number', 'Disc Count',
-                              'Track Number', 'Track Count', 'Normalization', 'Sort Album',
-                              'Loved', 'Compilation', 'Sort Album Artist', 'Series',
-                              'Episode Order', 'TV Show', 'Protected', 'Video Width',
-                              'Video Height', 'Season', 'BPM', 'Podcast', 'Unplayed',
-                              'Comments', 'Part Of Gapless Album', 'Work', 'Clean',
-                              'Explicit', 'Sort Composer', 'Music Video', 'Grouping']
-
-        class Track:
-            def __init__(self, track_id, size, total_time, date_modified,
-                         date_added, bitrate, sample_rate, play_count, play_date,
-                         play_date_utc, skip_count, skip_date, rating,
-                         album_rating, persistent_id, track_type,
-                         file_folder_count, library_folder_count, name, artist,
-                         kind, location, album, genre, year, release_date, artwork_count,
-                         sort_artist, sort_name, content_rating, purchased, has_video, hd,
-                         movie, album_artist, composer, disc_number, disc_count,
-                         track_number, track_count, normalization, sort_album, loved,
-                         compilation, sort_album_artist, series, episode_order, tv_show,
-                         protected, video_width, video_height, season, bpm, podcast, unplayed,
-                         comments, part_of_gapless_album, work, clean, explicit, sort_composer,
-                         music_video, grouping):
-                self.extra_attributes = {}
-                self.track_id = track_id
-                self.size = size
-                self.total_time = total_time
-                self.date_modified = date_modified
-                self.date_added = date_added
-                self.bitrate = bitrate
-                self.sample_rate = sample_rate
-                self.play_count = play_count
-                self.play_date = play_date
-                self.play_date_utc = play_date_utc
-                self.skip_count = skip_count
-                self.skip_date = skip_date
-                self.rating = rating
-                self.album_rating = album_rating
-                self.persistent_id = persistent_id
-                self.track_type = track_type
-                self.file_folder_count = file_folder_count
-                self.library_folder_count = library_folder_count
-                self.name = name
-                self.artist = artist
-                self.kind = kind
-                self.location = location
-                self.album = album
-
-                self.genre = genre
-                self.year = year
-                self.release_date = release_date
-                self.artwork_count = artwork_count
-                self.sort_artist = sort_artist
-                self.sort_name = sort_name
-                self.content_rating = content_rating
-                self.purchased = purchased
-                self.has_video = has_video
-                self.hd = hd
-                self.movie = movie
-                self.album_artist = album_artist
-                self.composer = composer
-                self.disc_number = disc_number
-                self.disc_count = disc_count
-                self.track_number = track_number
-                self.track_count = track_count
-                self.normalization = normalization
-                self.sort_album = sort_album
-                self.loved = loved
-                self.compilation = compilation
-                self.sort_album_artist = sort_album_artist
-                self.series = series
-                self.episode_order = episode_order
-                self.tv_show = tv_show
-                self.protected = protected
-                self.video_width = video_width
-                self.video_height = video_height
-                self.season = season
-                self.bpm = bpm
-                self.podcast = podcast
-                self.unplayed = unplayed
-                self.comments = comments
-                self.part_of_gapless_album = part_of_gapless_album
-                self.work = work
-                self.clean = clean
-                self.explicit = explicit
-                self.sort_composer = sort_composer
-                self.music_video = music_video
-                self.grouping = grouping
-                if self.location:
-                    self.location = urllib.request.unquote(self.location)
-
-            def add_extra_attribute(self, key, value):
-                self.extra_attributes[key] = value
-
-            def add_extra_attributes(self, attributes):
-                for key, value in attributes.items():
-                    self.extra_attributes[key] = value
-
-            def get_as_dict(self):
-                track_dict = {}
-
-                def add_non_None_attribute(key, value):
-                    if value is not None:
-                        track_dict[key] = value
-
-                add_non_None_attribute('track_id', self.track_id)
-                add_non_None_attribute('size', self.size)
-                add_non_None_attribute('total_time', self.total_time)
-                add_non_None_attribute('date_modified', self.date_modified)
-                add_non_None_attribute('date_added', self.date_added)
-                add_non_None_attribute('bitrate', self.bitrate)
-                add_non_None_attribute('sample_rate', self.sample_rate)
-                add_non_None_attribute('play_count', self.play_count)
-                add_non_None_attribute('play_date', self.play_date)
-                add_non_None_attribute('play_date_utc', self.play_date_utc)
-                add_non_None_attribute('skip_count', self.skip_count)
-                add_non_None_attribute('skip_date', self.skip_date)
-                add_non_None_attribute('rating', self.rating)
-                add_non_None_attribute('album_rating', self.album_rating)
-                add_non_None_attribute('persistent_id', self.persistent_id)
-                add_non_None_attribute('track_type', self.track_type)
-                add_non_None_attribute('file_folder_count', self.file_folder_count)
-                add_non_None_attribute('library_folder_count', self.library_folder_count)
-                add_non_None_attribute('name', self.name)
-                add_non_None_attribute('artist', self.artist)
-                add_non_None_attribute('kind', self.kind)
-                add_non_None_attribute('location', self.location)
-                add_non_None_attribute('album', self.album)
-
-                add_non_None_attribute('genre', self.genre)
-                add_non_None_attribute('year', self.year)
-                add_non_None_attribute('release_date', self.release_date)
-                add_non_None_attribute('artwork_count', self.artwork_count)
-                add_non_None_attribute('sort_artist', self.sort_artist)
-                add_non_None_attribute('sort_name', self.sort_name)
-                add_non_None_attribute('content_rating', self.content_rating)
-                add_non_None_attribute('purchased', self.purchased)
-                add_non_None_attribute('has_video', self.has_video)
-                add_non_None_attribute('hd', self.hd)
-                add_non_None_attribute('movie', self.movie)
-                add_non_None_attribute('album_artist', self.album_artist)
-                add_non_None_attribute('composer', self.composer)
-                add_non_None_attribute('disc_number', self.disc_number)
-                add_non_None_attribute('disc_count', self.disc_count)
-                add_non_None_attribute('track_number', self.track_number)
-                add_non_None_attribute('track_count', self.track_count)
-                add_non_None_attribute('normalization', self.normalization)
-                add_non_None_attribute('sort_album', self.sort_album)
-                add_non_None_attribute('loved', self.loved)
-                add_non_None_attribute('compilation', self.compilation)
-                add_non_None_attribute('sort_album_artist', self.sort_album_artist)
-                add_non_None_attribute('series', self.series)
-                add_non_None_attribute('episode_order', self.episode_order)
-                add_non_None_attribute('tv_show', self.tv_show)
-                add_non_None_attribute('protected', self.protected)
-                add_non_None_attribute('video_width', self.video_width)
-                add_non_None_attribute('video_height', self.video_height)
-                add_non_None_attribute('season', self.season)
-                add_non_None_attribute('bpm', self.bpm)
-                add_non_None_attribute('podcast', self.podcast)
-                add_non_None_attribute('unplayed', self.unplayed)
-                add_non_None_attribute('comments', self.comments)
-                add_non_None_attribute('part_of_gapless_album', self.part_of_gapless_album)
-                add_non_None_attribute('work', self.work)
-                add_non_None_attribute('clean', self.clean)
-                add_non_None_attribute('explicit', self.explicit)
-                add_non_None_attribute('sort_composer', self.sort_composer)
-                add_non_None_attribute('music_video', self.music_video)
-                add_non_None_attribute('grouping', self.grouping)
-
-                if len(self.extra_attributes):
-                    for key, value in self.extra_attributes.items():
-                        track_dict[key] = value
-
-                return track_dict
-
-        attribut_name_list_len = len(attribut_name_list)
-
-        missing_attribute_tags = {}
-
-        # Create tracks list with attributes
-        main_dict = self.lib.findall('dict')
-
-        sub_array = main_dict[0].findall('dict')
-        sub_array_childrens = list(sub_array[0])
-
-        for track in sub_array_childrens:
-            att_list = [None] * attribut_name_list_len
-
-            if track.tag == "dict":
-                extra_attributes = {}
-                track_attributes = list(track)
-                for att_ind in range(0, len(track_attributes), 2):
-                    try:
-                        tag_index = attribut_name_list.index(track_attributes[att_ind].text)
-                    except ValueError:
-                        missing_attribute_tags[track_attributes[att_ind].text] = True
-                        extra_attributes[track_attributes[att_ind].text] = self.get_plist_attr_value(track_attributes[att_ind].text, track_attributes[att_ind+1])
-                        continue
-                    att_list[tag_index] = self.get_plist_attr_value(track_attributes[att_ind].text, track_attributes[att_ind+1])
-
-                new_track = Track(*att_list)
-                if len(extra_attributes) > 0:
-                    new_track.add_extra_attributes(extra_attributes)
-
-                self.track_map[new_track.track_id] = new_track
-                if new_track.location and new_track.location.find('/Audiobooks/') >= 0:
-                    self.audiobook_list.append(new_track)
-                elif new_track.movie:
-                    self.movie_list.append(new_track)
-                elif new_track.podcast:
-                    self.podcast_list.append(new_track)
-                elif new_track.tv_show:
-                    self.tvshow_list.append(new_track)
-                elif new_track.genre and new_track.location and new_track.genre == "Podcast" and new_track.location.lower().find('file://localhost/')<0:
-                    self.podcast_list.append(new_track)
-                else:
-                    self.song_list.append(new_track)
-
-        if len(missing_attribute_tags) > 0:
-            print("missing attribute handling: ", missing_attribute_tags.keys())
-
-
-def get_size(input_size):
-    if input_size is None:
-        return "unknown"
-    """Returns the size of a track in a human-readable way"""
-    return float("{0:.2f}".format(int(input_size) / 1E6))
-
-
-def get_total_time(input_time):
-    if input_time is None:
-        return 0
-    """Returns the duration of a track in a human-readable way"""
-    return int(int(input_time) / 1000)
-
-
-def get_rating(input_rating):
-    """ Returns stars iTunes rating"""
-    if input_rating:
-        return (int(input_rating) / 100) * 5
-    else:
-        return input_rating
-
-
-def get_track_path(input_url):
-    """Returns the path of a track"""
-    return unquote(urlparse(input_url).path[1:])
+# -*- coding: utf-8 -*-
+"""
+Tool to get any information about iTunes tracks and playlists quickly and easily.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import concurrent.futures
+import copy
+from array import array
+import hashlib
+import io
+import logging
+import os
+import re
+import struct
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote, urlparse
+import urllib.request
+from datetime import datetime
+
+from IReadiTunes import cache as snapshot_cache
+
+logger = logging.getLogger(__name__)
+
+
+TRACK_ATTRIBUTE_NAMES = ["Track ID", "Size", "Total Time", "Date Modified",
+                         "Date Added", "Bit Rate", "Sample Rate", "Play Count",
+                         "Play Date", "Play Date UTC", "Skip Count", "Skip Date",
+                         "Rating", "Album Rating", "Persistent ID", "Track Type",
+                         "File Folder Count", "Library Folder Count", "Name",
+                         "Artist", "Kind", "Location", "Album", 'Genre', 'Year',
+                         'Release Date', 'Artwork Count', 'Sort Artist', 'Sort Name',
+                         'Content Rating', 'Purchased', 'Has Video', 'HD', 'Movie',
+                         'Album Artist', 'Composer', 'Disc Number', 'Disc Count',
+                         'Track Number', 'Track Count', 'Normalization', 'Sort Album',
+                         'Loved', 'Compilation', 'Sort Album Artist', 'Series',
+                         'Episode Order', 'TV Show', 'Protected', 'Video Width',
+                         'Video Height', 'Season', 'BPM', 'Podcast', 'Unplayed',
+                         'Comments', 'Part Of Gapless Album', 'Work', 'Clean',
+                         'Explicit', 'Sort Composer', 'Music Video', 'Grouping']
+
+# Track attribute of each entry of TRACK_ATTRIBUTE_NAMES
+TRACK_FIELD_NAMES = ('track_id', 'size', 'total_time', 'date_modified', 'date_added', 'bitrate',
+                     'sample_rate', 'play_count', 'play_date', 'play_date_utc', 'skip_count',
+                     'skip_date', 'rating', 'album_rating', 'persistent_id', 'track_type',
+                     'file_folder_count', 'library_folder_count', 'name', 'artist', 'kind',
+                     'location', 'album', 'genre', 'year', 'release_date', 'artwork_count',
+                     'sort_artist', 'sort_name', 'content_rating', 'purchased', 'has_video', 'hd',
+                     'movie', 'album_artist', 'composer', 'disc_number', 'disc_count',
+                     'track_number', 'track_count', 'normalization', 'sort_album', 'loved',
+                     'compilation', 'sort_album_artist', 'series', 'episode_order', 'tv_show',
+                     'protected', 'video_width', 'video_height', 'season', 'bpm', 'podcast',
+                     'unplayed', 'comments', 'part_of_gapless_album', 'work', 'clean', 'explicit',
+                     'sort_composer', 'music_video', 'grouping')
+
+PLAYLIST_ATTRIBUTE_NAMES = ["Name", "Description", "Master", "Playlist ID", "Playlist Persistent ID", "Visible",
+                            "All Items", "Distinguished Kind", "Music", 'Movies', 'TV Shows', 'Podcasts',
+                            'Audiobooks', 'Folder', 'Parent Persistent ID', 'Purchased Music', 'Smart Criteria',
+                            'Smart Info']
+
+# PlayList attribute of each entry of PLAYLIST_ATTRIBUTE_NAMES
+PLAYLIST_FIELD_NAMES = ('name', 'description', 'master', 'playlist_id', 'playlist_persistent_id', 'visible',
+                        'all_items', 'distinguished_kind', 'music', 'movies', 'tv_shows', 'podcasts',
+                        'audiobooks', 'folder', 'parent_persistent_id', 'purchased_music', 'smart_criteria',
+                        'smart_info')
+
+# key -> slot of the value in the Track / PlayList constructor arguments
+TRACK_ATTRIBUTE_INDEX = dict((name, index) for index, name in enumerate(TRACK_ATTRIBUTE_NAMES))
+PLAYLIST_ATTRIBUTE_INDEX = dict((name, index) for index, name in enumerate(PLAYLIST_ATTRIBUTE_NAMES))
+
+# Values compared by Library.update to tell whether a track changed. iTunes bumps
+# Date Modified when a track is edited, but not when it is played, skipped or rated.
+TRACK_CHANGE_KEYS = ("Track ID", "Date Modified", "Play Count", "Play Date UTC", "Skip Count", "Skip Date",
+                     "Rating", "Loved")
+
+PLIST_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Libraries share a handful of timestamps between thousands of tracks (bulk imports, syncs)
+_DATE_CACHE_SIZE = 65536
+_date_cache = {}
+
+
+def decode_plist_date(text):
+    """Returns the datetime of a plist <date> value, e.g. '2019-04-01T10:32:00Z'"""
+    value = _date_cache.get(text)
+    if value is not None:
+        return value
+    if (len(text) == 20 and text[4] == '-' and text[7] == '-' and text[10] == 'T'
+            and text[13] == ':' and text[16] == ':' and text[19] == 'Z'):
+        value = datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                         int(text[11:13]), int(text[14:16]), int(text[17:19]))
+    else:
+        value = datetime.strptime(text, PLIST_DATE_FORMAT)
+    if len(_date_cache) >= _DATE_CACHE_SIZE:
+        _date_cache.clear()
+    _date_cache[text] = value
+    return value
+
+
+def _decode_integer(text):
+    if text is not None:
+        return int(text)
+    return None
+
+
+def _decode_text(text):
+    return text
+
+
+def _decode_true(text):
+    return True
+
+
+def _decode_false(text):
+    return False
+
+
+# plist value tag -> decoder of the element text
+PLIST_VALUE_DECODERS = {
+    'string': _decode_text,
+    'true': _decode_true,
+    'false': _decode_false,
+    'integer': _decode_integer,
+    'date': decode_plist_date,
+    'data': _decode_text,
+}
+
+
+def plist_element_signature(elem):
+    """Returns a stable hash of the tags and texts of an element and its descendants, ignoring indentation"""
+    digest = hashlib.sha1()
+    for child in elem.iter():
+        digest.update(child.tag.encode('utf-8'))
+        digest.update(b'\x00')
+        if child.text is not None and child.tag != 'dict' and child.tag != 'array':
+            digest.update(child.text.encode('utf-8'))
+        digest.update(b'\x01')
+    return digest.hexdigest()
+
+# Docs are here??? https://developer.apple.com/documentation/ituneslibrary/itlibdistinguishedplaylistkind
+ITLibDistinguishedPlaylistKindNone = 0
+ITLibDistinguishedPlaylistKindMovies = 1
+ITLibDistinguishedPlaylistKindTVShows = 2
+ITLibDistinguishedPlaylistKindMusic = 3
+ITLibDistinguishedPlaylistKindAudioBooks = 4
+ITLibDistinguishedPlaylistKindRingtones = 5
+
+ITLibDistinguishedPlaylistKindPodcasts = 7
+
+ITLibDistinguishedPlaylistKindVoiceMemos = 14
+
+ITLibDistinguishedPlaylistKindPurchases = 16
+
+ITLibDistinguishedPlaylistKindiTunesU = 26
+
+ITLibDistinguishedPlaylistKind90sMusic = 42
+ITLibDistinguishedPlaylistKindMyTopRated = 43
+ITLibDistinguishedPlaylistKindTop25MostPlayed = 44
+ITLibDistinguishedPlaylistKindRecentlyPlayed = 45
+ITLibDistinguishedPlaylistKindRecentlyAdded = 46
+ITLibDistinguishedPlaylistKindMusicVideos = 47
+ITLibDistinguishedPlaylistKindClassicalMusic = 48
+ITLibDistinguishedPlaylistKindLibraryMusicVideos = 49
+
+ITLibDistinguishedPlaylistKindHomeVideos = 50
+ITLibDistinguishedPlaylistKindApplications = 51
+ITLibDistinguishedPlaylistKindLovedSongs = 52
+ITLibDistinguishedPlaylistKindMusicShowsAndMovies = 53
+
+distinguishedKindMap = {
+    "None": ITLibDistinguishedPlaylistKindNone,
+    "Movies": ITLibDistinguishedPlaylistKindMovies,
+    "TVShows": ITLibDistinguishedPlaylistKindTVShows,
+    "Music": ITLibDistinguishedPlaylistKindMusic,
+    "AudioBooks": ITLibDistinguishedPlaylistKindAudioBooks,
+    "Ringtones": ITLibDistinguishedPlaylistKindRingtones,
+    "Podcasts": ITLibDistinguishedPlaylistKindPodcasts,
+    "VoiceMemos": ITLibDistinguishedPlaylistKindVoiceMemos,
+    "Purchases": ITLibDistinguishedPlaylistKindPurchases,
+    "iTunesU": ITLibDistinguishedPlaylistKindiTunesU,
+    "90sMusic": ITLibDistinguishedPlaylistKind90sMusic,
+    "MyTopRated": ITLibDistinguishedPlaylistKindMyTopRated,
+    "Top25MostPlayed": ITLibDistinguishedPlaylistKindTop25MostPlayed,
+    "RecentlyPlayed": ITLibDistinguishedPlaylistKindRecentlyPlayed,
+    "RecentlyAdded": ITLibDistinguishedPlaylistKindRecentlyAdded,
+    "MusicVideos": ITLibDistinguishedPlaylistKindMusicVideos,
+    "ClassicalMusic": ITLibDistinguishedPlaylistKindClassicalMusic,
+    "LibraryMusicVideos": ITLibDistinguishedPlaylistKindLibraryMusicVideos,
+    "HomeVideos": ITLibDistinguishedPlaylistKindHomeVideos,
+    "Applications": ITLibDistinguishedPlaylistKindApplications,
+    "LovedSongs": ITLibDistinguishedPlaylistKindLovedSongs,
+    "MusicShowsAndMovies": ITLibDistinguishedPlaylistKindMusicShowsAndMovies
+}
+
+# create an inverse map
+distinguishedKindMapInverse = {}
+for k, v in distinguishedKindMap.items():
+    distinguishedKindMapInverse[v] = k
+
+
+def lib_init():
+    """Initilize the library, must be called at the very beginning"""
+    lib_class = Library()
+    return lib_class
+
+
+def iter_library_items(source):
+    """Streams a library XML file, yields ('track', element) and ('playlist', element) pairs
+
+    Consumed elements are cleared as soon as the caller moves on, so only the
+    element currently being yielded is kept in memory, never the whole tree.
+    """
+    depth = 0
+    root_dict = None
+    section = None
+    section_elem = None
+    last_key = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2:
+                root_dict = elem
+            elif depth == 3 and elem.tag != 'key' and last_key in ('Tracks', 'Playlists'):
+                section = last_key
+                section_elem = elem
+            continue
+
+        if depth == 4 and section is not None:
+            if elem.tag == 'dict':
+                yield ('track' if section == 'Tracks' else 'playlist'), elem
+                # drop the consumed dict and the key preceding it
+                section_elem.clear()
+        elif depth == 3:
+            if elem.tag == 'key':
+                last_key = elem.text
+            else:
+                if section is not None:
+                    yield 'end_' + section.lower(), section_elem
+                    section = None
+                    section_elem = None
+                root_dict.clear()
+        depth -= 1
+
+
+class PlaylistTracks(object):
+    """Read-only sequence of the (track_id, Track) pairs of a playlist, resolved on access"""
+    __slots__ = ('track_ids', 'track_map')
+
+    def __init__(self, track_ids, track_map):
+        self.track_ids = track_ids
+        self.track_map = track_map
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __iter__(self):
+        track_map = self.track_map
+        for track_id in self.track_ids:
+            yield track_id, track_map[track_id]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [(track_id, self.track_map[track_id]) for track_id in self.track_ids[index]]
+        track_id = self.track_ids[index]
+        return track_id, self.track_map[track_id]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return "PlaylistTracks(%r)" % list(self)
+
+
+def _track_ids_of(playlist_or_ids):
+    if isinstance(playlist_or_ids, PlayList):
+        return playlist_or_ids.track_ids
+    return playlist_or_ids
+
+
+def _track_id_set_of(playlist_or_ids):
+    if isinstance(playlist_or_ids, PlayList):
+        return playlist_or_ids.track_id_set()
+    return frozenset(playlist_or_ids)
+
+
+class PlayList:
+    def __init__(self, name, description, master, playlist_id, playlist_persistent_id, visible, all_items,
+                 distinguished_kind, music, movies, tv_shows, podcasts, audiobooks, folder,
+                 parent_persistent_id, purchased_music, smart_criteria, smart_info):
+        self.extra_attributes = {}
+        # members as Track IDs, the Track objects are looked up in _track_map
+        self.track_ids = array('i')
+        self._track_map = {}
+        self._track_id_set = None
+        # folder tree, set by Library.generate_playlist_dislay_paths
+        self.parent = None
+        self.children = []
+        self.display_path = None
+        self.name = name
+        self.description = description
+        self.master = master
+        self.playlist_id = playlist_id
+        self.playlist_persistent_id = playlist_persistent_id
+        self.visible = visible
+        self.all_items = all_items
+        self.distinguished_kind = distinguished_kind
+        self.music = music
+        self.movies = movies
+        self.tv_shows = tv_shows
+        self.podcasts = podcasts
+        self.audiobooks = audiobooks
+        self.folder = folder
+        self.parent_persistent_id = parent_persistent_id
+        self.purchased_music = purchased_music
+        self.smart_criteria = smart_criteria
+        self.smart_info = smart_info
+
+    @property
+    def tracks(self):
+        """(track_id, Track) pairs of the playlist, in playlist order"""
+        return PlaylistTracks(self.track_ids, self._track_map)
+
+    def set_track_indexes(self, library, track_list):
+        track_map = library.track_map
+        for track_id in track_list:
+            if track_id not in track_map:
+                raise KeyError(track_id)
+        self.track_ids.extend(track_list)
+        self._track_map = track_map
+        self._track_id_set = None
+
+    def iter_subtree(self):
+        """Yields this playlist then every playlist under it, depth first"""
+        pending = [self]
+        while pending:
+            playlist = pending.pop()
+            yield playlist
+            pending.extend(reversed(playlist.children))
+
+    def track_id_set(self):
+        """Returns the Track IDs of the playlist as a frozenset"""
+        if self._track_id_set is None:
+            self._track_id_set = frozenset(self.track_ids)
+        return self._track_id_set
+
+    def contains_track(self, track_id):
+        return track_id in self.track_id_set()
+
+    def union(self, other):
+        """Returns the Track IDs of this playlist then those only in other, other is a PlayList or Track IDs"""
+        seen = set(self.track_id_set())
+        result = array('i', self.track_ids)
+        for track_id in _track_ids_of(other):
+            if track_id not in seen:
+                seen.add(track_id)
+                result.append(track_id)
+        return result
+
+    def intersection(self, other):
+        """Returns the Track IDs of this playlist also in other, in playlist order"""
+        other_ids = _track_id_set_of(other)
+        return array('i', [track_id for track_id in self.track_ids if track_id in other_ids])
+
+    def difference(self, other):
+        """Returns the Track IDs of this playlist not in other, in playlist order"""
+        other_ids = _track_id_set_of(other)
+        return array('i', [track_id for track_id in self.track_ids if track_id not in other_ids])
+
+    def add_extra_attribute(self, key, value):
+        self.extra_attributes[key] = value
+
+    def add_extra_attributes(self, attributes):
+        for key, value in attributes.items():
+            self.extra_attributes[key] = value
+
+    def get_as_dict(self, add_distingished_kind_label = False, include_tracks = True):
+        playlist_dict = {}
+
+        def add_non_None_attribute(key, value):
+            if value is not None:
+                playlist_dict[key] = value
+
+        add_non_None_attribute('name', self.name)
+        add_non_None_attribute('description', self.description)
+        add_non_None_attribute('master', self.master)
+        add_non_None_attribute('playlist_id', self.playlist_id)
+        add_non_None_attribute('playlist_persistent_id', self.playlist_persistent_id)
+        add_non_None_attribute('visible', self.visible)
+        add_non_None_attribute('all_items', self.all_items)
+        add_non_None_attribute('distinguished_kind', self.distinguished_kind)
+        add_non_None_attribute('music', self.music)
+        add_non_None_attribute('movies', self.movies)
+        add_non_None_attribute('tv_shows', self.tv_shows)
+        add_non_None_attribute('podcasts', self.podcasts)
+        add_non_None_attribute('audiobooks', self.audiobooks)
+        add_non_None_attribute('folder', self.folder)
+        add_non_None_attribute('parent_persistent_id', self.parent_persistent_id)
+        add_non_None_attribute('purchased_music', self.purchased_music)
+        add_non_None_attribute('smart_criteria', self.smart_criteria)
+        add_non_None_attribute('smart_info', self.smart_info)
+        add_non_None_attribute('display_path', self.display_path)
+
+        #add the individual tracks
+        if include_tracks and self.track_ids:
+            playlist_dict['tracks'] = []
+            for id, track in self.tracks:
+                track_dict = track.get_as_dict()
+                playlist_dict['tracks'].append(track_dict)
+        """ this code puts just the track file name
+        if self.tracks:
+            playlist_dict['tracks'] = []
+            for id, track in self.tracks:
+                if track.location:
+                    playlist_dict['tracks'].append(track.location)
+        """
+
+
+        for key, value in self.extra_attributes.items():
+            playlist_dict[key] = value
+
+        # if they want a text representation, look it up
+        if add_distingished_kind_label and 'distinguished_kind' in playlist_dict:
+            if playlist_dict['distinguished_kind'] in distinguishedKindMapInverse:
+                playlist_dict['distinguished_kind_label'] = distinguishedKindMapInverse[playlist_dict['distinguished_kind']]
+
+        return playlist_dict
+
+
+
+class Track(object):
+    """One library track, stored in __slots__ to keep large libraries compact"""
+    __slots__ = TRACK_FIELD_NAMES + ('_extra_attributes',)
+
+    def __init__(self, track_id, size, total_time, date_modified,
+                 date_added, bitrate, sample_rate, play_count, play_date,
+                 play_date_utc, skip_count, skip_date, rating,
+                 album_rating, persistent_id, track_type,
+                 file_folder_count, library_folder_count, name, artist,
+                 kind, location, album, genre, year, release_date, artwork_count,
+                 sort_artist, sort_name, content_rating, purchased, has_video, hd,
+                 movie, album_artist, composer, disc_number, disc_count,
+                 track_number, track_count, normalization, sort_album, loved,
+                 compilation, sort_album_artist, series, episode_order, tv_show,
+                 protected, video_width, video_height, season, bpm, podcast, unplayed,
+                 comments, part_of_gapless_album, work, clean, explicit, sort_composer,
+                 music_video, grouping):
+        self._extra_attributes = None
+        self.track_id = track_id
+        self.size = size
+        self.total_time = total_time
+        self.date_modified = date_modified
+        self.date_added = date_added
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.play_count = play_count
+        self.play_date = play_date
+        self.play_date_utc = play_date_utc
+        self.skip_count = skip_count
+        self.skip_date = skip_date
+        self.rating = rating
+        self.album_rating = album_rating
+        self.persistent_id = persistent_id
+        self.track_type = track_type
+        self.file_folder_count = file_folder_count
+        self.library_folder_count = library_folder_count
+        self.name = name
+        self.artist = artist
+        self.kind = kind
+        self.location = location
+        self.album = album
+
+        self.genre = genre
+        self.year = year
+        self.release_date = release_date
+        self.artwork_count = artwork_count
+        self.sort_artist = sort_artist
+        self.sort_name = sort_name
+        self.content_rating = content_rating
+        self.purchased = purchased
+        self.has_video = has_video
+        self.hd = hd
+        self.movie = movie
+        self.album_artist = album_artist
+        self.composer = composer
+        self.disc_number = disc_number
+        self.disc_count = disc_count
+        self.track_number = track_number
+        self.track_count = track_count
+        self.normalization = normalization
+        self.sort_album = sort_album
+        self.loved = loved
+        self.compilation = compilation
+        self.sort_album_artist = sort_album_artist
+        self.series = series
+        self.episode_order = episode_order
+        self.tv_show = tv_show
+        self.protected = protected
+        self.video_width = video_width
+        self.video_height = video_height
+        self.season = season
+        self.bpm = bpm
+        self.podcast = podcast
+        self.unplayed = unplayed
+        self.comments = comments
+        self.part_of_gapless_album = part_of_gapless_album
+        self.work = work
+        self.clean = clean
+        self.explicit = explicit
+        self.sort_composer = sort_composer
+        self.music_video = music_video
+        self.grouping = grouping
+        if self.location:
+            self.location = urllib.request.unquote(self.location)
+
+    def __reduce__(self):
+        # the constructor unquotes location, so it is restored separately
+        values = [getattr(self, name) for name in TRACK_FIELD_NAMES]
+        values[_TRACK_LOCATION_INDEX] = None
+        return _restore_track, (tuple(values), self.location, self._extra_attributes)
+
+    @property
+    def extra_attributes(self):
+        """Attributes found in the XML without a dedicated Track attribute"""
+        if self._extra_attributes is None:
+            self._extra_attributes = {}
+        return self._extra_attributes
+
+    def add_extra_attribute(self, key, value):
+        self.extra_attributes[key] = value
+
+    def add_extra_attributes(self, attributes):
+        for key, value in attributes.items():
+            self.extra_attributes[key] = value
+
+    def get_as_dict(self):
+        track_dict = {}
+
+        for key in TRACK_FIELD_NAMES:
+            value = getattr(self, key)
+            if value is not None:
+                track_dict[key] = value
+
+        if self._extra_attributes:
+            for key, value in self._extra_attributes.items():
+                track_dict[key] = value
+
+        return track_dict
+
+
+_TRACK_LOCATION_INDEX = TRACK_FIELD_NAMES.index('location')
+
+
+def _restore_track(values, location, extra_attributes):
+    """Unpickles a Track"""
+    track = Track(*values)
+    track.location = location
+    track._extra_attributes = extra_attributes
+    return track
+
+
+def elem_playlist_persistent_id(elem):
+    """Returns the Playlist Persistent ID of a playlist <dict> element"""
+    children = iter(elem)
+    for key_elem, value_elem in zip(children, children):
+        if key_elem.text == "Playlist Persistent ID":
+            return value_elem.text
+    return None
+
+
+_XML_ENCODING_RE = re.compile(br'<\?xml[^>]*encoding=["\']([^"\']+)["\']')
+_TRACK_BLOCK_START_RE = re.compile(br'\s*<key>[^<]*</key>\s*<dict\s*(/?)>')
+_DICT_START_RE = re.compile(br'\s*<dict>')
+_DICT_END_RE = re.compile(br'\s*</dict>')
+
+
+def scan_track_blocks(data):
+    """Locates the track dicts of a library XML file held in memory as bytes
+
+    Returns (start, end, blocks) where start:end is the byte range of the whole
+    Tracks <dict> element and blocks the (start, end) ranges of the content of
+    each track <dict>. Returns None when the file is not laid out as iTunes
+    writes it (UTF-8, no nested dicts in tracks), callers then use the XML parser.
+    """
+    match = _XML_ENCODING_RE.match(data)
+    if match is not None and match.group(1).lower() not in (b'utf-8', b'utf8'):
+        return None
+    pos = data.find(b'<key>Tracks</key>')
+    if pos < 0:
+        return None
+    pos += len(b'<key>Tracks</key>')
+    match = _DICT_START_RE.match(data, pos)
+    if match is None:
+        return None
+    start = match.start() + len(match.group(0)) - len(match.group(0).lstrip())
+    pos = match.end()
+    blocks = []
+    match_block = _TRACK_BLOCK_START_RE.match
+    while True:
+        match = match_block(data, pos)
+        if match is None:
+            break
+        pos = match.end()
+        if match.group(1):
+            # empty <dict/>
+            blocks.append((pos, pos))
+            continue
+        block_end = data.find(b'</dict>', pos)
+        if block_end < 0:
+            return None
+        blocks.append((pos, block_end))
+        pos = block_end + len(b'</dict>')
+    match = _DICT_END_RE.match(data, pos)
+    if match is None:
+        return None
+    for block_start, block_end in blocks:
+        if data.find(b'<dict', block_start, block_end) >= 0:
+            return None
+    return start, match.end(), blocks
+
+
+def iter_raw_library_items(data, layout):
+    """Like iter_library_items, for a file in memory laid out as found by scan_track_blocks
+
+    Tracks are yielded as ('track_block', bytes) with the content of their <dict>.
+    """
+    start, end, blocks = layout
+    for block_start, block_end in blocks:
+        yield 'track_block', data[block_start:block_end]
+    rest = io.BytesIO(data[:start] + b'<dict></dict>' + data[end:])
+    for item in iter_library_items(rest):
+        yield item
+
+
+_TRACK_CHANGE_RE = re.compile(br'<key>(' + b'|'.join(re.escape(key.encode('utf-8')) for key in
+                                                  TRACK_CHANGE_KEYS + ("Persistent ID",)) +
+                              br')</key>\s*<(\w+)\s*(?:/>|>([^<]*)</\2>)')
+
+
+def raw_track_change_stamp(block):
+    """Returns the Persistent ID and the TRACK_CHANGE_KEYS values of the bytes of a track <dict>"""
+    persistent_id = None
+    stamp = [None] * len(TRACK_CHANGE_KEYS)
+    for key, tag, text in _TRACK_CHANGE_RE.findall(block):
+        key = key.decode('utf-8')
+        text = text.decode('utf-8') if text else None
+        if key == "Persistent ID":
+            persistent_id = text
+            continue
+        decoder = PLIST_VALUE_DECODERS.get(tag.decode('ascii'), _decode_text)
+        stamp[_TRACK_CHANGE_SLOTS[key]] = decoder(text)
+    return persistent_id, tuple(stamp)
+
+
+_TRACK_CHANGE_SLOTS = dict((key, index) for index, key in enumerate(TRACK_CHANGE_KEYS))
+_TRACK_CHANGE_FIELDS = tuple(TRACK_FIELD_NAMES[TRACK_ATTRIBUTE_INDEX[key]] for key in TRACK_CHANGE_KEYS)
+
+
+def read_track_change_stamp(elem):
+    """Returns the Persistent ID and the TRACK_CHANGE_KEYS values of a track <dict> element"""
+    persistent_id = None
+    stamp = [None] * len(TRACK_CHANGE_KEYS)
+    slot_of = _TRACK_CHANGE_SLOTS.get
+    children = iter(elem)
+    for key_elem, value_elem in zip(children, children):
+        key = key_elem.text
+        if key == "Persistent ID":
+            persistent_id = value_elem.text
+            continue
+        slot = slot_of(key)
+        if slot is not None:
+            decoder = PLIST_VALUE_DECODERS.get(value_elem.tag, _decode_text)
+            stamp[slot] = decoder(value_elem.text)
+    return persistent_id, tuple(stamp)
+
+
+def track_change_stamp(track):
+    """Returns the TRACK_CHANGE_KEYS values of a Track"""
+    return tuple(getattr(track, name) for name in _TRACK_CHANGE_FIELDS)
+
+
+# a worker gets a few chunks so that a slow chunk does not leave the others idle
+_CHUNKS_PER_WORKER = 4
+_MIN_CHUNK_TRACKS = 256
+
+
+def _decode_track_chunk(chunk):
+    """Decodes the track dicts of a chunk cut by Library.parse_parallel, runs in a worker process"""
+    library = Library()
+    missing_attribute_tags = {}
+    tracks = []
+    for elem in ET.fromstring(chunk):
+        if elem.tag == 'dict':
+            tracks.append(library.read_track(elem, missing_attribute_tags))
+    return tracks, missing_attribute_tags
+
+
+# Library.parse / update call their progress callback every PROGRESS_INTERVAL tracks or playlists
+PROGRESS_INTERVAL = 1000
+
+
+class ParseStats(object):
+    """Timings and counters of the last Library.parse or Library.update
+
+    timings holds the seconds spent per phase: 'xml_load', 'tracks', 'playlists',
+    'display_paths', 'snapshot_load' and 'snapshot_save'. With streaming parses,
+    reading the XML is counted in the tracks and playlists phases.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.tracks = 0
+        self.playlists = 0
+        self.memberships = 0
+        # key -> number of tracks or playlists having it
+        self.unknown_keys = {}
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def add_unknown_keys(self, keys):
+        for key, count in keys.items():
+            self.unknown_keys[key] = self.unknown_keys.get(key, 0) + count
+
+    def as_dict(self):
+        return {'timings': dict(self.timings), 'tracks': self.tracks, 'playlists': self.playlists,
+                'memberships': self.memberships, 'unknown_keys': dict(self.unknown_keys)}
+
+    def __repr__(self):
+        return "<ParseStats %d tracks, %d playlists, %d memberships, %d unknown keys, %s>" % (
+            self.tracks, self.playlists, self.memberships, len(self.unknown_keys),
+            ", ".join("%s %.3fs" % item for item in sorted(self.timings.items())))
+
+
+class LibraryChanges(object):
+    """Tracks (by Track ID) and playlists (by Playlist Persistent ID) changed by Library.update"""
+
+    def __init__(self):
+        self.added_tracks = []
+        self.removed_tracks = []
+        self.changed_tracks = []
+        self.added_playlists = []
+        self.removed_playlists = []
+        self.changed_playlists = []
+
+    def __bool__(self):
+        return bool(self.added_tracks or self.removed_tracks or self.changed_tracks or
+                    self.added_playlists or self.removed_playlists or self.changed_playlists)
+
+    def __repr__(self):
+        return "<LibraryChanges tracks +%d -%d ~%d, playlists +%d -%d ~%d>" % (
+            len(self.added_tracks), len(self.removed_tracks), len(self.changed_tracks),
+            len(self.added_playlists), len(self.removed_playlists), len(self.changed_playlists))
+
+
+class Library(object):
+
+    # attributes holding the parsed library, saved in snapshots
+    STATE_ATTRIBUTES = ('playlists', 'playlist_by_persistent_id', 'track_map', 'song_list', 'movie_list',
+                        'podcast_list', 'tvshow_list', 'audiobook_list', 'root_playlists',
+                        'playlist_by_display_path')
+
+    def __init__(self):
+        """Constructor"""
+        self.lib = 0
+        self.playlists = []
+        self.playlist_by_persistent_id = {}
+        self.track_map = {}
+        self.song_list = []
+        self.movie_list = []
+        self.podcast_list = []
+        self.tvshow_list = []
+        self.audiobook_list = []
+        # playlist folder tree, filled by generate_playlist_dislay_paths
+        self.root_playlists = []
+        self.playlist_by_display_path = {}
+        self._track_query = None
+        self._playlists_by_track = None
+        self._library_stats = None
+        self._search_index = None
+        self._track_paths = None
+        self.parse_stats = ParseStats()
+        # progress(phase, done, total) callback of the running parse, total is None when unknown
+        self._progress = None
+        self._progress_total = None
+        self._last_progress = None
+
+    @property
+    def tracks(self):
+        """Indexed queries over track_map, e.g. lib.tracks.where(artist='Muse', year__gte=2000)"""
+        if self._track_query is None:
+            from IReadiTunes.query import TrackQuery
+            self._track_query = TrackQuery(self)
+        return self._track_query
+
+    @property
+    def search_index(self):
+        """Token and trigram indexes of the track and playlist names, see search"""
+        if self._search_index is None:
+            from IReadiTunes.search import SearchIndex
+            self._search_index = SearchIndex(self)
+        return self._search_index
+
+    def search(self, query, limit=20, prefix=True, fuzzy=True):
+        """Returns the tracks best matching a text query on names, artists, albums, composers, groupings and comments
+
+        Case and accents are ignored, the last word may be the start of a word,
+        and misspelled words match when nothing else does, e.g. lib.search('beatls abbey ro').
+        """
+        track_map = self.track_map
+        return [track_map[track_id] for track_id, _ in self.search_index.search(query, limit, prefix, fuzzy)]
+
+    def search_playlists(self, query, limit=20, prefix=True, fuzzy=True):
+        """Returns the playlists whose name best matches a text query, as search does for tracks"""
+        return [playlist for playlist, _ in self.search_index.search_playlists(query, limit, prefix, fuzzy)]
+
+    @property
+    def stats(self):
+        """Aggregates over the tracks, e.g. lib.stats.group_by('genre', 'total_time')"""
+        if self._library_stats is None:
+            from IReadiTunes.stats import LibraryStats
+            self._library_stats = LibraryStats(self)
+        return self._library_stats
+
+    def parse(self, path_to_XML_file, streaming=False, cache_dir=None, workers=None, progress=None, lazy=False):
+        """Reads xml file and generate tracks list
+
+        With streaming=True the file is read with iterparse: tracks and playlists
+        are built as their elements close and the XML tree is never kept, so
+        peak memory follows the size of the decoded library instead of the DOM.
+
+        With workers > 1 the tracks are decoded by a pool of that many processes,
+        see parse_parallel.
+
+        With lazy=True the tracks keep the bytes of their XML and decode each
+        value when first read, see parse_lazy. It does not apply to snapshots,
+        which hold decoded tracks.
+
+        With a cache_dir, the parsed library is saved there and reloaded by later
+        calls as long as the XML file is unchanged (same size and mtime, or same
+        content hash). Snapshots are rebuilt automatically when the file changes.
+
+        Binary plists (bplist00) are detected and read with parse_binary,
+        streaming and workers do not apply to them.
+
+        progress, if given, is called as progress(phase, done, total) every
+        PROGRESS_INTERVAL tracks or playlists and at the end of each phase;
+        total is None when it is not known in advance. Timings and counters
+        of the parse are left in parse_stats.
+        """
+        self.parse_stats = ParseStats()
+        self._progress = progress
+        try:
+            if cache_dir is not None:
+                start = time.perf_counter()
+                state = snapshot_cache.load_snapshot(path_to_XML_file, cache_dir)
+                load_time = time.perf_counter() - start
+                if state is not None:
+                    self.set_state(state)
+                    self.parse_stats.tracks = len(self.track_map)
+                    self.parse_stats.playlists = len(self.playlists)
+                    self.parse_stats.memberships = sum(len(playlist.track_ids) for playlist in self.playlists)
+                    self.parse_stats.add_time('snapshot_load', load_time)
+                    return
+                fingerprint = snapshot_cache.file_fingerprint(path_to_XML_file)
+                self.parse(path_to_XML_file, streaming, workers=workers, progress=progress)
+                start = time.perf_counter()
+                snapshot_cache.save_snapshot(path_to_XML_file, cache_dir, self.get_state(), fingerprint)
+                self.parse_stats.add_time('snapshot_load', load_time)
+                self.parse_stats.add_time('snapshot_save', time.perf_counter() - start)
+                return
+            if isinstance(path_to_XML_file, (str, bytes, os.PathLike)):
+                from IReadiTunes.bplist import is_binary_plist
+                if is_binary_plist(path_to_XML_file):
+                    self.parse_binary(path_to_XML_file)
+                    return
+            if lazy:
+                self.parse_lazy(path_to_XML_file)
+                return
+            if workers is not None and workers > 1:
+                self.parse_parallel(path_to_XML_file, workers)
+                return
+            if streaming:
+                self.parse_streaming(path_to_XML_file)
+                return
+            start = time.perf_counter()
+            tree = ET.parse(path_to_XML_file)
+            self.lib = tree.getroot()
+            self.parse_stats.add_time('xml_load', time.perf_counter() - start)
+            self.read_tracks()
+            self.read_playlists()
+            self.generate_playlist_dislay_paths()
+        finally:
+            self._progress = None
+            self._progress_total = None
+            self._last_progress = None
+
+    def watch(self, path_to_XML_file, interval=1.0, debounce=2.0, use_inotify=None):
+        """Keeps the library up to date with the file in a background thread, returns the started watch.LibraryWatcher
+
+        The library should already be parsed from the file; an empty library is parsed first.
+        """
+        from IReadiTunes.watch import LibraryWatcher
+        if not self.track_map and not self.playlists:
+            self.parse(path_to_XML_file)
+        return LibraryWatcher(self, path_to_XML_file, interval, debounce, use_inotify).start()
+
+    def aparse(self, path_to_XML_file, progress=None, semaphore=None, **parse_options):
+        """Coroutine parsing the file in a worker thread, e.g. await lib.aparse(path), see aio.aparse"""
+        from IReadiTunes.aio import aparse
+        return aparse(self, path_to_XML_file, progress=progress, semaphore=semaphore, **parse_options)
+
+    def _report_progress(self, phase, done):
+        if self._progress is not None and self._last_progress != (phase, done):
+            self._last_progress = (phase, done)
+            self._progress(phase, done, self._progress_total)
+
+    def _end_section(self, phase, missing_attribute_tags, started):
+        """Records the time and the unknown keys of the tracks or playlists phase"""
+        self.parse_stats.add_time(phase, time.perf_counter() - started)
+        self.parse_stats.add_unknown_keys(missing_attribute_tags)
+        if len(missing_attribute_tags) > 0:
+            logger.info("%s: keys without attribute, kept in extra_attributes: %s",
+                        phase, ", ".join(sorted(missing_attribute_tags)))
+        self._report_progress(phase, self.parse_stats.tracks if phase == 'tracks' else self.parse_stats.playlists)
+        self._progress_total = None
+
+    def get_state(self):
+        """Returns the parsed library as a dict of STATE_ATTRIBUTES"""
+        # one copy of __dict__, so that a concurrent set_state is seen entirely or not at all
+        attributes = self.__dict__.copy()
+        return dict((name, attributes[name] if name in attributes else getattr(self, name))
+                    for name in self.STATE_ATTRIBUTES)
+
+    def set_state(self, state):
+        """Replaces the parsed library by a dict returned by get_state
+
+        All the attributes are swapped in one __dict__ update, so other
+        threads see either the old or the new library.
+        """
+        self.__dict__.update([(name, state[name]) for name in self.STATE_ATTRIBUTES])
+
+    def update(self, path_to_XML_file, progress=None):
+        """Re-reads xml file, only decoding the tracks and playlists that changed
+
+        Tracks are matched on Persistent ID and kept when their TRACK_CHANGE_KEYS
+        values are unchanged; those values are read straight from the bytes of
+        the file, only changed tracks go through the XML parser. Playlists are
+        matched on Playlist Persistent ID and kept when their XML content is
+        unchanged. The new track_map, lists and playlists replace the old ones
+        at the end, the old ones are not modified. Returns a LibraryChanges.
+        progress and parse_stats work as with parse.
+        """
+        changes = LibraryChanges()
+        old_tracks = dict((track.persistent_id, track) for track in self.track_map.values()
+                          if track.persistent_id is not None)
+        old_playlists = dict(self.playlist_by_persistent_id)
+        updated = Library()
+        updated._progress = progress
+        missing_attribute_tags = {}
+
+        started = time.perf_counter()
+        with open(path_to_XML_file, 'rb') as f:
+            data = f.read()
+        if data.startswith(b'bplist00'):
+            raise ValueError("update reads XML libraries, parse binary plists again with parse")
+        layout = scan_track_blocks(data)
+        if layout is None:
+            items = iter_library_items(io.BytesIO(data))
+        else:
+            items = iter_raw_library_items(data, layout)
+            updated._progress_total = len(layout[2])
+        updated.parse_stats.add_time('xml_load', time.perf_counter() - started)
+        started = time.perf_counter()
+
+        for kind, elem in items:
+            if kind == 'track' or kind == 'track_block':
+                if kind == 'track_block':
+                    # raw bytes of the track dict, only parsed when the track changed
+                    persistent_id, stamp = raw_track_change_stamp(elem)
+                else:
+                    persistent_id, stamp = read_track_change_stamp(elem)
+                old_track = old_tracks.pop(persistent_id, None)
+                if old_track is not None and track_change_stamp(old_track) == stamp:
+                    updated.add_track(old_track)
+                    continue
+                if kind == 'track_block':
+                    elem = ET.fromstring(b'<dict>' + elem + b'</dict>')
+                new_track = updated.read_track(elem, missing_attribute_tags)
+                if old_track is None:
+                    changes.added_tracks.append(new_track.track_id)
+                else:
+                    changes.changed_tracks.append(new_track.track_id)
+            elif kind == 'playlist':
+                signature = plist_element_signature(elem)
+                old_playlist = old_playlists.pop(elem_playlist_persistent_id(elem), None)
+                if old_playlist is not None and getattr(old_playlist, 'source_signature', None) == signature:
+                    # same members, looked up in the new track_map
+                    old_playlist = copy.copy(old_playlist)
+                    old_playlist._track_map = updated.track_map
+                    updated.add_playlist(old_playlist)
+                    continue
+                new_playlist = updated.read_playlist(elem, missing_attribute_tags)
+                if old_playlist is None:
+                    changes.added_playlists.append(new_playlist.playlist_persistent_id)
+                else:
+                    changes.changed_playlists.append(new_playlist.playlist_persistent_id)
+            else:
+                # end of the Tracks or Playlists section
+                updated._end_section(kind[len('end_'):], missing_attribute_tags, started)
+                missing_attribute_tags = {}
+                started = time.perf_counter()
+
+        changes.removed_tracks = [track.track_id for track in old_tracks.values()]
+        changes.removed_playlists = list(old_playlists)
+        updated.generate_playlist_dislay_paths()
+        self.set_state(updated.get_state())
+        self.parse_stats = updated.parse_stats
+        return changes
+
+    def parse_parallel(self, path_to_XML_file, workers):
+        """Reads xml file, decoding the tracks in a pool of worker processes
+
+        The Tracks dict is cut into chunks of whole track dicts, located with
+        scan_track_blocks, and each chunk is decoded by a worker. Chunks are
+        merged back in file order, so track_map and the per-kind lists are the
+        same as with a serial parse. Playlists are read afterwards in this
+        process. Files not laid out as iTunes writes them are parsed serially.
+        """
+        started = time.perf_counter()
+        with open(path_to_XML_file, 'rb') as f:
+            data = f.read()
+        layout = scan_track_blocks(data)
+        if layout is None:
+            self.parse_streaming(io.BytesIO(data))
+            return
+        start, end, blocks = layout
+        self.parse_stats.add_time('xml_load', time.perf_counter() - started)
+        started = time.perf_counter()
+        self._progress_total = len(blocks)
+
+        chunk_count = min(workers * _CHUNKS_PER_WORKER, max(1, len(blocks) // _MIN_CHUNK_TRACKS))
+        chunk_size = -(-len(blocks) // chunk_count) if blocks else 1
+        chunks = []
+        for first in range(0, len(blocks), chunk_size):
+            last = min(first + chunk_size, len(blocks)) - 1
+            # from the <dict> tag of the first track to the end tag of the last one, either may be an empty <dict/>
+            chunk_start = data.rfind(b'<dict', 0, blocks[first][0])
+            chunk_end = blocks[last][1]
+            if blocks[last][0] != chunk_end or not data.startswith(b'/>', chunk_end - 2):
+                chunk_end = data.find(b'</dict>', chunk_end) + len(b'</dict>')
+            chunks.append(b'<dict>' + data[chunk_start:chunk_end] + b'</dict>')
+
+        missing_attribute_tags = {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            for tracks, missing_tags in executor.map(_decode_track_chunk, chunks):
+                for track in tracks:
+                    self.add_track(track)
+                for key, count in missing_tags.items():
+                    missing_attribute_tags[key] = missing_attribute_tags.get(key, 0) + count
+        del chunks
+        self._end_section('tracks', missing_attribute_tags, started)
+
+        rest = data[:start] + b'<dict></dict>' + data[end:]
+        del data
+        self.parse_streaming(io.BytesIO(rest))
+
+    def parse_lazy(self, path_to_XML_file):
+        """Reads xml file, leaving the values of the tracks to be decoded when first read
+
+        Each track is a lazy.LazyTrack over the bytes of its dict, located with
+        scan_track_blocks; only the values sorting it into track_map and the
+        per-kind lists are decoded here. The file content stays in memory while
+        the tracks are referenced. Keys without attribute are not counted in
+        parse_stats. Tracks holding arrays or values without a decoder (e.g.
+        <real>) are read with read_track, which reports them as parse does.
+        Files not laid out as iTunes writes them are parsed with parse_streaming.
+        """
+        from IReadiTunes.lazy import LazyTrack, is_lazy_block
+        started = time.perf_counter()
+        with open(path_to_XML_file, 'rb') as f:
+            data = f.read()
+        layout = scan_track_blocks(data)
+        if layout is None:
+            self.parse_streaming(io.BytesIO(data))
+            return
+        start, end, blocks = layout
+        self.parse_stats.add_time('xml_load', time.perf_counter() - started)
+        started = time.perf_counter()
+        self._progress_total = len(blocks)
+
+        missing_attribute_tags = {}
+        for block_start, block_end in blocks:
+            if is_lazy_block(data, block_start, block_end):
+                self.add_track(LazyTrack(data, block_start, block_end))
+            else:
+                self.read_track(ET.fromstring(b'<dict>' + data[block_start:block_end] + b'</dict>'),
+                                missing_attribute_tags)
+        self._end_section('tracks', missing_attribute_tags, started)
+
+        self.parse_streaming(io.BytesIO(data[:start] + b'<dict></dict>' + data[end:]))
+
+    def parse_binary(self, path_to_file):
+        """Reads a binary plist library (bplist00)
+
+        Objects are decoded straight from the offset table of the file, with
+        no intermediate tree; track and playlist values go to the same Track
+        and PlayList attributes as with XML files. <data> values are kept as
+        base64 text without line breaks. Raises ValueError if the file is
+        truncated or its offsets or references are out of range.
+        """
+        from IReadiTunes.bplist import BinaryPlist
+        started = time.perf_counter()
+        with open(path_to_file, 'rb') as f:
+            plist = BinaryPlist(f.read())
+        try:
+            self._read_binary_plist(plist, started)
+        except (IndexError, struct.error, UnicodeDecodeError) as e:
+            raise ValueError("Binary plist %s cannot be decoded: %s" % (path_to_file, e))
+
+    def _read_binary_plist(self, plist, started):
+        sections = dict(plist.items(plist.top_object))
+        self.parse_stats.add_time('xml_load', time.perf_counter() - started)
+
+        started = time.perf_counter()
+        missing_attribute_tags = {}
+        tracks_ref = sections.get('Tracks')
+        if tracks_ref is not None:
+            track_refs = plist.refs(tracks_ref)[1]
+            self._progress_total = len(track_refs)
+            for track_ref in track_refs:
+                att_list, extra_attributes, _ = self.decode_binary_dict(plist, track_ref, TRACK_ATTRIBUTE_INDEX,
+                                                                         missing_attribute_tags)
+                new_track = Track(*att_list)
+                if len(extra_attributes) > 0:
+                    new_track.add_extra_attributes(extra_attributes)
+                self.add_track(new_track)
+        self._end_section('tracks', missing_attribute_tags, started)
+
+        started = time.perf_counter()
+        missing_attribute_tags = {}
+        playlists_ref = sections.get('Playlists')
+        if playlists_ref is not None:
+            playlist_refs = plist.refs(playlists_ref)
+            self._progress_total = len(playlist_refs)
+            for playlist_ref in playlist_refs:
+                att_list, extra_attributes, items_ref = self.decode_binary_dict(
+                    plist, playlist_ref, PLAYLIST_ATTRIBUTE_INDEX, missing_attribute_tags, "Playlist Items")
+                track_list = []
+                if items_ref is not None:
+                    for item_ref in plist.refs(items_ref):
+                        track_list.append(plist.value(item_ref)["Track ID"])
+                new_playlist = PlayList(*att_list)
+                new_playlist.set_track_indexes(self, track_list)
+                if len(extra_attributes) > 0:
+                    new_playlist.add_extra_attributes(extra_attributes)
+                new_playlist.source_signature = None
+                self.add_playlist(new_playlist)
+        self._end_section('playlists', missing_attribute_tags, started)
+        self.generate_playlist_dislay_paths()
+
+    def decode_binary_dict(self, plist, ref, attribute_index, missing_attribute_tags, items_key=None):
+        """Decodes a dict of a BinaryPlist like decode_plist_dict, returning the object reference of items_key"""
+        att_list = [None] * len(attribute_index)
+        extra_attributes = {}
+        items = None
+        slot_of = attribute_index.get
+        value = plist.value
+        for key, value_ref in plist.items(ref):
+            if key == items_key:
+                items = value_ref
+                continue
+            tag_index = slot_of(key)
+            if tag_index is None:
+                missing_attribute_tags[key] = missing_attribute_tags.get(key, 0) + 1
+                extra_attributes[key] = value(value_ref)
+            else:
+                att_list[tag_index] = value(value_ref)
+        return att_list, extra_attributes, items
+
+    def parse_streaming(self, path_to_XML_file):
+        """Reads xml file incrementally, without building the whole element tree"""
+        missing_attribute_tags = {}
+        started = time.perf_counter()
+        for kind, elem in iter_library_items(path_to_XML_file):
+            if kind == 'track':
+                self.read_track(elem, missing_attribute_tags)
+            elif kind == 'playlist':
+                self.read_playlist(elem, missing_attribute_tags)
+            else:
+                # end of the Tracks or Playlists section
+                self._end_section(kind[len('end_'):], missing_attribute_tags, started)
+                missing_attribute_tags = {}
+                started = time.perf_counter()
+        self.generate_playlist_dislay_paths()
+
+    def playlists_for_track(self, track_id):
+        """Returns the playlists containing a track, from an index built on first use"""
+        playlists = self.playlists
+        cached = self._playlists_by_track
+        if cached is None or cached[0] is not playlists or cached[1] != len(playlists):
+            index = {}
+            for position, playlist in enumerate(playlists):
+                for member_id in playlist.track_id_set():
+                    positions = index.get(member_id)
+                    if positions is None:
+                        index[member_id] = array('i', (position,))
+                    else:
+                        positions.append(position)
+            cached = self._playlists_by_track = (playlists, len(playlists), index)
+        return [playlists[position] for position in cached[2].get(track_id, ())]
+
+    def smart_playlist(self, playlist):
+        """Returns the decoded rules of a playlist as a smart.SmartPlaylist, None if it is not a smart playlist"""
+        from IReadiTunes.smart import decode_smart_playlist
+        return decode_smart_playlist(playlist)
+
+    def evaluate_smart_playlist(self, playlist, now=None):
+        """Returns the Track IDs matching the rules of a smart playlist as an array, without changing it
+
+        now is the datetime "in the last" rules count from, the current UTC time by default;
+        a naive now is taken as UTC, like the dates of the tracks.
+        Raises ValueError if its blobs cannot be decoded or a rule uses a field
+        the evaluator does not know (see SmartPlaylist.supported).
+        """
+        from IReadiTunes.smart import SmartPlaylistEvaluator
+        smart_playlist = self.smart_playlist(playlist)
+        if smart_playlist is None:
+            raise ValueError("Playlist '%s' is not a smart playlist" % playlist.name)
+        if smart_playlist.error is not None:
+            raise ValueError("Smart playlist '%s' cannot be decoded: %s" % (playlist.name, smart_playlist.error))
+        if not smart_playlist.supported:
+            raise ValueError("Smart playlist '%s' has rules on fields that cannot be evaluated" % playlist.name)
+        return SmartPlaylistEvaluator(self, now).evaluate(smart_playlist, seed=playlist.playlist_persistent_id)
+
+    def refresh_smart_playlists(self, now=None):
+        """Recomputes the members of the live updating smart playlists, returns the Persistent IDs of those changed
+
+        Playlists whose rules use a field the evaluator does not know, or whose
+        blobs cannot be decoded, are left as they are. A smart playlist referring to another one is refreshed after it.
+        """
+        from IReadiTunes.smart import SmartPlaylistEvaluator, KIND_PLAYLIST
+        evaluator = SmartPlaylistEvaluator(self, now)
+        pending = {}
+        for playlist in self.playlists:
+            smart_playlist = self.smart_playlist(playlist)
+            if smart_playlist is not None and smart_playlist.live_update and smart_playlist.supported:
+                pending[playlist.playlist_persistent_id] = (playlist, smart_playlist)
+
+        changed = []
+
+        def refresh(persistent_id, visiting):
+            playlist, smart_playlist = pending.pop(persistent_id)
+            visiting.add(persistent_id)
+            for rule in smart_playlist.iter_rules():
+                if rule.kind == KIND_PLAYLIST and rule.value in pending and rule.value not in visiting:
+                    refresh(rule.value, visiting)
+            track_ids = evaluator.evaluate(smart_playlist, seed=persistent_id)
+            if track_ids != playlist.track_ids:
+                playlist.track_ids = track_ids
+                playlist._track_id_set = None
+                changed.append(persistent_id)
+
+        while pending:
+            refresh(next(iter(pending)), set())
+        if changed:
+            self._playlists_by_track = None
+        return changed
+
+    def track_paths(self, prefix_map=None):
+        """Returns {track_id: local path} of the tracks stored in local files, resolved once and cached
+
+        prefix_map rewrites path prefixes, e.g. [('/Users/me/Music', '/mnt/nas/Music')],
+        see files.location_to_path.
+        """
+        from IReadiTunes.files import resolve_track_paths
+        prefix_map = tuple(tuple(pair) for pair in prefix_map) if prefix_map else ()
+        cached = self._track_paths
+        if (cached is None or cached[0] is not self.track_map or cached[1] != len(self.track_map)
+                or cached[2] != prefix_map):
+            cached = self._track_paths = (self.track_map, len(self.track_map), prefix_map,
+                                          resolve_track_paths(self.track_map, prefix_map))
+        return cached[3]
+
+    def check_files(self, workers=16, prefix_map=None, check_mtime=True):
+        """Checks that the track files exist and match Size and Date Modified, returns a files.FileCheckReport
+
+        Files are stat'ed by a pool of workers threads.
+        """
+        from IReadiTunes.files import check_track_files
+        return check_track_files(self.track_map, self.track_paths(prefix_map), workers, check_mtime)
+
+    def find_duplicates(self, threshold=0.85, max_block_size=200):
+        """Returns the clusters of duplicate tracks as duplicates.DuplicateCluster, most confident first
+
+        Only tracks sharing a blocking key (Persistent ID, artist and name, name
+        and duration, file size) are compared, see duplicates.find_duplicates.
+        """
+        from IReadiTunes.duplicates import find_duplicates
+        return find_duplicates(self.track_map, threshold, max_block_size)
+
+    def export_tracks_jsonl(self, fp, fields=None):
+        """Writes one JSON object per track to a text file object, see export.export_tracks_jsonl"""
+        from IReadiTunes.export import export_tracks_jsonl
+        return export_tracks_jsonl(self, fp, fields)
+
+    def export_playlists_jsonl(self, fp, track_ref='track_id', add_distingished_kind_label=False):
+        """Writes one JSON object per playlist to a text file object, see export.export_playlists_jsonl"""
+        from IReadiTunes.export import export_playlists_jsonl
+        return export_playlists_jsonl(self, fp, track_ref, add_distingished_kind_label)
+
+    def export_m3u_tree(self, directory, extension='m3u8', extended=True, prefix_map=None, skip_master=True,
+                        remove_stale=True):
+        """Writes the playlists as M3U files under directory, in their folders, see export.export_m3u_tree
+
+        Playlists unchanged since the last export to directory are not written again.
+        """
+        from IReadiTunes.export import export_m3u_tree
+        return export_m3u_tree(self, directory, extension, extended, prefix_map, skip_master, remove_stale)
+
+    def export_csv(self, fp, fields=None):
+        """Writes one CSV row per track to a text file object, see export.export_csv"""
+        from IReadiTunes.export import export_csv
+        return export_csv(self, fp, fields)
+
+    def export_bplist(self, fp):
+        """Writes the library to a binary file object as a binary plist, read back by parse, see bplist.write_bplist"""
+        from IReadiTunes.bplist import write_bplist
+        return write_bplist(self, fp)
+
+    def export_sqlite(self, path):
+        """Writes the library to a SQLite database at path, see store.save_library and store.StoredLibrary"""
+        from IReadiTunes.store import save_library
+        return save_library(self, path)
+
+    def get_plist_attr_value(self, attr_name, attr):
+        decoder = PLIST_VALUE_DECODERS.get(attr.tag)
+        if decoder is not None:
+            return decoder(attr.text)
+        logger.warning("What to do for plist attribute '%s' of type '%s', value '%s'", attr_name, attr.tag, str(attr.text))
+        return attr.text
+
+    def decode_plist_dict(self, elem, attribute_index, missing_attribute_tags, items_key=None):
+        """Decodes a plist <dict> element
+
+        Returns the values ordered by attribute_index slots, a dict of the keys
+        not in attribute_index and the raw value element of items_key, if any.
+        """
+        att_list = [None] * len(attribute_index)
+        extra_attributes = {}
+        items = None
+        slot_of = attribute_index.get
+        decoder_of = PLIST_VALUE_DECODERS.get
+        children = iter(elem)
+        for key_elem, value_elem in zip(children, children):
+            key = key_elem.text
+            if key == items_key:
+                items = value_elem
+                continue
+            decoder = decoder_of(value_elem.tag)
+            if decoder is not None:
+                value = decoder(value_elem.text)
+            else:
+                value = self.get_plist_attr_value(key, value_elem)
+            tag_index = slot_of(key)
+            if tag_index is None:
+                missing_attribute_tags[key] = missing_attribute_tags.get(key, 0) + 1
+                extra_attributes[key] = value
+            else:
+                att_list[tag_index] = value
+        return att_list, extra_attributes, items
+
+    def read_playlists(self):
+        """Generate tracks list"""
+        missing_attribute_tags = {}
+        started = time.perf_counter()
+
+        """Creates playlists list"""
+        main_dict = self.lib.findall('dict')
+
+        sub_array = main_dict[0].findall('array')
+        sub_array_childrens = list(sub_array[0])
+
+        self._progress_total = len(sub_array_childrens)
+        for array in sub_array_childrens:
+            self.read_playlist(array, missing_attribute_tags)
+
+        self._end_section('playlists', missing_attribute_tags, started)
+
+    def read_playlist(self, array, missing_attribute_tags):
+        """Creates one playlist from its <dict> element and adds it to the library"""
+        att_list, extra_attributes, items = self.decode_plist_dict(array, PLAYLIST_ATTRIBUTE_INDEX,
+                                                                   missing_attribute_tags, "Playlist Items")
+
+        track_list = []
+        if items is not None and items.tag == "array":
+            for track_tags in items:
+                assert len(track_tags) == 2
+                assert track_tags[0].tag == 'key' and track_tags[0].text == "Track ID"
+                assert track_tags[1].tag == 'integer'
+                track_list.append(int(track_tags[1].text))
+        elif items is not None:
+            missing_attribute_tags["Playlist Items"] = missing_attribute_tags.get("Playlist Items", 0) + 1
+            extra_attributes["Playlist Items"] = self.get_plist_attr_value("Playlist Items", items)
+
+        new_playlist = PlayList(*att_list)
+        new_playlist.set_track_indexes(self, track_list)
+        if len(extra_attributes) > 0:
+            new_playlist.add_extra_attributes(extra_attributes)
+        new_playlist.source_signature = plist_element_signature(array)
+        self.add_playlist(new_playlist)
+        return new_playlist
+
+    def add_playlist(self, playlist):
+        """Appends a playlist to the library"""
+        stats = self.parse_stats
+        stats.playlists += 1
+        stats.memberships += len(playlist.track_ids)
+        if self._progress is not None and stats.playlists % PROGRESS_INTERVAL == 0:
+            self._report_progress('playlists', stats.playlists)
+        self.playlists.append(playlist)
+        self.playlist_by_persistent_id[playlist.playlist_persistent_id] = playlist
+
+    def generate_playlist_dislay_paths(self):
+        """Builds the playlist folder tree and sets the display_path of every playlist
+
+        Paths are computed top-down, each folder path once, and children reuse
+        the path of their parent. Playlists whose parent is missing (or which
+        sit in a parent loop) are placed at the root.
+        """
+        started = time.perf_counter()
+        def make_legal_filename(filename):
+            for char in "/\\:*?\"'<>|[]":
+                filename = filename.replace(char, '_')
+            filename = filename.strip(', _.')
+            return filename
+
+        for playlist in self.playlists:
+            playlist.parent = None
+            playlist.children = []
+            playlist.display_path = None
+        roots = []
+        for playlist in self.playlists:
+            parent = None
+            if playlist.parent_persistent_id:
+                parent = self.playlist_by_persistent_id.get(playlist.parent_persistent_id)
+            if parent is None:
+                roots.append(playlist)
+            else:
+                playlist.parent = parent
+                parent.children.append(playlist)
+
+        self.root_playlists = roots
+        self.playlist_by_display_path = {}
+        pending = [(playlist, '') for playlist in reversed(roots)]
+        next_orphan = 0
+        while True:
+            while pending:
+                playlist, folder_path = pending.pop()
+                legal_name = make_legal_filename(playlist.name)
+                playlist_name = legal_name
+                if playlist_name == 'Downloaded':
+                    if playlist.distinguished_kind == 65:
+                        playlist_name += "_music"
+                    elif playlist.distinguished_kind == 66:
+                        playlist_name += "_movies"
+                    elif playlist.distinguished_kind == 67:
+                        playlist_name += "_tv_shows"
+                    else:
+                        playlist_name += "_"+str(playlist.distinguished_kind)
+                playlist.display_path = folder_path + "/" + playlist_name
+                self.playlist_by_display_path.setdefault(playlist.display_path, playlist)
+
+                # children are under the plain name of their folder
+                child_folder_path = folder_path + "/" + legal_name
+                for child in reversed(playlist.children):
+                    pending.append((child, child_folder_path))
+
+            # anything left unvisited is part of a parent loop
+            while next_orphan < len(self.playlists) and self.playlists[next_orphan].display_path is not None:
+                next_orphan += 1
+            if next_orphan == len(self.playlists):
+                break
+            orphan = self.playlists[next_orphan]
+            orphan.parent.children.remove(orphan)
+            orphan.parent = None
+            roots.append(orphan)
+            pending.append((orphan, ''))
+        self.parse_stats.add_time('display_paths', time.perf_counter() - started)
+
+    def get_playlist_by_display_path(self, display_path):
+        """Returns the playlist with this display_path, e.g. '/Folder/Playlist', None if there is none"""
+        return self.playlist_by_display_path.get(display_path)
+
+    def iter_playlist_subtree(self, playlist=None):
+        """Yields a playlist (or its display_path) and everything under it, depth first
+
+        Without a playlist, yields the whole tree starting from root_playlists.
+        """
+        if isinstance(playlist, str):
+            playlist = self.playlist_by_display_path[playlist]
+        pending = [playlist] if playlist is not None else list(reversed(self.root_playlists))
+        while pending:
+            playlist = pending.pop()
+            yield playlist
+            pending.extend(reversed(playlist.children))
+
+    def get_playlists(self):
+        """Returns playlists list"""
+        return self.playlists
+
+    def get_song_list(self):
+        """Returns playlists list"""
+        return self.song_list
+
+    def get_movie_list(self):
+        """Returns playlists list"""
+        return self.movie_list
+
+    def get_podcast_list(self):
+        """Returns playlists list"""
+        return self.podcast_list
+
+    def get_tvshow_list(self):
+        """Returns playlists list"""
+        return self.tvshow_list
+
+    def get_audiobook_list(self):
+        """Returns playlists list"""
+        return self.audiobook_list
+
+
+    def read_tracks(self):
+        """Generate tracks list"""
+        missing_attribute_tags = {}
+        started = time.perf_counter()
+
+        # Create tracks list with attributes
+        main_dict = self.lib.findall('dict')
+
+        sub_array = main_dict[0].findall('dict')
+        sub_array_childrens = list(sub_array[0])
+
+        self._progress_total = len(sub_array_childrens) // 2
+        for track in sub_array_childrens:
+            if track.tag == "dict":
+                self.read_track(track, missing_attribute_tags)
+
+        self._end_section('tracks', missing_attribute_tags, started)
+
+    def read_track(self, track, missing_attribute_tags):
+        """Creates one track from its <dict> element and adds it to the library"""
+        att_list, extra_attributes, _ = self.decode_plist_dict(track, TRACK_ATTRIBUTE_INDEX, missing_attribute_tags)
+
+        new_track = Track(*att_list)
+        if len(extra_attributes) > 0:
+            new_track.add_extra_attributes(extra_attributes)
+
+        self.add_track(new_track)
+        return new_track
+
+    def add_track(self, new_track):
+        """Adds a track to track_map and to the list of its kind"""
+        stats = self.parse_stats
+        stats.tracks += 1
+        if self._progress is not None and stats.tracks % PROGRESS_INTERVAL == 0:
+            self._report_progress('tracks', stats.tracks)
+        self.track_map[new_track.track_id] = new_track
+        if new_track.location and new_track.location.find('/Audiobooks/') >= 0:
+            self.audiobook_list.append(new_track)
+        elif new_track.movie:
+            self.movie_list.append(new_track)
+        elif new_track.podcast:
+            self.podcast_list.append(new_track)
+        elif new_track.tv_show:
+            self.tvshow_list.append(new_track)
+        elif new_track.genre and new_track.location and new_track.genre == "Podcast" and new_track.location.lower().find('file://localhost/')<0:
+            self.podcast_list.append(new_track)
+        else:
+            self.song_list.append(new_track)
+
+
+def get_size(input_size):
+    if input_size is None:
+        return "unknown"
+    """Returns the size of a track in a human-readable way"""
+    return float("{0:.2f}".format(int(input_size) / 1E6))
+
+
+def get_total_time(input_time):
+    if input_time is None:
+        return 0
+    """Returns the duration of a track in a human-readable way"""
+    return int(int(input_time) / 1000)
+
+
+def get_rating(input_rating):
+    """ Returns stars iTunes rating"""
+    if input_rating:
+        return (int(input_rating) / 100) * 5
+    else:
+        return input_rating
+
+
+def get_track_path(input_url):
+    """Returns the path of a track"""
+    return unquote(urlparse(input_url).path[1:])
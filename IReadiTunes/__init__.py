@@ -9,10 +9,16 @@ MIT License
 
 from IReadiTunes.IReadiTunes import lib_init
 from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.IReadiTunes import LibraryChanges
+from IReadiTunes.IReadiTunes import ParseStats
 from IReadiTunes.IReadiTunes import get_size
 from IReadiTunes.IReadiTunes import get_total_time
 from IReadiTunes.IReadiTunes import get_rating
 from IReadiTunes.IReadiTunes import get_track_path
+from IReadiTunes.store import StoredLibrary
+from IReadiTunes.batch import load_libraries
+from IReadiTunes.diff import diff_libraries
+from IReadiTunes.diff import merge_libraries
 
 name          = "IReadiTunes"
 __author__    = "Mickael <mickael2054dev@gmail.com>"
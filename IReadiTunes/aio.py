@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio helpers: parsing libraries off the event loop, with progress and cancellation.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import asyncio
+import functools
+import threading
+import weakref
+
+from IReadiTunes.IReadiTunes import Library
+
+# parses running at once on an event loop, when aparse is not given a semaphore
+MAX_CONCURRENT_PARSES = 2
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+class ParseCancelled(Exception):
+    """Raised inside a parse whose aparse call was cancelled, to stop it at the next progress report"""
+
+
+def default_semaphore(loop=None):
+    """Returns the semaphore limiting the parses of an event loop to MAX_CONCURRENT_PARSES"""
+    if loop is None:
+        loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_PARSES)
+    return semaphore
+
+
+async def aparse(library, path, progress=None, semaphore=None, executor=None, streaming=True, **parse_options):
+    """Parses path into library in a worker thread without blocking the event loop
+
+    The file is parsed into a new Library by executor (the default thread
+    pool if None) and its state is swapped into library at the end, so library
+    is never seen half parsed and is left untouched on error or cancellation.
+    progress(phase, done, total) is called on the event loop. Cancelling the
+    awaiting task stops the parse at its next progress report, every
+    PROGRESS_INTERVAL tracks or playlists; the semaphore slot is released once
+    the worker has stopped. streaming defaults to True, so that the parse
+    reports progress (and can be cancelled) while the file is read.
+    """
+    loop = asyncio.get_running_loop()
+    if semaphore is None:
+        semaphore = default_semaphore(loop)
+    cancelled = threading.Event()
+
+    def report(phase, done, total):
+        if cancelled.is_set():
+            raise ParseCancelled()
+        if progress is not None:
+            loop.call_soon_threadsafe(progress, phase, done, total)
+
+    def run():
+        parsed = Library()
+        parsed.parse(path, streaming=streaming, progress=report, **parse_options)
+        return parsed
+
+    async with semaphore:
+        future = loop.run_in_executor(executor, run)
+        try:
+            parsed = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancelled.set()
+            try:
+                await future
+            except Exception:
+                pass
+            raise
+    library.set_state(parsed.get_state())
+    library.parse_stats = parsed.parse_stats
+    return library
+
+
+async def run_in_executor(function, *args, **kwargs):
+    """Runs function(*args, **kwargs) in the default executor of the running loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
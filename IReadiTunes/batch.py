@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Loading many library files at once, in a pool of processes.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import concurrent.futures
+
+from IReadiTunes.IReadiTunes import Library
+
+# track fields whose values repeat across tracks and libraries, shared between them after loading
+INTERNED_FIELDS = ('kind', 'genre', 'artist', 'album_artist', 'album', 'composer', 'sort_artist',
+                   'sort_album', 'sort_album_artist', 'sort_composer', 'track_type', 'content_rating',
+                   'series', 'tv_show', 'work', 'grouping')
+
+
+def _load_library_state(arguments):
+    path, parse_options = arguments
+    library = Library()
+    library.parse(path, **parse_options)
+    return library.get_state()
+
+
+def intern_track_strings(library, strings):
+    """Replaces equal INTERNED_FIELDS values of the tracks by one shared string object
+
+    strings is the dict of the strings already seen, shared by every library
+    given to this function.
+    """
+    share = strings.setdefault
+    for track in library.track_map.values():
+        for field in INTERNED_FIELDS:
+            value = getattr(track, field)
+            if value is not None:
+                setattr(track, field, share(value, value))
+
+
+def load_libraries(paths, workers=None, strings=None, **parse_options):
+    """Parses several library files with a pool of processes, returns the Library of each path in order
+
+    parse_options are passed to Library.parse, e.g. streaming=True or
+    cache_dir. Repeated strings (artists, albums, genres...) are shared
+    between all the returned libraries, and with the strings dict if given,
+    so that holding many libraries costs little more than their distinct values.
+    """
+    paths = list(paths)
+    if strings is None:
+        strings = {}
+    tasks = [(path, parse_options) for path in paths]
+    if workers == 1 or len(paths) <= 1:
+        states = map(_load_library_state, tasks)
+        executor = None
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        states = executor.map(_load_library_state, tasks)
+    libraries = []
+    try:
+        for state in states:
+            library = Library()
+            library.set_state(state)
+            intern_track_strings(library, strings)
+            libraries.append(library)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return libraries
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Binary property lists (bplist00): random access reader, and writing libraries as binary plists.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import base64
+import plistlib
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+from IReadiTunes.IReadiTunes import (TRACK_ATTRIBUTE_NAMES, TRACK_FIELD_NAMES, PLAYLIST_ATTRIBUTE_NAMES,
+                                     PLAYLIST_FIELD_NAMES)
+
+BPLIST_MAGIC = b'bplist00'
+
+# plist dates count seconds from 2001-01-01 UTC
+_PLIST_EPOCH = datetime(2001, 1, 1)
+
+# playlist attributes holding <data>, kept as base64 text once parsed
+PLAYLIST_DATA_FIELDS = ('smart_criteria', 'smart_info')
+
+_LOCATION_SAFE_CHARACTERS = "/:@!$&'()*+,;=~"
+
+_ARRAY_TYPECODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+def is_binary_plist(path):
+    """Returns True if the file at path starts like a binary plist"""
+    with open(path, 'rb') as f:
+        return f.read(len(BPLIST_MAGIC)) == BPLIST_MAGIC
+
+
+def _unpack_uints(data, start, count, size):
+    """Returns count big-endian unsigned integers of size bytes read from data at start"""
+    end = start + count * size
+    typecode = _ARRAY_TYPECODES.get(size)
+    if typecode is not None and array(typecode).itemsize == size:
+        values = array(typecode, data[start:end])
+        if sys.byteorder == 'little' and size > 1:
+            values.byteswap()
+        return values
+    return [int.from_bytes(data[position:position + size], 'big') for position in range(start, end, size)]
+
+
+class BinaryPlist(object):
+    """Reader of a bplist00 document, decoding objects from the offset table when they are asked for
+
+    Scalars are decoded once per object: strings shared between tracks (keys,
+    artists, albums, kinds...) come back as the same str object. data values
+    are returned as base64 text, and empty strings as None, as the XML parser does.
+    """
+
+    def __init__(self, data):
+        if data[:len(BPLIST_MAGIC)] != BPLIST_MAGIC or len(data) < len(BPLIST_MAGIC) + 32:
+            raise ValueError("Not a bplist00 document")
+        offset_size, ref_size, object_count, top_object, table_offset = struct.unpack('>6xBBQQQ', data[-32:])
+        if (not 0 < offset_size <= 8 or not 0 < ref_size <= 8 or top_object >= object_count
+                or table_offset < len(BPLIST_MAGIC) or table_offset + object_count * offset_size > len(data) - 32):
+            raise ValueError("Malformed bplist00 trailer")
+        self.data = data
+        self.ref_size = ref_size
+        self.top_object = top_object
+        self.table_offset = table_offset
+        self.offsets = _unpack_uints(data, table_offset, object_count, offset_size)
+        if max(self.offsets) >= table_offset:
+            raise ValueError("bplist00 object offset past the objects")
+        self._scalars = {}
+
+    def _length(self, position, info):
+        """Returns (length, position of the content) of the object at position"""
+        if info != 0xF:
+            return info, position + 1
+        size = 1 << (self.data[position + 1] & 0xF)
+        return int.from_bytes(self.data[position + 2:position + 2 + size], 'big'), position + 2 + size
+
+    def _content(self, start, size):
+        """Returns the size bytes of an object content at start, raises ValueError if they run past the objects"""
+        if start + size > self.table_offset:
+            raise ValueError("bplist00 object past the objects")
+        return self.data[start:start + size]
+
+    def kind(self, ref):
+        """Returns 'dict', 'array' or 'scalar' for an object"""
+        kind = self.data[self.offsets[ref]] >> 4
+        if kind == 0xD:
+            return 'dict'
+        if kind == 0xA or kind == 0xC:
+            return 'array'
+        return 'scalar'
+
+    def refs(self, ref):
+        """Returns the object references of an array, or (key refs, value refs) of a dict"""
+        position = self.offsets[ref]
+        marker = self.data[position]
+        count, start = self._length(position, marker & 0xF)
+        if marker >> 4 == 0xD:
+            self._content(start, 2 * count * self.ref_size)
+            refs = _unpack_uints(self.data, start, 2 * count, self.ref_size)
+            return refs[:count], refs[count:]
+        self._content(start, count * self.ref_size)
+        return _unpack_uints(self.data, start, count, self.ref_size)
+
+    def items(self, ref):
+        """Yields (key, value ref) of a dict"""
+        key_refs, value_refs = self.refs(ref)
+        value = self.value
+        for key_ref, value_ref in zip(key_refs, value_refs):
+            yield value(key_ref), value_ref
+
+    def value(self, ref):
+        """Returns the decoded object, dicts and arrays included"""
+        scalars = self._scalars
+        if ref in scalars:
+            return scalars[ref]
+        data = self.data
+        position = self.offsets[ref]
+        marker = data[position]
+        kind = marker >> 4
+        info = marker & 0xF
+        if kind == 0x5:
+            length, start = self._length(position, info)
+            value = self._content(start, length).decode('ascii')
+        elif kind == 0x6:
+            length, start = self._length(position, info)
+            value = self._content(start, 2 * length).decode('utf-16-be')
+        elif kind == 0x1:
+            size = 1 << info
+            value = int.from_bytes(data[position + 1:position + 1 + size], 'big', signed=size >= 8)
+        elif kind == 0x0:
+            if info == 0x8:
+                value = False
+            elif info == 0x9:
+                value = True
+            else:
+                value = None
+        elif kind == 0x3:
+            value = _PLIST_EPOCH + timedelta(seconds=struct.unpack('>d', data[position + 1:position + 9])[0])
+        elif kind == 0x2:
+            value = struct.unpack('>d' if info == 3 else '>f', data[position + 1:position + 1 + (1 << info)])[0]
+        elif kind == 0x4:
+            length, start = self._length(position, info)
+            value = base64.b64encode(self._content(start, length)).decode('ascii')
+        elif kind == 0x8:
+            value = int.from_bytes(data[position + 1:position + 2 + info], 'big')
+        elif kind == 0xA or kind == 0xC:
+            return [self.value(item) for item in self.refs(ref)]
+        elif kind == 0xD:
+            return dict((key, self.value(value_ref)) for key, value_ref in self.items(ref))
+        else:
+            raise ValueError("Unknown bplist object marker 0x%02x" % marker)
+        if value == '':
+            # empty <string/> and <data/> have no text in the XML parser
+            value = None
+        scalars[ref] = value
+        return value
+
+
+def _data_value(text):
+    if text is None:
+        return None
+    return base64.b64decode(''.join(text.split()))
+
+
+def library_to_plist(library):
+    """Returns the plist dict of a parsed library, with the keys of the XML file
+
+    Only what Library keeps is written: tracks and playlists with their extra
+    attributes, not the header of the original file (versions, music folder).
+    """
+    tracks = {}
+    for track_id, track in library.track_map.items():
+        track_dict = {}
+        for key, field in zip(TRACK_ATTRIBUTE_NAMES, TRACK_FIELD_NAMES):
+            value = getattr(track, field)
+            if value is not None:
+                track_dict[key] = value
+        if track.location:
+            # Track unquotes Location, it is read back through the same unquote
+            track_dict['Location'] = quote(track.location, safe=_LOCATION_SAFE_CHARACTERS)
+        if track._extra_attributes:
+            track_dict.update(track._extra_attributes)
+        tracks[str(track_id)] = track_dict
+
+    playlists = []
+    for playlist in library.playlists:
+        playlist_dict = {}
+        for key, field in zip(PLAYLIST_ATTRIBUTE_NAMES, PLAYLIST_FIELD_NAMES):
+            value = getattr(playlist, field)
+            if value is not None:
+                playlist_dict[key] = _data_value(value) if field in PLAYLIST_DATA_FIELDS else value
+        playlist_dict.update(playlist.extra_attributes)
+        if playlist.track_ids:
+            playlist_dict['Playlist Items'] = [{'Track ID': track_id} for track_id in playlist.track_ids]
+        playlists.append(playlist_dict)
+    return {'Tracks': tracks, 'Playlists': playlists}
+
+
+def write_bplist(library, fp):
+    """Writes a parsed library to a binary file object as a bplist00 document"""
+    plistlib.dump(library_to_plist(library), fp, fmt=plistlib.FMT_BINARY, sort_keys=False)
+
+
+def xml_to_bplist(xml_path, bplist_path):
+    """Converts an XML library file to a binary plist, keeping every key of the file"""
+    with open(xml_path, 'rb') as f:
+        document = plistlib.load(f, fmt=plistlib.FMT_XML)
+    with open(bplist_path, 'wb') as f:
+        plistlib.dump(document, f, fmt=plistlib.FMT_BINARY, sort_keys=False)
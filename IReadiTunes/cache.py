@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk snapshots of parsed libraries, so an unchanged XML file is not parsed twice.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import gc
+import hashlib
+import os
+import pickle
+import tempfile
+
+# bump when the pickled Library state changes shape
+SNAPSHOT_FORMAT_VERSION = 3
+
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_fingerprint(path, with_hash=True):
+    """Returns a dict identifying the content of a file: size, mtime and sha1"""
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        fingerprint['sha1'] = file_hash(path)
+    return fingerprint
+
+
+def file_hash(path):
+    """Returns the sha1 hex digest of a file, read by chunks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_path(source_path, cache_dir):
+    """Returns the snapshot file used for source_path inside cache_dir"""
+    source_path = os.path.abspath(source_path)
+    name = hashlib.sha1(source_path.encode('utf-8', 'surrogateescape')).hexdigest()[:20]
+    return os.path.join(cache_dir, name + '.snapshot')
+
+
+def read_snapshot_header(path):
+    """Returns the header of a snapshot file, None if it is missing or unreadable"""
+    try:
+        with open(path, 'rb') as f:
+            header = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError, TypeError):
+        return None
+    if not isinstance(header, dict) or header.get('version') != SNAPSHOT_FORMAT_VERSION:
+        return None
+    return header
+
+
+def load_snapshot(source_path, cache_dir):
+    """Returns the library state saved for source_path, None if there is no up-to-date snapshot
+
+    Size and mtime are compared first; the file is only hashed when they differ,
+    so a touched but unchanged file still reuses its snapshot.
+    """
+    path = snapshot_path(source_path, cache_dir)
+    header = read_snapshot_header(path)
+    if header is None or header.get('source') != os.path.abspath(source_path):
+        return None
+
+    current = file_fingerprint(source_path, with_hash=False)
+    stat_matches = current['size'] == header['size'] and current['mtime_ns'] == header['mtime_ns']
+    if not stat_matches:
+        if current['size'] != header['size'] or file_hash(source_path) != header['sha1']:
+            return None
+
+    # unpickling is one burst of long-lived allocations, collecting during it is wasted work
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path, 'rb') as f:
+            pickle.load(f)
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError, TypeError):
+        return None
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    if not stat_matches:
+        # same content under a new mtime, refresh the header for the next start
+        header.update(current)
+        write_snapshot(path, header, state)
+    return state
+
+
+def save_snapshot(source_path, cache_dir, state, fingerprint=None):
+    """Saves the library state of source_path in cache_dir
+
+    fingerprint should be taken before source_path is parsed, so that a file
+    rewritten during the parse is detected on the next load.
+    """
+    if fingerprint is None:
+        fingerprint = file_fingerprint(source_path)
+    header = dict(fingerprint)
+    header['version'] = SNAPSHOT_FORMAT_VERSION
+    header['source'] = os.path.abspath(source_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_snapshot(snapshot_path(source_path, cache_dir), header, state)
+
+
+def write_snapshot(path, header, state):
+    """Writes header and state to path atomically"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Matching tracks and playlists between two libraries, to compare or merge them.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import copy
+from array import array
+from collections import deque
+
+from IReadiTunes.IReadiTunes import Library, LibraryChanges
+
+# fields compared to tell whether a matched track changed; the IDs, location and
+# folder counts are specific to each library and not compared
+DIFF_FIELDS = ('name', 'artist', 'album_artist', 'album', 'composer', 'genre', 'year', 'disc_number',
+               'disc_count', 'track_number', 'track_count', 'total_time', 'size', 'bitrate', 'sample_rate',
+               'kind', 'rating', 'album_rating', 'loved', 'play_count', 'play_date_utc', 'skip_count',
+               'skip_date', 'comments', 'grouping', 'work', 'bpm', 'compilation')
+
+# playlist attributes compared, besides the members
+PLAYLIST_DIFF_FIELDS = ('name', 'description', 'folder', 'parent_persistent_id', 'smart_criteria', 'smart_info')
+
+
+def _fold(value):
+    if isinstance(value, str):
+        return value.casefold()
+    return value
+
+
+def track_fingerprint(track):
+    """Returns a key equal for copies of a song in different libraries: names, numbers and duration in seconds"""
+    total_time = track.total_time // 1000 if track.total_time is not None else None
+    return (_fold(track.name), _fold(track.artist), _fold(track.album), track.disc_number,
+            track.track_number, total_time)
+
+
+class LibraryDiff(LibraryChanges):
+    """Differences from an old library to a new one, see diff_libraries
+
+    Tracks are listed by Track ID: added_tracks and changed_tracks hold IDs of
+    the new library, removed_tracks IDs of the old one. Playlists are listed
+    by Playlist Persistent ID in the same way.
+    """
+
+    def __init__(self):
+        LibraryChanges.__init__(self)
+        # old Track ID -> new Track ID, for every matched track
+        self.matched_tracks = {}
+        # how many of them were matched by track_fingerprint instead of Persistent ID
+        self.fingerprint_matches = 0
+        # new Track ID -> DIFF_FIELDS that differ
+        self.changed_fields = {}
+        # old Playlist Persistent ID -> new one
+        self.matched_playlists = {}
+
+
+def match_tracks(old, new):
+    """Returns ({old Track ID: new Track ID}, number of fingerprint matches)
+
+    Tracks are matched by Persistent ID first, then the remaining ones by
+    track_fingerprint; duplicates of a fingerprint are paired in library order.
+    """
+    new_by_persistent_id = {}
+    for track in new.track_map.values():
+        if track.persistent_id is not None:
+            new_by_persistent_id[track.persistent_id] = track.track_id
+
+    matched = {}
+    used = set()
+    unmatched_old = []
+    for track in old.track_map.values():
+        new_id = new_by_persistent_id.get(track.persistent_id) if track.persistent_id is not None else None
+        if new_id is not None and new_id not in used:
+            matched[track.track_id] = new_id
+            used.add(new_id)
+        else:
+            unmatched_old.append(track)
+
+    fingerprint_matches = 0
+    if unmatched_old:
+        candidates = {}
+        for track in new.track_map.values():
+            if track.track_id not in used:
+                candidates.setdefault(track_fingerprint(track), deque()).append(track.track_id)
+        for track in unmatched_old:
+            queue = candidates.get(track_fingerprint(track))
+            if queue:
+                matched[track.track_id] = queue.popleft()
+                fingerprint_matches += 1
+    return matched, fingerprint_matches
+
+
+def _match_playlists(old, new):
+    matched = {}
+    used = set()
+    for playlist in old.playlists:
+        counterpart = new.playlist_by_persistent_id.get(playlist.playlist_persistent_id)
+        if counterpart is None and playlist.display_path is not None:
+            counterpart = new.playlist_by_display_path.get(playlist.display_path)
+        if counterpart is not None and id(counterpart) not in used:
+            used.add(id(counterpart))
+            matched[playlist.playlist_persistent_id] = counterpart
+    return matched
+
+
+def diff_libraries(old, new, fields=DIFF_FIELDS):
+    """Returns the LibraryDiff of two parsed libraries
+
+    Tracks are matched with match_tracks and compared on fields. Playlists
+    are matched by Persistent ID, then by display_path, and changed when an
+    attribute of PLAYLIST_DIFF_FIELDS or their (matched) members differ.
+    """
+    diff = LibraryDiff()
+    matched, diff.fingerprint_matches = match_tracks(old, new)
+    diff.matched_tracks = matched
+    new_track_map = new.track_map
+    for track in old.track_map.values():
+        new_id = matched.get(track.track_id)
+        if new_id is None:
+            diff.removed_tracks.append(track.track_id)
+            continue
+        new_track = new_track_map[new_id]
+        changed = [field for field in fields if getattr(track, field) != getattr(new_track, field)]
+        if changed:
+            diff.changed_tracks.append(new_id)
+            diff.changed_fields[new_id] = changed
+    matched_new = set(matched.values())
+    diff.added_tracks = [track_id for track_id in new_track_map if track_id not in matched_new]
+
+    playlists = _match_playlists(old, new)
+    for playlist in old.playlists:
+        counterpart = playlists.get(playlist.playlist_persistent_id)
+        if counterpart is None:
+            diff.removed_playlists.append(playlist.playlist_persistent_id)
+            continue
+        diff.matched_playlists[playlist.playlist_persistent_id] = counterpart.playlist_persistent_id
+        members = [matched.get(track_id) for track_id in playlist.track_ids]
+        if (members != list(counterpart.track_ids) or
+                any(getattr(playlist, field) != getattr(counterpart, field) for field in PLAYLIST_DIFF_FIELDS)):
+            diff.changed_playlists.append(counterpart.playlist_persistent_id)
+    matched_playlists = set(id(playlist) for playlist in playlists.values())
+    diff.added_playlists = [playlist.playlist_persistent_id for playlist in new.playlists
+                            if id(playlist) not in matched_playlists]
+    return diff
+
+
+def merge_libraries(base, *others):
+    """Returns a new Library with the tracks and playlists of base, plus those of others missing from it
+
+    Tracks of others are matched against the merged library with match_tracks;
+    unmatched ones are added under new Track IDs. Playlists found in both
+    (by Persistent ID or display_path) get the members they lack appended,
+    other playlists are added with their members mapped to the merged tracks,
+    under the merged counterpart of their folder. The given libraries are not modified.
+    """
+    merged = Library()
+    for track in base.track_map.values():
+        merged.add_track(copy.copy(track))
+    for playlist in base.playlists:
+        _add_playlist_copy(merged, playlist, None, playlist.parent_persistent_id)
+
+    for other in others:
+        # display paths of the merged playlists, to match those of other
+        merged.generate_playlist_dislay_paths()
+        matched, _ = match_tracks(other, merged)
+        next_id = max(merged.track_map) + 1 if merged.track_map else 1
+        for track in other.track_map.values():
+            if track.track_id not in matched:
+                new_track = copy.copy(track)
+                new_track.track_id = next_id
+                matched[track.track_id] = next_id
+                next_id += 1
+                merged.add_track(new_track)
+
+        counterparts = _match_playlists(other, merged)
+        for playlist in other.playlists:
+            counterpart = counterparts.get(playlist.playlist_persistent_id)
+            if counterpart is None:
+                # the folder may have been matched by display_path, under another Persistent ID
+                parent = counterparts.get(playlist.parent_persistent_id)
+                _add_playlist_copy(merged, playlist, matched, playlist.parent_persistent_id if parent is None
+                                   else parent.playlist_persistent_id)
+                continue
+            members = set(counterpart.track_ids)
+            for track_id in playlist.track_ids:
+                new_id = matched[track_id]
+                if new_id not in members:
+                    members.add(new_id)
+                    counterpart.track_ids.append(new_id)
+            counterpart._track_id_set = None
+    merged.generate_playlist_dislay_paths()
+    return merged
+
+
+def _add_playlist_copy(library, playlist, track_id_map, parent_persistent_id):
+    new_playlist = copy.copy(playlist)
+    new_playlist.parent_persistent_id = parent_persistent_id
+    new_playlist.extra_attributes = dict(playlist.extra_attributes)
+    if track_id_map is None:
+        new_playlist.track_ids = array('i', playlist.track_ids)
+    else:
+        new_playlist.track_ids = array('i', [track_id_map[track_id] for track_id in playlist.track_ids])
+    new_playlist._track_map = library.track_map
+    new_playlist._track_id_set = None
+    new_playlist.parent = None
+    new_playlist.children = []
+    library.add_playlist(new_playlist)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Duplicate tracks: candidates grouped by blocking keys, pairs scored inside their blocks, clusters.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import gc
+import logging
+
+from IReadiTunes.search import tokenize
+
+logger = logging.getLogger(__name__)
+
+# width of the Total Time buckets, in ms; a track is put in two overlapping
+# buckets, so two durations less than half a bucket apart share one
+TIME_BUCKET = 4000
+
+# names need this many words to be blocked with the duration only
+NAME_TIME_MIN_WORDS = 2
+
+# blocks holding more tracks are skipped (e.g. thousands of "Track 01"): their
+# pairs are too many to score and too unlikely to be duplicates
+MAX_BLOCK_SIZE = 200
+
+# pairs scoring at least this much are duplicates
+DEFAULT_THRESHOLD = 0.85
+
+# weight of each similarity in the score of a pair
+NAME_WEIGHT = 0.4
+ARTIST_WEIGHT = 0.25
+TIME_WEIGHT = 0.25
+ALBUM_WEIGHT = 0.1
+
+# score of the same file (Size and Total Time equal, or same Location)
+SAME_FILE_SCORE = 0.95
+
+
+def _words(text, cache):
+    """Returns the normalized text and the frozenset of its words, shared by equal texts"""
+    words = cache.get(text)
+    if words is None:
+        tokens = tokenize(text)
+        words = cache[text] = (' '.join(tokens), frozenset(tokens)) if tokens else (None, None)
+    return words
+
+
+def _similarity(a, b):
+    """Returns 1 for equal sets of words, their Jaccard index otherwise, 0.5 if one is missing"""
+    if a is None or b is None:
+        return 0.5
+    if a is b or a == b:
+        return 1.0
+    return len(a & b) / float(len(a | b))
+
+
+def _time_similarity(a, b):
+    if a is None or b is None:
+        return 0.5
+    difference = abs(a - b)
+    if difference <= 1000:
+        return 1.0
+    if difference <= 3000:
+        return 0.8
+    if difference <= 10000:
+        return 0.3
+    return 0.0
+
+
+class _TrackKey(object):
+    """Normalized values of a track compared by score_pair"""
+    __slots__ = ('track', 'name', 'artist', 'name_words', 'artist_words', 'album_words')
+
+    def __init__(self, track, cache):
+        self.track = track
+        self.name, self.name_words = _words(track.name, cache)
+        self.artist, self.artist_words = _words(track.artist or track.album_artist, cache)
+        self.album_words = _words(track.album, cache)[1]
+
+
+def blocking_keys(key):
+    """Yields the blocks of a track: Persistent ID, artist and name, name and duration, file size
+
+    Names of a single word ("Intro", "Untitled") are too common to block on
+    with the duration alone, those tracks are only compared to the tracks of
+    the same artist.
+    """
+    track = key.track
+    if track.persistent_id is not None:
+        yield ('persistent_id', track.persistent_id)
+    if key.name:
+        if key.artist:
+            yield ('artist_name', key.artist, key.name)
+        if track.total_time is not None and len(key.name_words) >= NAME_TIME_MIN_WORDS:
+            yield ('name_time', key.name, track.total_time // TIME_BUCKET)
+            yield ('name_time_shifted', key.name, (track.total_time + TIME_BUCKET // 2) // TIME_BUCKET)
+    if track.size:
+        yield ('size', track.size)
+
+
+def score_pair(a, b):
+    """Returns the confidence, from 0 to 1, that two _TrackKey are the same song"""
+    track_a = a.track
+    track_b = b.track
+    if track_a.persistent_id is not None and track_a.persistent_id == track_b.persistent_id:
+        return 1.0
+    score = (NAME_WEIGHT * _similarity(a.name_words, b.name_words) +
+             ARTIST_WEIGHT * _similarity(a.artist_words, b.artist_words) +
+             TIME_WEIGHT * _time_similarity(track_a.total_time, track_b.total_time) +
+             ALBUM_WEIGHT * _similarity(a.album_words, b.album_words))
+    if ((track_a.location and track_a.location == track_b.location) or
+            (track_a.size and track_a.size == track_b.size and track_a.total_time == track_b.total_time)):
+        score = max(score, SAME_FILE_SCORE)
+    return score
+
+
+class DuplicateCluster(object):
+    """Tracks found to be copies of one song
+
+    confidence is the score of the weakest pair linking the cluster together.
+    pairs maps (Track ID, Track ID) to the score of each linking pair.
+    """
+
+    def __init__(self, track_ids, confidence, pairs):
+        self.track_ids = track_ids
+        self.confidence = confidence
+        self.pairs = pairs
+
+    def best(self, track_map):
+        """Returns the Track ID to keep: highest bit rate, then most played, then added first"""
+        def preference(track_id):
+            track = track_map[track_id]
+            date_added = track.date_added.timestamp() if track.date_added is not None else 0
+            return (track.bitrate or 0, track.play_count or 0, -date_added)
+        return max(self.track_ids, key=preference)
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __repr__(self):
+        return "<DuplicateCluster %d tracks, confidence %.2f>" % (len(self.track_ids), self.confidence)
+
+
+def _scored_links(track_map, threshold, max_block_size):
+    """Returns [(score, (Track ID, Track ID))] of the pairs sharing a block and scoring threshold or more"""
+    cache = {}
+    keys = {}
+    blocks = {}
+    for track_id, track in track_map.items():
+        key = keys[track_id] = _TrackKey(track, cache)
+        for block in blocking_keys(key):
+            members = blocks.get(block)
+            if members is None:
+                blocks[block] = [track_id]
+            else:
+                members.append(track_id)
+
+    scored = set()
+    links = []
+    skipped = 0
+    for block, members in blocks.items():
+        if len(members) < 2:
+            continue
+        if len(members) > max_block_size:
+            skipped += 1
+            continue
+        for position, track_id in enumerate(members):
+            key = keys[track_id]
+            for other_id in members[position + 1:]:
+                pair = (track_id, other_id) if track_id < other_id else (other_id, track_id)
+                if pair in scored:
+                    continue
+                scored.add(pair)
+                score = score_pair(key, keys[other_id])
+                if score >= threshold:
+                    links.append((score, pair))
+    if skipped:
+        logger.debug("%d blocks of more than %d tracks skipped", skipped, max_block_size)
+    return links
+
+
+def find_duplicates(track_map, threshold=DEFAULT_THRESHOLD, max_block_size=MAX_BLOCK_SIZE):
+    """Returns the DuplicateClusters of a track_map, most confident first
+
+    Tracks are grouped by blocking_keys and only pairs sharing a block are
+    scored, with score_pair; pairs scoring threshold or more are linked, and
+    linked tracks form clusters.
+    """
+    # a burst of small long-lived objects, collecting during it is wasted work
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        links = _scored_links(track_map, threshold, max_block_size)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    # union-find over the linked tracks, strongest links first, so that the
+    # weakest link of a cluster is the one joining its last part
+    parents = {}
+
+    def root(track_id):
+        parent = parents.get(track_id, track_id)
+        while parent != track_id:
+            grandparent = parents.get(parent, parent)
+            parents[track_id] = grandparent
+            track_id, parent = parent, grandparent
+        return track_id
+
+    links.sort(key=lambda link: -link[0])
+    confidences = {}
+    cluster_pairs = {}
+    for score, (track_id, other_id) in links:
+        first = root(track_id)
+        second = root(other_id)
+        if first == second:
+            continue
+        parents[second] = first
+        confidences[first] = min(score, confidences.pop(first, 1.0), confidences.pop(second, 1.0))
+        pairs = cluster_pairs.pop(first, {})
+        pairs.update(cluster_pairs.pop(second, {}))
+        pairs[(track_id, other_id)] = score
+        cluster_pairs[first] = pairs
+
+    members = {}
+    for track_id in parents:
+        members.setdefault(root(track_id), []).append(track_id)
+    for cluster_root in confidences:
+        members.setdefault(cluster_root, []).append(cluster_root)
+    clusters = [DuplicateCluster(sorted(set(track_ids)), confidences[cluster_root], cluster_pairs[cluster_root])
+                for cluster_root, track_ids in members.items()]
+    clusters.sort(key=lambda cluster: (-cluster.confidence, cluster.track_ids[0]))
+    return clusters
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming exporters, writing one track or playlist at a time, and M3U playlist trees.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import base64
+import csv
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+from IReadiTunes.IReadiTunes import TRACK_FIELD_NAMES, PLIST_DATE_FORMAT
+
+logger = logging.getLogger(__name__)
+
+TRACK_REFERENCES = ('track_id', 'persistent_id', 'embed')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.strftime(PLIST_DATE_FORMAT)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, default=_json_default)
+
+
+def _track_record(track, fields):
+    if fields is None:
+        return track.get_as_dict()
+    record = {}
+    for field in fields:
+        value = getattr(track, field)
+        if value is not None:
+            record[field] = value
+    return record
+
+
+def _check_fields(fields):
+    if fields is not None:
+        for field in fields:
+            if field not in TRACK_FIELD_NAMES:
+                raise ValueError("Unknown track field '%s'" % field)
+
+
+def export_tracks_jsonl(library, fp, fields=None):
+    """Writes each track of library.track_map as one JSON line, returns the number of lines
+
+    fields restricts the record to these Track attributes, by default a record is
+    Track.get_as_dict(). Dates are written as in the XML file, e.g. '2019-04-01T10:32:00Z'.
+    """
+    _check_fields(fields)
+    encode = _encoder.encode
+    count = 0
+    for track in library.track_map.values():
+        fp.write(encode(_track_record(track, fields)))
+        fp.write('\n')
+        count += 1
+    return count
+
+
+def export_playlists_jsonl(library, fp, track_ref='track_id', add_distingished_kind_label=False):
+    """Writes each playlist as one JSON line, returns the number of lines
+
+    The 'tracks' member lists the Track ID or the Persistent ID of each track
+    (track_ref 'track_id' or 'persistent_id'), so that tracks exported once with
+    export_tracks_jsonl are not repeated in every playlist holding them. With
+    track_ref 'embed' it holds the full Track.get_as_dict(), like
+    PlayList.get_as_dict, but tracks are still encoded and written one by one.
+    """
+    if track_ref not in TRACK_REFERENCES:
+        raise ValueError("track_ref must be one of %s" % ", ".join(TRACK_REFERENCES))
+    encode = _encoder.encode
+    count = 0
+    for playlist in library.playlists:
+        playlist_dict = playlist.get_as_dict(add_distingished_kind_label, include_tracks=False)
+        if not playlist.track_ids:
+            fp.write(encode(playlist_dict))
+            fp.write('\n')
+            count += 1
+            continue
+
+        head = encode(playlist_dict)[:-1]
+        fp.write(head)
+        fp.write(', "tracks": [' if len(head) > 1 else '"tracks": [')
+        if track_ref == 'track_id':
+            fp.write(', '.join([str(track_id) for track_id in playlist.track_ids]))
+        else:
+            separator = ''
+            for track_id, track in playlist.tracks:
+                fp.write(separator)
+                if track_ref == 'persistent_id':
+                    fp.write(encode(track.persistent_id))
+                else:
+                    fp.write(encode(track.get_as_dict()))
+                separator = ', '
+        fp.write(']}\n')
+        count += 1
+    return count
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime(PLIST_DATE_FORMAT)
+    return value
+
+
+def export_csv(library, fp, fields=None):
+    """Writes a header row then one row per track, returns the number of tracks
+
+    fp should be opened with newline=''. fields selects the Track attributes
+    written as columns, all of TRACK_FIELD_NAMES by default.
+    """
+    _check_fields(fields)
+    if fields is None:
+        fields = TRACK_FIELD_NAMES
+    writer = csv.writer(fp)
+    writer.writerow(fields)
+    count = 0
+    for track in library.track_map.values():
+        writer.writerow([_csv_value(getattr(track, field)) for field in fields])
+        count += 1
+    return count
+
+
+# written in the export directory by export_m3u_tree, to recognize unchanged playlists on the next run
+M3U_MANIFEST_NAME = '.m3u_manifest.json'
+M3U_MANIFEST_VERSION = 1
+
+M3U_ENCODINGS = {'m3u8': 'utf-8', 'm3u': 'latin-1'}
+
+
+class M3UExportReport(object):
+    """Result of export_m3u_tree: file paths written, left unchanged and removed, relative to the directory"""
+
+    def __init__(self):
+        self.written = []
+        self.unchanged = []
+        self.removed = []
+        # memberships left out: tracks without a local file or a URL, or whose path the encoding cannot write
+        self.skipped_entries = 0
+
+    def __repr__(self):
+        return "<M3UExportReport %d written, %d unchanged, %d removed, %d entries skipped>" % (
+            len(self.written), len(self.unchanged), len(self.removed), self.skipped_entries)
+
+
+def _encodable(text, encoding):
+    try:
+        text.encode(encoding)
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _m3u_line(text):
+    return ' '.join(text.split()) if text else ''
+
+
+def _load_m3u_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('version') != M3U_MANIFEST_VERSION:
+        return {}
+    return manifest.get('files', {})
+
+
+def _export_path(root, relative_path):
+    """Returns the path of an M3U file of the export under root, None if relative_path leads out of it"""
+    if not relative_path.endswith(tuple('.' + extension for extension in M3U_ENCODINGS)):
+        return None
+    path = os.path.normpath(os.path.join(root, *relative_path.split('/')))
+    if os.path.isabs(relative_path) or path == root or os.path.commonpath([root, path]) != root:
+        return None
+    return path
+
+
+def _write_file(path, data):
+    """Writes data to path in one call, through a temporary file renamed over it"""
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def export_m3u_tree(library, directory, extension='m3u8', extended=True, prefix_map=None, skip_master=True,
+                    remove_stale=True):
+    """Writes every playlist as an M3U file under directory, mirroring the folders of display_path
+
+    '/Parties/2019' is written to directory/Parties/2019.m3u8; folders only
+    become directories. Entries are the local paths of the tracks (see
+    Library.track_paths and prefix_map) or their URL for streams; with
+    extended, each one is preceded by an #EXTINF line. Each file is built in
+    memory and written in one call. A manifest of the files written is kept
+    in the directory: files whose content did not change since the last
+    export are not written again, and with remove_stale, files of playlists
+    that no longer exist are removed (only M3U files under directory).
+    .m3u files are Latin-1: tracks whose path is not Latin-1 are left out
+    with a warning instead of being written with '?' in place of characters.
+    Returns an M3UExportReport.
+    """
+    if extension not in M3U_ENCODINGS:
+        raise ValueError("extension must be one of %s" % ", ".join(sorted(M3U_ENCODINGS)))
+    encoding = M3U_ENCODINGS[extension]
+    if any(playlist.display_path is None for playlist in library.playlists):
+        library.generate_playlist_dislay_paths()
+
+    track_map = library.track_map
+    paths = library.track_paths(prefix_map)
+    # entry text of each track, built once whatever the number of playlists holding it
+    entries = {}
+    unencodable = []
+
+    def entry(track_id):
+        text = entries.get(track_id)
+        if text is None:
+            track = track_map.get(track_id)
+            path = paths.get(track_id)
+            if (path is None and track is not None and track.location and '://' in track.location
+                    and not track.location.startswith('file:')):
+                # stream
+                path = track.location
+            if path is not None and not _encodable(path, encoding):
+                unencodable.append(path)
+                path = None
+            if path is None:
+                text = ''
+            elif extended:
+                seconds = track.total_time // 1000 if track.total_time is not None else -1
+                title = _m3u_line(track.name)
+                if track.artist:
+                    title = _m3u_line(track.artist) + ' - ' + title
+                text = '#EXTINF:%d,%s\n%s\n' % (seconds, title, path)
+            else:
+                text = path + '\n'
+            entries[track_id] = text
+        return text
+
+    root = os.path.abspath(directory)
+    manifest_path = os.path.join(root, M3U_MANIFEST_NAME)
+    previous = _load_m3u_manifest(manifest_path)
+    files = {}
+    report = M3UExportReport()
+    created_directories = set()
+    for playlist in library.playlists:
+        if playlist.folder or (skip_master and playlist.master):
+            continue
+        display_path = playlist.display_path
+        if library.playlist_by_display_path.get(display_path) is not playlist:
+            # another playlist of the same folder has the same name
+            display_path = '%s_%s' % (display_path, playlist.playlist_persistent_id)
+        relative_path = display_path.lstrip('/') + '.' + extension
+        if relative_path in files:
+            continue
+        path = _export_path(root, relative_path)
+        if path is None:
+            logger.warning("Playlist %s not exported: '%s' is not under %s", display_path, relative_path, root)
+            continue
+
+        texts = ['#EXTM3U\n'] if extended else []
+        for track_id in playlist.track_ids:
+            text = entry(track_id)
+            if text:
+                texts.append(text)
+            else:
+                report.skipped_entries += 1
+        # only the #EXTINF titles may not be encodable, their paths are
+        data = ''.join(texts).encode(encoding, 'replace')
+        digest = hashlib.sha1(data).hexdigest()
+        files[relative_path] = [digest, len(data)]
+
+        if previous.get(relative_path) == [digest, len(data)]:
+            try:
+                if os.stat(path).st_size == len(data):
+                    report.unchanged.append(relative_path)
+                    continue
+            except OSError:
+                pass
+        parent = os.path.dirname(path)
+        if parent not in created_directories:
+            os.makedirs(parent, exist_ok=True)
+            created_directories.add(parent)
+        _write_file(path, data)
+        report.written.append(relative_path)
+
+    if unencodable:
+        logger.warning("%d tracks left out of the .%s files, their paths cannot be written in %s, e.g. %s",
+                       len(unencodable), extension, encoding, unencodable[0])
+
+    if remove_stale:
+        for relative_path in previous:
+            if relative_path not in files:
+                path = _export_path(root, relative_path)
+                if path is None:
+                    logger.warning("Not removing '%s' listed in %s: it is not an M3U file under %s",
+                                   relative_path, manifest_path, root)
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                report.removed.append(relative_path)
+    else:
+        for relative_path, state in previous.items():
+            files.setdefault(relative_path, state)
+
+    os.makedirs(root, exist_ok=True)
+    _write_file(manifest_path, json.dumps({'version': M3U_MANIFEST_VERSION, 'files': files}, sort_keys=True,
+                                          ensure_ascii=False).encode('utf-8'))
+    return report
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Local files of the tracks: resolving locations to paths, and checking them on disk.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import concurrent.futures
+import os
+from datetime import datetime, timedelta
+
+# paths stat'ed by one task of the thread pool
+_STAT_CHUNK_SIZE = 256
+
+# file mtimes and Date Modified are compared with this tolerance, in seconds
+MTIME_TOLERANCE = 2
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def location_to_path(location, prefix_map=None):
+    """Returns the local path of a track location, None if it is not a local file
+
+    location is a Track.location, already unquoted: it is not parsed as a URL
+    since '#', '?' or '%' in a file name are plain characters there. prefix_map
+    is a list of (prefix, replacement) pairs rewriting the resulting paths, e.g.
+    [('/Users/me/Music', '/mnt/nas/Music')]; the first matching prefix is used.
+    """
+    if not location or location[:7].lower() != 'file://':
+        return None
+    host, slash, path = location[7:].partition('/')
+    if host.lower() not in ('', 'localhost'):
+        return None
+    path = slash + path
+    if len(path) > 2 and path[0] == '/' and path[2] == ':':
+        # Windows drive: file://localhost/C:/Music/...
+        path = path[1:]
+    if prefix_map:
+        for prefix, replacement in prefix_map:
+            if path.startswith(prefix):
+                path = replacement + path[len(prefix):]
+                break
+    return path
+
+
+def resolve_track_paths(track_map, prefix_map=None):
+    """Returns {track_id: local path} for the tracks of track_map stored in local files"""
+    paths = {}
+    for track_id, track in track_map.items():
+        path = location_to_path(track.location, prefix_map)
+        if path is not None:
+            paths[track_id] = path
+    return paths
+
+
+class FileCheckReport(object):
+    """Result of Library.check_files
+
+    missing holds (track_id, path) pairs, size_mismatches (track_id, path,
+    Size, file size) and modified (track_id, path, Date Modified, file mtime)
+    for files changed after iTunes last saw them. not_local lists the Track IDs
+    without a local file (streams, cloud tracks) which were not checked.
+    """
+
+    def __init__(self):
+        self.checked = 0
+        self.missing = []
+        self.size_mismatches = []
+        self.modified = []
+        self.not_local = []
+
+    def __bool__(self):
+        return bool(self.missing or self.size_mismatches or self.modified)
+
+    def __repr__(self):
+        return "<FileCheckReport %d checked, %d missing, %d size mismatches, %d modified, %d not local>" % (
+            self.checked, len(self.missing), len(self.size_mismatches), len(self.modified), len(self.not_local))
+
+
+def _stat_paths(paths):
+    results = []
+    for path in paths:
+        try:
+            results.append(os.stat(path))
+        except OSError:
+            results.append(None)
+    return results
+
+
+def check_track_files(track_map, paths, workers=16, check_mtime=True):
+    """Stats the files of paths ({track_id: path}) with a pool of threads and returns a FileCheckReport
+
+    Each file is stat'ed once even when several tracks share it; files on
+    network mounts spend most of a stat waiting, so workers can be well above
+    the number of cores.
+    """
+    report = FileCheckReport()
+    report.not_local = [track_id for track_id in track_map if track_id not in paths]
+    unique_paths = list(dict.fromkeys(paths.values()))
+    chunks = [unique_paths[start:start + _STAT_CHUNK_SIZE]
+              for start in range(0, len(unique_paths), _STAT_CHUNK_SIZE)]
+    stats = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for chunk, results in zip(chunks, executor.map(_stat_paths, chunks)):
+            stats.update(zip(chunk, results))
+
+    tolerance = timedelta(seconds=MTIME_TOLERANCE)
+    for track_id, path in paths.items():
+        report.checked += 1
+        stat = stats[path]
+        if stat is None:
+            report.missing.append((track_id, path))
+            continue
+        track = track_map[track_id]
+        if track.size is not None and track.size != stat.st_size:
+            report.size_mismatches.append((track_id, path, track.size, stat.st_size))
+        if check_mtime and track.date_modified is not None:
+            # Date Modified is UTC
+            mtime = _EPOCH + timedelta(seconds=stat.st_mtime)
+            if mtime > track.date_modified + tolerance:
+                report.modified.append((track_id, path, track.date_modified, mtime))
+    return report
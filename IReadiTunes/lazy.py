@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy tracks: kept as the byte range of their <dict> in the file, each value decoded on first access.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import re
+import urllib.request
+
+from IReadiTunes.IReadiTunes import (Track, TRACK_ATTRIBUTE_NAMES, TRACK_ATTRIBUTE_INDEX, TRACK_FIELD_NAMES,
+                                     PLIST_VALUE_DECODERS, _decode_text)
+
+# value element following a <key>, the scalar values of a track dict are never nested
+_RAW_VALUE_RE = re.compile(br'\s*<(\w+)\s*(?:/>|>([^<]*)</\1>)')
+_RAW_ITEM_RE = re.compile(br'<key>([^<]*)</key>\s*<(\w+)\s*(?:/>|>([^<]*)</\2>)')
+
+# content the patterns above do not read: arrays, comments, CDATA, processing instructions, and value
+# elements without a decoder (e.g. <real>), left to read_track which reports them
+_NOT_LAZY_RE = re.compile(br'<!|<\?|<(?!(?:key|dict|%s)[\s/>])\w'
+                          % '|'.join(sorted(PLIST_VALUE_DECODERS)).encode('ascii'))
+
+_XML_REFERENCE_RE = re.compile(r'&(#x[0-9a-fA-F]+|#[0-9]+|amp|lt|gt|quot|apos);')
+_XML_ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+
+# Track attribute -> '<key>...</key>' bytes of its value
+_FIELD_KEYS = dict((field, ('<key>%s</key>' % key).encode('utf-8'))
+                   for field, key in zip(TRACK_FIELD_NAMES, TRACK_ATTRIBUTE_NAMES))
+
+
+def _replace_reference(match):
+    reference = match.group(1)
+    if reference[0] != '#':
+        return _XML_ENTITIES[reference]
+    if reference[1] == 'x':
+        return chr(int(reference[2:], 16))
+    return chr(int(reference[1:]))
+
+
+def decode_raw_text(raw):
+    """Returns the text of a raw element content as the XML parser reads it, None if empty"""
+    if not raw:
+        return None
+    text = raw.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if '&' in text:
+        text = _XML_REFERENCE_RE.sub(_replace_reference, text)
+    return text
+
+
+def decode_raw_value(tag, raw):
+    """Decodes the raw content of a plist value element like Library.decode_plist_dict"""
+    decoder = PLIST_VALUE_DECODERS.get(tag.decode('ascii'), _decode_text)
+    return decoder(decode_raw_text(raw))
+
+
+def is_lazy_block(data, start, end):
+    """Returns True if the track dict at data[start:end] can be read by LazyTrack
+
+    Blocks holding arrays, comments or values of a tag without a decoder in
+    PLIST_VALUE_DECODERS are not, they are read eagerly.
+    """
+    return _NOT_LAZY_RE.search(data, start, end) is None
+
+
+class LazyTrack(Track):
+    """A Track decoding each of its values from the bytes of the file when first read
+
+    The decoded value is stored in the Track slot, later reads cost the same as
+    on a Track. Values may be set as on a Track, a set value is never decoded.
+    Pickling and copying give a plain Track with all the values decoded.
+    data holds the whole file and stays referenced as long as the track does.
+    """
+    __slots__ = ('_data', '_start', '_end')
+
+    def __init__(self, data, start, end):
+        self._data = data
+        self._start = start
+        self._end = end
+
+    def __getattr__(self, name):
+        # only called for slots not set yet
+        key = _FIELD_KEYS.get(name)
+        if key is None:
+            if name == '_extra_attributes':
+                value = self._decode_extra_attributes()
+                self._extra_attributes = value
+                return value
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+        value = None
+        data = self._data
+        pos = data.find(key, self._start, self._end)
+        if pos >= 0:
+            match = _RAW_VALUE_RE.match(data, pos + len(key), self._end)
+            if match is not None:
+                value = decode_raw_value(match.group(1), match.group(2))
+                if name == 'location' and value:
+                    value = urllib.request.unquote(value)
+        setattr(self, name, value)
+        return value
+
+    def _decode_extra_attributes(self):
+        """Returns the values of the keys without a Track attribute, None if there are none"""
+        extra_attributes = None
+        for key, tag, raw in _RAW_ITEM_RE.findall(self._data, self._start, self._end):
+            key = decode_raw_text(key)
+            if key not in TRACK_ATTRIBUTE_INDEX:
+                if extra_attributes is None:
+                    extra_attributes = {}
+                extra_attributes[key] = decode_raw_value(tag, raw)
+        return extra_attributes
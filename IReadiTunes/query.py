@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Indexed queries over the tracks of a Library.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+
+from IReadiTunes.IReadiTunes import TRACK_FIELD_NAMES
+from IReadiTunes.aio import run_in_executor
+
+QUERY_OPERATORS = ('eq', 'ne', 'in', 'iexact', 'gt', 'gte', 'lt', 'lte', 'startswith', 'contains')
+
+# operators answered from a hash index, from a sorted index, or by testing each candidate
+_HASH_OPERATORS = ('eq', 'in', 'iexact')
+_RANGE_OPERATORS = ('gt', 'gte', 'lt', 'lte', 'startswith')
+
+# once the candidates are this many times fewer than the matches of the next
+# filter, testing each candidate is cheaper than intersecting with the index
+_VERIFY_RATIO = 4
+
+
+def _casefold(value):
+    if isinstance(value, str):
+        return value.casefold()
+    return value
+
+
+def _matches(value, operator, operand):
+    """Tests a single track value against a filter"""
+    if operator == 'eq':
+        return value == operand
+    if operator == 'ne':
+        return value != operand
+    if operator == 'in':
+        return value in operand
+    if operator == 'iexact':
+        return value is not None and _casefold(value) == _casefold(operand)
+    if value is None:
+        return False
+    if operator == 'gt':
+        return value > operand
+    if operator == 'gte':
+        return value >= operand
+    if operator == 'lt':
+        return value < operand
+    if operator == 'lte':
+        return value <= operand
+    if operator == 'startswith':
+        return isinstance(value, str) and value.startswith(operand)
+    if operator == 'contains':
+        return isinstance(value, str) and operand in value
+    raise ValueError("Unknown query operator '%s'" % operator)
+
+
+def parse_filter(name, operand):
+    """Splits a where() keyword like 'year__gte' into ('year', 'gte', operand)"""
+    field, _, operator = name.partition('__')
+    if not operator:
+        operator = 'eq'
+    if field not in TRACK_FIELD_NAMES:
+        raise ValueError("Unknown track field '%s'" % field)
+    if operator not in QUERY_OPERATORS:
+        raise ValueError("Unknown query operator '%s'" % operator)
+    if operator == 'in':
+        operand = frozenset(operand)
+    return field, operator, operand
+
+
+class HashIndex(object):
+    """value -> positions of the tracks holding it"""
+
+    def __init__(self, values, key=None):
+        self.key = key
+        buckets = {}
+        for position, value in enumerate(values):
+            if value is None:
+                continue
+            if key is not None:
+                value = key(value)
+            bucket = buckets.get(value)
+            if bucket is None:
+                buckets[value] = [position]
+            else:
+                bucket.append(position)
+        self.buckets = buckets
+
+    def lookup(self, value):
+        if self.key is not None:
+            value = self.key(value)
+        return self.buckets.get(value, ())
+
+    def lookup_many(self, values):
+        positions = []
+        for value in values:
+            positions.extend(self.lookup(value))
+        return positions
+
+
+class SortedIndex(object):
+    """Non-None values sorted, with the positions of their tracks"""
+
+    def __init__(self, values):
+        pairs = sorted((value, position) for position, value in enumerate(values) if value is not None)
+        self.keys = [value for value, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+    def range(self, operator, operand):
+        """Returns the positions matching a range operator"""
+        keys = self.keys
+        if operator == 'gt':
+            return self.positions[bisect_right(keys, operand):]
+        if operator == 'gte':
+            return self.positions[bisect_left(keys, operand):]
+        if operator == 'lt':
+            return self.positions[:bisect_left(keys, operand)]
+        if operator == 'lte':
+            return self.positions[:bisect_right(keys, operand)]
+        if operator == 'startswith':
+            start = bisect_left(keys, operand)
+            end = bisect_left(keys, operand + u'\U0010ffff')
+            return self.positions[start:end]
+        raise ValueError("Operator '%s' is not a range" % operator)
+
+    def between(self, low, high):
+        """Returns the positions of the values from low to high, both included"""
+        return self.positions[bisect_left(self.keys, low):bisect_right(self.keys, high)]
+
+
+class TrackQuery(object):
+    """Queries over library.track_map, backed by indexes built on first use
+
+    Returned tracks keep the order of track_map. Indexes are dropped
+    automatically when the library is re-parsed or updated. Queries may run
+    in several threads at once (see awhere): each one runs under a lock, on
+    the tracks and indexes of a single state of the library.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        self._track_map = None
+        self._track_count = -1
+        self._tracks = []
+        self._hash_indexes = {}
+        self._casefold_indexes = {}
+        self._sorted_indexes = {}
+        self._lock = threading.RLock()
+
+    def _check_fresh(self):
+        with self._lock:
+            track_map = self.library.track_map
+            if track_map is not self._track_map or len(track_map) != self._track_count:
+                self._tracks = list(track_map.values())
+                self._hash_indexes = {}
+                self._casefold_indexes = {}
+                self._sorted_indexes = {}
+                self._track_count = len(track_map)
+                self._track_map = track_map
+            return self._tracks
+
+    def track_list(self):
+        """Returns the tracks in track_map order; positions returned by the indexes refer to this list"""
+        return self._check_fresh()
+
+    def _values(self, field):
+        return [getattr(track, field) for track in self._tracks]
+
+    def hash_index(self, field):
+        """Returns the HashIndex of a field, building it if needed"""
+        with self._lock:
+            self._check_fresh()
+            return self._hash_index(field)
+
+    def casefold_index(self, field):
+        """Returns the case-insensitive HashIndex of a field, building it if needed"""
+        with self._lock:
+            self._check_fresh()
+            return self._casefold_index(field)
+
+    def sorted_index(self, field):
+        """Returns the SortedIndex of a field, building it if needed; None if its values do not sort"""
+        with self._lock:
+            self._check_fresh()
+            return self._sorted_index(field)
+
+    # indexes of self._tracks as it is, for callers holding the lock
+
+    def _hash_index(self, field):
+        index = self._hash_indexes.get(field)
+        if index is None:
+            index = self._hash_indexes[field] = HashIndex(self._values(field))
+        return index
+
+    def _casefold_index(self, field):
+        index = self._casefold_indexes.get(field)
+        if index is None:
+            index = self._casefold_indexes[field] = HashIndex(self._values(field), key=_casefold)
+        return index
+
+    def _sorted_index(self, field):
+        if field not in self._sorted_indexes:
+            try:
+                self._sorted_indexes[field] = SortedIndex(self._values(field))
+            except TypeError:
+                # values of mixed types
+                self._sorted_indexes[field] = None
+        return self._sorted_indexes[field]
+
+    def _index_positions(self, field, operator, operand):
+        """Returns the positions matching a filter through an index, None if no index applies; called under the lock"""
+        if operator == 'eq':
+            if operand is None:
+                return None
+            return self._hash_index(field).lookup(operand)
+        if operator == 'in':
+            if None in operand:
+                return None
+            return self._hash_index(field).lookup_many(operand)
+        if operator == 'iexact':
+            return self._casefold_index(field).lookup(operand)
+        if operator in _RANGE_OPERATORS:
+            if operator == 'startswith' and not isinstance(operand, str):
+                return None
+            index = self._sorted_index(field)
+            if index is None:
+                return None
+            try:
+                return index.range(operator, operand)
+            except TypeError:
+                return None
+        return None
+
+    def _select_positions(self, filters):
+        """Returns (tracks, sorted positions in tracks of those matching every filter)
+
+        Runs under the lock, so that the indexes and the track list are those
+        of one state of the library even if it changes meanwhile.
+        """
+        with self._lock:
+            tracks = self._check_fresh()
+            return tracks, self._match_positions(tracks, filters)
+
+    def _match_positions(self, tracks, filters):
+        indexed = []
+        scanned = []
+        for field, operator, operand in filters:
+            positions = None
+            if operator in _HASH_OPERATORS or operator in _RANGE_OPERATORS:
+                positions = self._index_positions(field, operator, operand)
+            if positions is None:
+                scanned.append((field, operator, operand))
+            else:
+                indexed.append((len(positions), positions, (field, operator, operand)))
+
+        if indexed:
+            # most selective index first; once the candidates are few enough,
+            # the remaining filters are checked on them instead of intersected
+            indexed.sort(key=lambda entry: entry[0])
+            candidates = set(indexed[0][1])
+            for count, positions, condition in indexed[1:]:
+                if not candidates:
+                    return []
+                if count <= len(candidates) * _VERIFY_RATIO:
+                    candidates.intersection_update(positions)
+                else:
+                    scanned.append(condition)
+            candidates = sorted(candidates)
+        else:
+            candidates = range(len(tracks))
+
+        for field, operator, operand in scanned:
+            candidates = [position for position in candidates
+                          if _matches(getattr(tracks[position], field), operator, operand)]
+            if not candidates:
+                break
+        return list(candidates)
+
+    def where(self, **filters):
+        """Returns the tracks matching all the filters
+
+        Filters are field=value or field__operator=value, with the operators
+        eq, ne, in, iexact, gt, gte, lt, lte, startswith and contains, e.g.
+        where(artist='Muse', year__gte=2000).
+        """
+        conditions = [parse_filter(name, operand) for name, operand in filters.items()]
+        tracks, positions = self._select_positions(conditions)
+        return [tracks[position] for position in positions]
+
+    def count(self, **filters):
+        """Returns the number of tracks matching all the filters"""
+        conditions = [parse_filter(name, operand) for name, operand in filters.items()]
+        return len(self._select_positions(conditions)[1])
+
+    def get(self, **filters):
+        """Returns the first track matching all the filters, None if there is none"""
+        conditions = [parse_filter(name, operand) for name, operand in filters.items()]
+        tracks, positions = self._select_positions(conditions)
+        if positions:
+            return tracks[positions[0]]
+        return None
+
+    def values(self, field):
+        """Returns the distinct non-None values of a field"""
+        return list(self.hash_index(field).buckets)
+
+    async def awhere(self, **filters):
+        """where() run in the default executor, so that building an index does not block the event loop
+
+        The library is read from a worker thread: a Library, or a StoredLibrary
+        which reads through one connection per thread.
+        """
+        return await run_in_executor(self.where, **filters)
+
+    async def acount(self, **filters):
+        return await run_in_executor(self.count, **filters)
+
+    async def aget(self, **filters):
+        return await run_in_executor(self.get, **filters)
+
+    def __iter__(self):
+        return iter(self._check_fresh())
+
+    def __len__(self):
+        return len(self._check_fresh())
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+Full-text search over tracks and playlists: token and trigram indexes, prefix and fuzzy matching, ranking.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import heapq
+import itertools
+import re
+import unicodedata
+from bisect import bisect_left, insort
+
+# searched track fields and the weight of a match in each, a match in several fields counts its best one
+SEARCH_FIELDS = (('name', 8), ('artist', 6), ('album_artist', 5), ('album', 4), ('composer', 3),
+                 ('grouping', 2), ('comments', 1))
+PLAYLIST_SEARCH_FIELDS = (('name', 1),)
+
+# shorter query terms only match whole tokens
+MIN_PREFIX_LENGTH = 2
+# shorter query terms are not matched fuzzily
+FUZZY_MIN_LENGTH = 4
+# terms from this length may be two edits away from a token, shorter ones one edit
+FUZZY_TWO_EDITS_LENGTH = 8
+
+# score of a token matching a term, relative to an exact match
+PREFIX_QUALITY = 0.75
+FUZZY_QUALITY = (1.0, 0.5, 0.3)
+
+# when the rarest term of a query matches up to this many documents per result
+# asked, each one is scored; beyond, results are taken from the best scores down
+SCORE_EACH_RATIO = 16
+
+_TOKEN = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Returns text case-folded, without accents, for comparisons"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(character for character in text if not unicodedata.combining(character))
+    return text.casefold()
+
+
+def tokenize(text):
+    """Returns the normalized words of a text"""
+    if not text:
+        return []
+    return _TOKEN.findall(normalize(text))
+
+
+def trigrams(token):
+    """Returns the set of trigrams of a token, padded so that its first and last letters count as much"""
+    padded = '$' + token + '$'
+    return set(padded[position:position + 3] for position in range(len(padded) - 2))
+
+
+def edit_distance(a, b, limit):
+    """Returns the Levenshtein distance of two strings, or limit + 1 if it is above limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, a_char in enumerate(a, 1):
+        current = [i]
+        best = i
+        for j, b_char in enumerate(b, 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a_char != b_char))
+            current.append(value)
+            if value < best:
+                best = value
+        if best > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class InvertedIndex(object):
+    """token -> {field weight: set of documents}, with the sorted vocabulary for prefixes and its trigrams
+
+    A document is listed under the weight of its best field holding the
+    token. Documents are any hashable keys; each is indexed from
+    the texts of its fields and can be removed or re-added at any time.
+    """
+
+    def __init__(self, weights):
+        # weight of each field, in the order of the texts given to add
+        self.weights = weights
+        self.postings = {}
+        self.vocabulary = []
+        self.trigram_tokens = {}
+        self.document_tokens = {}
+
+    def __len__(self):
+        return len(self.document_tokens)
+
+    def add(self, document, texts, tokenize_cache=None, update_vocabulary=True):
+        """Indexes a document from the texts of its fields
+
+        With update_vocabulary False, new tokens are not added to the
+        vocabulary and trigrams: call rebuild_vocabulary once done.
+        """
+        if document in self.document_tokens:
+            self.remove(document)
+        tokens = {}
+        for weight, text in zip(self.weights, texts):
+            if not text:
+                continue
+            if tokenize_cache is None:
+                words = tokenize(text)
+            else:
+                words = tokenize_cache.get(text)
+                if words is None:
+                    words = tokenize_cache[text] = tokenize(text)
+            for word in words:
+                if weight > tokens.get(word, 0):
+                    tokens[word] = weight
+        postings = self.postings
+        for token, weight in tokens.items():
+            posting = postings.get(token)
+            if posting is None:
+                posting = postings[token] = {}
+                if update_vocabulary:
+                    self._add_token(token)
+            documents = posting.get(weight)
+            if documents is None:
+                posting[weight] = {document}
+            else:
+                documents.add(document)
+        self.document_tokens[document] = tuple(tokens.items())
+
+    def remove(self, document):
+        """Removes a document, nothing happens if it is not indexed"""
+        postings = self.postings
+        for token, weight in self.document_tokens.pop(document, ()):
+            posting = postings[token]
+            documents = posting[weight]
+            documents.discard(document)
+            if not documents:
+                del posting[weight]
+                if not posting:
+                    del postings[token]
+                    self._remove_token(token)
+
+    def clear(self):
+        self.postings = {}
+        self.vocabulary = []
+        self.trigram_tokens = {}
+        self.document_tokens = {}
+
+    def _add_token(self, token):
+        insort(self.vocabulary, token)
+        trigram_tokens = self.trigram_tokens
+        for trigram in trigrams(token):
+            tokens = trigram_tokens.get(trigram)
+            if tokens is None:
+                trigram_tokens[trigram] = {token}
+            else:
+                tokens.add(token)
+
+    def _remove_token(self, token):
+        del self.vocabulary[bisect_left(self.vocabulary, token)]
+        trigram_tokens = self.trigram_tokens
+        for trigram in trigrams(token):
+            tokens = trigram_tokens[trigram]
+            tokens.discard(token)
+            if not tokens:
+                del trigram_tokens[trigram]
+
+    def rebuild_vocabulary(self):
+        """Rebuilds the vocabulary and trigrams from the postings, faster than inserting tokens one by one"""
+        self.vocabulary = sorted(self.postings)
+        trigram_tokens = {}
+        for token in self.vocabulary:
+            for trigram in trigrams(token):
+                tokens = trigram_tokens.get(trigram)
+                if tokens is None:
+                    trigram_tokens[trigram] = {token}
+                else:
+                    tokens.add(token)
+        self.trigram_tokens = trigram_tokens
+
+    def expand(self, term, prefix=False, fuzzy=False):
+        """Returns [(token, quality)] of the indexed tokens matching a query term
+
+        The term matches itself, the tokens it starts when prefix is set and
+        long enough, and, when fuzzy is set and nothing else matched, the
+        tokens one or two edits away.
+        """
+        matches = []
+        if term in self.postings:
+            matches.append((term, 1.0))
+        if prefix and len(term) >= MIN_PREFIX_LENGTH:
+            vocabulary = self.vocabulary
+            position = bisect_left(vocabulary, term)
+            while position < len(vocabulary) and vocabulary[position].startswith(term):
+                if vocabulary[position] != term:
+                    matches.append((vocabulary[position], PREFIX_QUALITY))
+                position += 1
+        if not matches and fuzzy and len(term) >= FUZZY_MIN_LENGTH:
+            matches = self._fuzzy_tokens(term)
+        return matches
+
+    def _fuzzy_tokens(self, term):
+        limit = 2 if len(term) >= FUZZY_TWO_EDITS_LENGTH else 1
+        term_trigrams = trigrams(term)
+        # an edit changes at most 3 trigrams
+        needed = len(term_trigrams) - 3 * limit
+        shared = {}
+        for trigram in term_trigrams:
+            for token in self.trigram_tokens.get(trigram, ()):
+                shared[token] = shared.get(token, 0) + 1
+        matches = []
+        for token, count in shared.items():
+            if count < needed or abs(len(token) - len(term)) > limit:
+                continue
+            distance = edit_distance(term, token, limit)
+            if distance <= limit:
+                matches.append((token, FUZZY_QUALITY[distance]))
+        return matches
+
+    def _term_tiers(self, matches):
+        """Returns [(score, sets of documents, size)] of a term, best score first"""
+        tiers = {}
+        for token, quality in matches:
+            for weight, documents in self.postings[token].items():
+                tiers.setdefault(weight * quality, []).append(documents)
+        return sorted(((score, sets, sum(len(documents) for documents in sets)) for score, sets in tiers.items()),
+                      key=lambda tier: -tier[0])
+
+    def search(self, query, limit=20, prefix=True, fuzzy=True):
+        """Returns [(document, score)] of the best documents matching every term of a query, best first
+
+        The last term is matched as a prefix when prefix is set (search as you
+        type). A term scores the weight of the best field it matches in, times
+        the quality of the match; the score of a document adds those of the
+        terms. Equal scores come in no particular order.
+        """
+        terms = tokenize(query)
+        if not terms or limit <= 0:
+            return []
+        term_tiers = []
+        for position, term in enumerate(terms):
+            matches = self.expand(term, prefix and position == len(terms) - 1, fuzzy)
+            if not matches:
+                return []
+            term_tiers.append(self._term_tiers(matches))
+
+        # few documents match the rarest term: score each of those matching every term
+        term_tiers.sort(key=lambda tiers: sum(size for _, _, size in tiers))
+        if len(term_tiers) > 1 and sum(size for _, _, size in term_tiers[0]) <= limit * SCORE_EACH_RATIO:
+            candidates = _intersection([documents for _, sets, _ in tiers for documents in sets] for tiers in term_tiers)
+            return heapq.nlargest(limit, ((document, self._score(document, term_tiers)) for document in candidates),
+                                  key=lambda result: result[1])
+
+        # combinations of one tier per term, best total first: a document is
+        # taken from the first combination holding it, which gives its score
+        combinations = sorted(((sum(score for score, _, _ in tiers), tiers) for tiers in itertools.product(*term_tiers)),
+                              key=lambda combination: -combination[0])
+        results = []
+        taken = set()
+        for total, group in itertools.groupby(combinations, key=lambda combination: combination[0]):
+            matching = []
+            for _, tiers in group:
+                documents = _intersection(sets for _, sets, _ in sorted(tiers, key=lambda tier: tier[2]))
+                if documents:
+                    matching.append(documents)
+            if not matching:
+                continue
+            # the sets of the index are never modified here
+            documents = set().union(*matching) if len(matching) > 1 else matching[0]
+            if taken:
+                documents = documents - taken
+            selected = list(itertools.islice(documents, limit - len(results)))
+            results.extend((document, total) for document in selected)
+            if len(results) >= limit:
+                break
+            taken.update(selected)
+        return results
+
+    @staticmethod
+    def _score(document, term_tiers):
+        total = 0
+        for tiers in term_tiers:
+            for score, sets, _ in tiers:
+                if any(document in documents for documents in sets):
+                    total += score
+                    break
+        return total
+
+
+def _intersection(terms):
+    """Returns the documents in every term, each one given as a list of sets; the first term should be the smallest"""
+    result = None
+    for sets in terms:
+        if result is None:
+            result = sets[0] if len(sets) == 1 else set().union(*sets)
+        elif len(sets) == 1:
+            result = result & sets[0]
+        else:
+            result = set().union(*[result & documents for documents in sets])
+        if not result:
+            break
+    return result
+
+
+class SearchIndex(object):
+    """Search over the tracks (SEARCH_FIELDS) and playlist names of a library
+
+    Indexes are built on first use. Tracks are re-indexed incrementally: when
+    track_map is replaced (Library.update keeps the unchanged Track objects),
+    only the tracks that are new objects are indexed again. Tracks modified
+    in place must be passed to update_tracks.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        self.tracks = InvertedIndex([weight for _, weight in SEARCH_FIELDS])
+        self.playlists = InvertedIndex([weight for _, weight in PLAYLIST_SEARCH_FIELDS])
+        self._track_objects = {}
+        self._track_map = None
+        self._track_count = -1
+        self._playlist_list = None
+        self._playlist_count = -1
+
+    def _track_texts(self, track):
+        return [getattr(track, field) for field, _ in SEARCH_FIELDS]
+
+    def sync(self):
+        """Brings the indexes up to date with the library, returns the number of tracks indexed or removed"""
+        playlists = self.library.playlists
+        if playlists is not self._playlist_list or len(playlists) != self._playlist_count:
+            self._playlist_list = playlists
+            self._playlist_count = len(playlists)
+            self.playlists.clear()
+            for position, playlist in enumerate(playlists):
+                self.playlists.add(position, [getattr(playlist, field) for field, _ in PLAYLIST_SEARCH_FIELDS])
+
+        track_map = self.library.track_map
+        if track_map is self._track_map and len(track_map) == self._track_count:
+            return 0
+        objects = self._track_objects
+        changed = [track for track_id, track in track_map.items() if objects.get(track_id) is not track]
+        removed = [track_id for track_id in objects if track_id not in track_map]
+        index = self.tracks
+        cache = {}
+        if len(changed) == len(track_map):
+            # nothing kept, e.g. after parse: index from scratch
+            index.clear()
+            objects.clear()
+            for track in changed:
+                index.add(track.track_id, self._track_texts(track), cache, update_vocabulary=False)
+                objects[track.track_id] = track
+            index.rebuild_vocabulary()
+        else:
+            for track_id in removed:
+                index.remove(track_id)
+                del objects[track_id]
+            for track in changed:
+                index.add(track.track_id, self._track_texts(track), cache)
+                objects[track.track_id] = track
+        self._track_map = track_map
+        self._track_count = len(track_map)
+        return len(changed) + len(removed)
+
+    def update_tracks(self, track_ids):
+        """Re-indexes tracks changed in place, removes those no longer in track_map"""
+        self.sync()
+        track_map = self.library.track_map
+        for track_id in track_ids:
+            track = track_map.get(track_id)
+            if track is None:
+                self.tracks.remove(track_id)
+                self._track_objects.pop(track_id, None)
+            else:
+                self.tracks.add(track_id, self._track_texts(track))
+                self._track_objects[track_id] = track
+
+    def search(self, query, limit=20, prefix=True, fuzzy=True):
+        """Returns [(Track ID, score)] of the best matching tracks, best first
+
+        Every term must match a token of a field: exactly, as the prefix of
+        a token for the last term, or one or two edits away when nothing else
+        matched.
+        """
+        self.sync()
+        return self.tracks.search(query, limit, prefix, fuzzy)
+
+    def search_playlists(self, query, limit=20, prefix=True, fuzzy=True):
+        """Returns [(PlayList, score)] of the playlists whose name matches a query, best first"""
+        self.sync()
+        playlists = self._playlist_list
+        return [(playlists[position], score) for position, score in self.playlists.search(query, limit, prefix, fuzzy)]
@@ -0,0 +1,625 @@
+# -*- coding: utf-8 -*-
+"""
+Smart playlists: decoding the Smart Info / Smart Criteria blobs, and recomputing their tracks.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+
+A Smart Criteria blob is a 136 byte SLst header followed by its rules. Each
+rule is a 56 byte header (field id, operator, length of the value) and its
+value: UTF-16BE text, 64-bit big-endian numbers and dates (in seconds since
+1904), or a nested SLst blob for a group of rules.
+"""
+
+import base64
+import logging
+import random
+import struct
+from array import array
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+SMART_CRITERIA_MAGIC = b'SLst'
+
+# Smart Info, byte offsets
+INFO_LIVE_UPDATE_OFFSET = 0
+INFO_MATCH_OFFSET = 1
+INFO_LIMIT_OFFSET = 2
+INFO_LIMIT_METHOD_OFFSET = 3
+INFO_SELECTION_METHOD_OFFSET = 7
+INFO_LIMIT_VALUE_OFFSET = 11        # last byte of a big-endian 32-bit value
+INFO_SELECTION_SIGN_OFFSET = 13
+INFO_LENGTH = 112
+
+# Smart Criteria, byte offsets
+CRITERIA_HEADER_LENGTH = 136
+RULE_COUNT_OFFSET = 11              # last byte of the 32-bit number of rules
+LOGIC_TYPE_OFFSET = 15              # 0: all the rules must match, 1: any rule
+FIELD_OFFSET = 139                  # last byte of the 32-bit field id of the first rule
+
+# rule, byte offsets from the last byte of its field id
+RULE_HEADER_LENGTH = 3              # bytes of a rule before the last byte of its field id
+LOGIC_SIGN_OFFSET = 1
+LOGIC_RANGE_OFFSET = 3              # 1 for "in the range", 2 for "in the last"
+LOGIC_RULE_OFFSET = 4
+VALUE_LENGTH_OFFSET = 52            # last byte of the 32-bit byte length of the value, which follows
+
+# numeric values: 64-bit words, byte offsets from the start of the value
+INT_A_OFFSET = 0
+TIME_VALUE_OFFSET = 8               # "in the last": number of units, negative
+TIME_MULTIPLE_OFFSET = 16           # "in the last": seconds per unit
+INT_B_OFFSET = 24
+INT_B_MULTIPLE_OFFSET = 40
+INT_VALUE_LENGTH = 68
+
+# logic range values
+RANGE_BETWEEN = 0x01
+RANGE_RELATIVE = 0x02
+
+# logic signs
+SIGN_INT_POSITIVE = 0x00
+SIGN_STRING_POSITIVE = 0x01
+SIGN_INT_NEGATIVE = 0x02
+SIGN_STRING_NEGATIVE = 0x03
+
+# logic rules
+RULE_OTHER = 0x00                   # between for numbers and dates, "in the last" for relative dates
+RULE_IS = 0x01
+RULE_CONTAINS = 0x02
+RULE_STARTS = 0x04
+RULE_ENDS = 0x08
+RULE_GREATER = 0x10
+RULE_LESS = 0x40
+
+# first value of relative date rules
+RELATIVE_DATE_MARKER = 0x2dae2dae2dae2dae
+
+KIND_STRING = 'string'
+KIND_INT = 'int'
+KIND_DATE = 'date'
+KIND_BOOL = 'bool'
+KIND_PLAYLIST = 'playlist'
+KIND_GROUP = 'group'
+
+# field id -> (Track attribute, kind)
+SMART_FIELDS = {
+    0x00: (None, KIND_GROUP),
+    0x02: ('name', KIND_STRING),
+    0x03: ('album', KIND_STRING),
+    0x04: ('artist', KIND_STRING),
+    0x05: ('bitrate', KIND_INT),
+    0x06: ('sample_rate', KIND_INT),
+    0x07: ('year', KIND_INT),
+    0x08: ('genre', KIND_STRING),
+    0x09: ('kind', KIND_STRING),
+    0x0a: ('date_modified', KIND_DATE),
+    0x0b: ('track_number', KIND_INT),
+    0x0c: ('size', KIND_INT),
+    0x0d: ('total_time', KIND_INT),
+    0x0e: ('comments', KIND_STRING),
+    0x10: ('date_added', KIND_DATE),
+    0x12: ('composer', KIND_STRING),
+    0x16: ('play_count', KIND_INT),
+    0x17: ('play_date_utc', KIND_DATE),
+    0x18: ('disc_number', KIND_INT),
+    0x19: ('rating', KIND_INT),
+    0x1f: ('compilation', KIND_BOOL),
+    0x23: ('bpm', KIND_INT),
+    0x27: ('grouping', KIND_STRING),
+    0x28: (None, KIND_PLAYLIST),
+    0x44: ('skip_count', KIND_INT),
+    0x45: ('skip_date', KIND_DATE),
+    0x47: ('album_artist', KIND_STRING),
+    0x4e: ('sort_name', KIND_STRING),
+    0x4f: ('sort_album', KIND_STRING),
+    0x50: ('sort_artist', KIND_STRING),
+    0x51: ('sort_album_artist', KIND_STRING),
+    0x52: ('sort_composer', KIND_STRING),
+    0x5a: ('album_rating', KIND_INT),
+}
+
+# limit method -> (Track attribute, units per limit value); None counts tracks
+LIMIT_METHODS = {
+    0x01: ('total_time', 60 * 1000),
+    0x02: ('size', 1 << 20),
+    0x03: (None, 1),
+    0x04: ('total_time', 60 * 60 * 1000),
+    0x05: ('size', 1 << 30),
+}
+
+# selection method -> (Track attribute the limited tracks are chosen by, None for random;
+# True for the largest values first, None when Smart Info tells "most" or "least")
+SELECTION_METHODS = {
+    0x01: ('rating', False),
+    0x02: (None, None),
+    0x05: ('name', False),
+    0x06: ('album', False),
+    0x07: ('artist', False),
+    0x09: ('genre', False),
+    0x15: ('date_added', None),
+    0x19: ('play_count', None),
+    0x1a: ('play_date_utc', None),
+    0x1c: ('rating', True),
+}
+
+_MAC_EPOCH = datetime(1904, 1, 1)
+_INT64 = struct.Struct('>q')
+_UINT32 = struct.Struct('>I')
+
+
+def _blob(text):
+    """Returns the bytes of a <data> value, kept as base64 text by the parsers"""
+    return base64.b64decode(''.join(text.split()))
+
+
+def _int64(data, last_byte):
+    return _INT64.unpack_from(data, last_byte - 7)[0]
+
+
+def mac_date(seconds):
+    """Returns the datetime of a date stored in seconds since 1904-01-01"""
+    return _MAC_EPOCH + timedelta(seconds=seconds)
+
+
+def _casefold(value):
+    if isinstance(value, str):
+        return value.casefold()
+    return value
+
+
+class SmartRule(object):
+    """One condition of a smart playlist: attribute operator value
+
+    For relative dates, value is the length of the period as a timedelta
+    ("in the last value"); for playlist rules it is a Playlist Persistent ID;
+    for a group of rules, a SmartPlaylist holding them.
+    """
+
+    def __init__(self, field_id, operator, negated, value, value_b=None, relative=False):
+        self.field_id = field_id
+        self.attribute, self.kind = SMART_FIELDS.get(field_id, (None, None))
+        self.operator = operator
+        self.negated = negated
+        self.value = value
+        self.value_b = value_b
+        self.relative = relative
+
+    @property
+    def supported(self):
+        if self.kind == KIND_GROUP:
+            return self.value.supported
+        return self.kind is not None
+
+    def __repr__(self):
+        return "<SmartRule %s %s%s %r%s>" % (
+            self.attribute or self.kind or hex(self.field_id), 'not ' if self.negated else '',
+            'in the last' if self.relative else hex(self.operator), self.value,
+            '' if self.value_b is None else ' and %r' % (self.value_b,))
+
+
+class SmartPlaylist(object):
+    """Decoded Smart Info and Smart Criteria of a playlist
+
+    error is the reason the blobs could not be decoded, None if they were.
+    """
+
+    def __init__(self):
+        self.live_update = True
+        self.match_rules = True
+        self.match_all = True
+        self.rules = []
+        self.limit = False
+        self.limit_method = None
+        self.limit_value = None
+        self.selection_method = None
+        self.selection_descending = True
+        self.error = None
+
+    @property
+    def supported(self):
+        """False if the blobs could not be decoded or a rule uses a field the evaluator does not know"""
+        return self.error is None and all(rule.supported for rule in self.rules)
+
+    def iter_rules(self):
+        """Yields the rules, and those of the groups of rules they hold"""
+        for rule in self.rules:
+            yield rule
+            if rule.kind == KIND_GROUP:
+                for nested in rule.value.iter_rules():
+                    yield nested
+
+    def __repr__(self):
+        if self.error is not None:
+            return "<SmartPlaylist not decoded: %s>" % self.error
+        return "<SmartPlaylist match %s of %d rules%s>" % (
+            'all' if self.match_all else 'any', len(self.rules),
+            ', limit %s x%s' % (self.limit_value, self.limit_method) if self.limit else '')
+
+
+def decode_smart_info(text, smart_playlist=None):
+    """Reads the options of a Smart Info blob (base64 text) into a SmartPlaylist, raises ValueError if it is truncated"""
+    if smart_playlist is None:
+        smart_playlist = SmartPlaylist()
+    data = _blob(text)
+    if len(data) <= INFO_SELECTION_SIGN_OFFSET:
+        raise ValueError("Smart Info is %d bytes long, too short to be read" % len(data))
+    smart_playlist.live_update = data[INFO_LIVE_UPDATE_OFFSET] != 0
+    smart_playlist.match_rules = data[INFO_MATCH_OFFSET] != 0
+    smart_playlist.limit = data[INFO_LIMIT_OFFSET] != 0
+    smart_playlist.limit_method = data[INFO_LIMIT_METHOD_OFFSET]
+    smart_playlist.selection_method = data[INFO_SELECTION_METHOD_OFFSET]
+    smart_playlist.limit_value = _UINT32.unpack_from(data, INFO_LIMIT_VALUE_OFFSET - 3)[0]
+    smart_playlist.selection_descending = data[INFO_SELECTION_SIGN_OFFSET] != 0
+    return smart_playlist
+
+
+def _decode_rules(data, smart_playlist):
+    """Reads the rules of the bytes of a Smart Criteria blob into a SmartPlaylist, raises ValueError if it is malformed"""
+    if len(data) < CRITERIA_HEADER_LENGTH or not data.startswith(SMART_CRITERIA_MAGIC):
+        raise ValueError("Smart Criteria is not a SLst blob of at least %d bytes" % CRITERIA_HEADER_LENGTH)
+    smart_playlist.match_all = data[LOGIC_TYPE_OFFSET] != 1
+    rule_count = _UINT32.unpack_from(data, RULE_COUNT_OFFSET - 3)[0]
+    offset = FIELD_OFFSET
+    while offset < len(data):
+        if offset + VALUE_LENGTH_OFFSET >= len(data):
+            raise ValueError("Smart Criteria rule at byte %d is truncated" % (offset - RULE_HEADER_LENGTH))
+        field_id = _UINT32.unpack_from(data, offset - RULE_HEADER_LENGTH)[0]
+        sign = data[offset + LOGIC_SIGN_OFFSET]
+        logic_range = data[offset + LOGIC_RANGE_OFFSET]
+        operator = data[offset + LOGIC_RULE_OFFSET]
+        start = offset + VALUE_LENGTH_OFFSET + 1
+        end = start + _UINT32.unpack_from(data, offset + VALUE_LENGTH_OFFSET - 3)[0]
+        if end > len(data):
+            raise ValueError("Smart Criteria rule at byte %d runs past the end" % (offset - RULE_HEADER_LENGTH))
+        value = data[start:end]
+        offset = end + RULE_HEADER_LENGTH
+        kind = SMART_FIELDS.get(field_id, (None, None))[1]
+
+        if kind is None:
+            # kept as bytes, the rule makes its playlist unsupported
+            smart_playlist.rules.append(SmartRule(field_id, operator, sign in (SIGN_INT_NEGATIVE, SIGN_STRING_NEGATIVE),
+                                                  value))
+            continue
+        if kind == KIND_STRING:
+            smart_playlist.rules.append(SmartRule(field_id, operator, sign == SIGN_STRING_NEGATIVE,
+                                                  value.decode('utf-16-be')))
+            continue
+        if kind == KIND_GROUP:
+            group = SmartPlaylist()
+            _decode_rules(value, group)
+            smart_playlist.rules.append(SmartRule(field_id, operator, False, group))
+            continue
+        if len(value) < INT_B_OFFSET + 8:
+            raise ValueError("Smart Criteria rule at byte %d is too short for a number" % (start - 1))
+        value_a = _INT64.unpack_from(value, INT_A_OFFSET)[0]
+        value_b = _INT64.unpack_from(value, INT_B_OFFSET)[0]
+        negated = sign == SIGN_INT_NEGATIVE
+        if kind == KIND_DATE and logic_range == RANGE_RELATIVE:
+            units = _INT64.unpack_from(value, TIME_VALUE_OFFSET)[0]
+            multiple = _INT64.unpack_from(value, TIME_MULTIPLE_OFFSET)[0]
+            rule = SmartRule(field_id, operator, negated, timedelta(seconds=-units * multiple), relative=True)
+        elif kind == KIND_DATE:
+            rule = SmartRule(field_id, operator, negated, mac_date(value_a), mac_date(value_b))
+        elif kind == KIND_PLAYLIST:
+            rule = SmartRule(field_id, operator, negated, '%016X' % (value_a & 0xFFFFFFFFFFFFFFFF))
+        elif kind == KIND_BOOL:
+            # "is 0" is stored as a positive rule, the evaluator tests for True
+            rule = SmartRule(field_id, operator, negated == bool(value_a), True)
+        else:
+            rule = SmartRule(field_id, operator, negated, value_a, value_b)
+        smart_playlist.rules.append(rule)
+    if len(smart_playlist.rules) != rule_count:
+        raise ValueError("Smart Criteria holds %d rules instead of %d" % (len(smart_playlist.rules), rule_count))
+    return smart_playlist
+
+
+def decode_smart_criteria(text, smart_playlist=None):
+    """Reads the rules of a Smart Criteria blob (base64 text) into a SmartPlaylist
+
+    Raises ValueError if the blob is truncated or malformed.
+    """
+    if smart_playlist is None:
+        smart_playlist = SmartPlaylist()
+    try:
+        return _decode_rules(_blob(text), smart_playlist)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError("Smart Criteria cannot be decoded: %s" % e)
+
+
+def decode_smart_playlist(playlist):
+    """Returns the SmartPlaylist of a PlayList, None if it is not a smart playlist
+
+    Blobs that cannot be decoded give a SmartPlaylist without rules whose
+    error tells why, it is not supported.
+    """
+    if not playlist.smart_criteria:
+        return None
+    smart_playlist = SmartPlaylist()
+    try:
+        decode_smart_criteria(playlist.smart_criteria, smart_playlist)
+        if playlist.smart_info:
+            decode_smart_info(playlist.smart_info, smart_playlist)
+    except ValueError as e:
+        logger.warning("Smart playlist '%s' cannot be decoded: %s", playlist.name, e)
+        smart_playlist = SmartPlaylist()
+        smart_playlist.error = str(e)
+    return smart_playlist
+
+
+def _encode_rules(rules, match_all):
+    """Returns the bytes of a Smart Criteria blob"""
+    data = bytearray(CRITERIA_HEADER_LENGTH)
+    data[0:8] = SMART_CRITERIA_MAGIC + b'\x00\x01\x00\x01'
+    _UINT32.pack_into(data, RULE_COUNT_OFFSET - 3, len(rules))
+    data[LOGIC_TYPE_OFFSET] = 0 if match_all else 1
+    for rule in rules:
+        offset = len(data) + RULE_HEADER_LENGTH
+        data.extend(bytearray(VALUE_LENGTH_OFFSET + 1 + RULE_HEADER_LENGTH))
+        sign = SIGN_INT_NEGATIVE if rule.negated else SIGN_INT_POSITIVE
+        logic_range = 0
+        if rule.kind == KIND_STRING:
+            value = rule.value.encode('utf-16-be')
+            sign = SIGN_STRING_NEGATIVE if rule.negated else SIGN_STRING_POSITIVE
+        elif rule.kind == KIND_GROUP:
+            value = _encode_rules(rule.value.rules, rule.value.match_all)
+        else:
+            value = bytearray(INT_VALUE_LENGTH)
+            multiple = 1
+            if rule.relative:
+                value_a = value_b = RELATIVE_DATE_MARKER
+                multiple = 86400
+                logic_range = RANGE_RELATIVE
+                _INT64.pack_into(value, TIME_VALUE_OFFSET, -int(rule.value.total_seconds()) // multiple)
+            elif rule.kind == KIND_DATE:
+                value_a = int((rule.value - _MAC_EPOCH).total_seconds())
+                value_b = int((rule.value_b - _MAC_EPOCH).total_seconds()) if rule.value_b is not None else value_a
+            elif rule.kind == KIND_PLAYLIST:
+                value_a = value_b = struct.unpack('>q', bytes.fromhex(rule.value))[0]
+            elif rule.kind == KIND_BOOL:
+                value_a = value_b = 0 if rule.negated else 1
+                sign = SIGN_INT_POSITIVE
+            else:
+                value_a = int(rule.value)
+                value_b = int(rule.value_b) if rule.value_b is not None else value_a
+            if rule.operator == RULE_OTHER and not rule.relative:
+                logic_range = RANGE_BETWEEN
+            _INT64.pack_into(value, INT_A_OFFSET, value_a)
+            _INT64.pack_into(value, TIME_MULTIPLE_OFFSET, multiple)
+            _INT64.pack_into(value, INT_B_OFFSET, value_b)
+            _INT64.pack_into(value, INT_B_MULTIPLE_OFFSET, 1)
+        _UINT32.pack_into(data, offset - RULE_HEADER_LENGTH, rule.field_id)
+        data[offset + LOGIC_SIGN_OFFSET] = sign
+        data[offset + LOGIC_RANGE_OFFSET] = logic_range
+        data[offset + LOGIC_RULE_OFFSET] = rule.operator
+        _UINT32.pack_into(data, offset + VALUE_LENGTH_OFFSET - 3, len(value))
+        data.extend(value)
+    return bytes(data)
+
+
+def encode_smart_criteria(rules, match_all=True):
+    """Returns the Smart Criteria blob (base64 text) of SmartRules, the inverse of decode_smart_criteria"""
+    return base64.b64encode(_encode_rules(rules, match_all)).decode('ascii')
+
+
+def encode_smart_info(match_rules=True, live_update=True, limit=False, limit_method=0x03, limit_value=25,
+                      selection_method=0x02, selection_descending=True):
+    """Returns a Smart Info blob (base64 text), the inverse of decode_smart_info"""
+    data = bytearray(INFO_LENGTH)
+    data[INFO_LIVE_UPDATE_OFFSET] = 1 if live_update else 0
+    data[INFO_MATCH_OFFSET] = 1 if match_rules else 0
+    data[INFO_LIMIT_OFFSET] = 1 if limit else 0
+    data[INFO_LIMIT_METHOD_OFFSET] = limit_method
+    data[INFO_SELECTION_METHOD_OFFSET] = selection_method
+    _UINT32.pack_into(data, INFO_LIMIT_VALUE_OFFSET - 3, limit_value)
+    data[INFO_SELECTION_SIGN_OFFSET] = 1 if selection_descending else 0
+    return base64.b64encode(bytes(data)).decode('ascii')
+
+
+class SmartPlaylistEvaluator(object):
+    """Computes the tracks of smart playlists from the tracks of a library
+
+    Rules are answered from the indexes of library.tracks when they can be
+    (is, greater, less, between, in the last, playlist membership) and the
+    others are only tested on the tracks still in question: with match all,
+    the smallest indexed result is intersected first and the remaining rules
+    are checked on its tracks; with match any, a track is no longer tested
+    once a rule matched it. Strings compare case-insensitively, as in iTunes.
+    """
+
+    def __init__(self, library, now=None):
+        self.library = library
+        self.now = now
+        self._folded = {}
+        self._position_by_id = None
+        self._folded_tracks = None
+
+    def _tracks(self):
+        tracks = self.library.tracks.track_list()
+        if tracks is not self._folded_tracks:
+            self._folded_tracks = tracks
+            self._folded = {}
+            self._position_by_id = None
+        return tracks
+
+    def _folded_values(self, attribute):
+        values = self._folded.get(attribute)
+        if values is None:
+            values = self._folded[attribute] = [_casefold(getattr(track, attribute)) for track in self._tracks()]
+        return values
+
+    def _now(self):
+        # track dates are naive UTC datetimes
+        now = self.now
+        if now is None:
+            return datetime.now(timezone.utc).replace(tzinfo=None)
+        if now.tzinfo is not None:
+            return now.astimezone(timezone.utc).replace(tzinfo=None)
+        return now
+
+    def _index_positions(self, rule):
+        """Returns the positions of the tracks matching a rule, ignoring its negation; None without an index"""
+        query = self.library.tracks
+        operator = rule.operator
+        if rule.kind == KIND_GROUP:
+            return self.positions(rule.value)
+        if rule.kind == KIND_PLAYLIST:
+            playlist = self.library.playlist_by_persistent_id.get(rule.value)
+            if playlist is None:
+                return []
+            position_of = self._position_of()
+            return [position_of[track_id] for track_id in playlist.track_id_set() if track_id in position_of]
+        if rule.kind == KIND_STRING:
+            if operator == RULE_IS:
+                return query.casefold_index(rule.attribute).lookup(rule.value)
+            return None
+        if rule.kind == KIND_BOOL:
+            return query.hash_index(rule.attribute).lookup(True)
+        if rule.relative:
+            index = query.sorted_index(rule.attribute)
+            return None if index is None else index.range('gte', self._now() - rule.value)
+        if operator == RULE_IS:
+            return query.hash_index(rule.attribute).lookup(rule.value)
+        index = query.sorted_index(rule.attribute)
+        if index is None:
+            return None
+        if operator == RULE_GREATER:
+            return index.range('gt', rule.value)
+        if operator == RULE_LESS:
+            return index.range('lt', rule.value)
+        if operator == RULE_OTHER:
+            return index.between(rule.value, rule.value_b)
+        return None
+
+    def _position_of(self):
+        tracks = self._tracks()
+        if self._position_by_id is None:
+            self._position_by_id = dict((track.track_id, position) for position, track in enumerate(tracks))
+        return self._position_by_id
+
+    def _matcher(self, rule):
+        """Returns a test of one track position against a rule, ignoring its negation"""
+        operator = rule.operator
+        if rule.kind == KIND_STRING:
+            values = self._folded_values(rule.attribute)
+            operand = rule.value.casefold()
+            if operator == RULE_IS:
+                return lambda position: values[position] == operand
+            if operator == RULE_CONTAINS:
+                return lambda position: values[position] is not None and operand in values[position]
+            if operator == RULE_STARTS:
+                return lambda position: values[position] is not None and values[position].startswith(operand)
+            if operator == RULE_ENDS:
+                return lambda position: values[position] is not None and values[position].endswith(operand)
+            return lambda position: False
+        positions = self._index_positions(rule)
+        if positions is None:
+            return lambda position: False
+        matching = frozenset(positions)
+        return matching.__contains__
+
+    def positions(self, smart_playlist):
+        """Returns the sorted positions in track_map order of the tracks matching the rules"""
+        tracks = self._tracks()
+        rules = smart_playlist.rules if smart_playlist.match_rules else []
+        if not rules:
+            return list(range(len(tracks)))
+
+        if smart_playlist.match_all:
+            indexed = []
+            scanned = []
+            for rule in rules:
+                positions = None if rule.negated else self._index_positions(rule)
+                if positions is None:
+                    scanned.append(rule)
+                else:
+                    indexed.append(positions)
+            if indexed:
+                indexed.sort(key=len)
+                candidates = set(indexed[0])
+                for positions in indexed[1:]:
+                    if not candidates:
+                        return []
+                    candidates.intersection_update(positions)
+                candidates = sorted(candidates)
+            else:
+                candidates = range(len(tracks))
+            for rule in scanned:
+                test = self._matcher(rule)
+                if rule.negated:
+                    candidates = [position for position in candidates if not test(position)]
+                else:
+                    candidates = [position for position in candidates if test(position)]
+                if not candidates:
+                    break
+            return list(candidates)
+
+        matched = set()
+        scanned = []
+        for rule in rules:
+            positions = None if rule.negated else self._index_positions(rule)
+            if positions is None:
+                scanned.append(rule)
+            else:
+                matched.update(positions)
+        if scanned and len(matched) < len(tracks):
+            remaining = [position for position in range(len(tracks)) if position not in matched]
+            for rule in scanned:
+                test = self._matcher(rule)
+                if rule.negated:
+                    hits = [position for position in remaining if not test(position)]
+                else:
+                    hits = [position for position in remaining if test(position)]
+                if hits:
+                    matched.update(hits)
+                    hit_set = set(hits)
+                    remaining = [position for position in remaining if position not in hit_set]
+                if not remaining:
+                    break
+        return sorted(matched)
+
+    def evaluate(self, smart_playlist, seed=None):
+        """Returns the Track IDs of a SmartPlaylist as an array, in track_map order unless limited
+
+        With a limit, tracks are taken in the order of the selection method
+        (random ones are drawn from random.Random(seed)) until the limit is reached.
+        Raises ValueError if the SmartPlaylist is not supported.
+        """
+        if not smart_playlist.supported:
+            raise ValueError("%r cannot be evaluated" % smart_playlist)
+        tracks = self._tracks()
+        positions = self.positions(smart_playlist)
+        if smart_playlist.limit and smart_playlist.limit_method in LIMIT_METHODS:
+            positions = self._limit(smart_playlist, positions, seed)
+        return array('i', [tracks[position].track_id for position in positions])
+
+    def _limit(self, smart_playlist, positions, seed):
+        tracks = self._tracks()
+        attribute, descending = SELECTION_METHODS.get(smart_playlist.selection_method, (None, None))
+        if attribute is None:
+            positions = list(positions)
+            random.Random(seed).shuffle(positions)
+        else:
+            if descending is None:
+                descending = smart_playlist.selection_descending
+            if attribute in ('name', 'album', 'artist', 'genre'):
+                values = self._folded_values(attribute)
+            else:
+                values = [getattr(track, attribute) for track in tracks]
+            with_value = [position for position in positions if values[position] is not None]
+            without_value = [position for position in positions if values[position] is None]
+            with_value.sort(key=values.__getitem__, reverse=descending)
+            positions = with_value + without_value
+
+        size_attribute, unit = LIMIT_METHODS[smart_playlist.limit_method]
+        budget = smart_playlist.limit_value * unit
+        selected = []
+        used = 0
+        for position in positions:
+            amount = 1 if size_attribute is None else getattr(tracks[position], size_attribute) or 0
+            if used + amount > budget:
+                if size_attribute is None:
+                    break
+                continue
+            used += amount
+            selected.append(position)
+        return selected
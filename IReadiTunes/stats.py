@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Library-wide statistics over numeric track columns, with NumPy when it is installed.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import heapq
+from datetime import datetime
+
+from IReadiTunes.IReadiTunes import TRACK_FIELD_NAMES
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# fields that can be aggregated; dates are aggregated as seconds since 1970-01-01 UTC
+NUMERIC_FIELDS = ('size', 'total_time', 'bitrate', 'sample_rate', 'play_count', 'skip_count', 'rating',
+                  'album_rating', 'year', 'artwork_count', 'disc_number', 'disc_count', 'track_number',
+                  'track_count', 'bpm', 'date_modified', 'date_added', 'play_date_utc', 'skip_date',
+                  'release_date')
+DATE_FIELDS = frozenset(('date_modified', 'date_added', 'play_date_utc', 'skip_date', 'release_date'))
+
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch_seconds(value):
+    if value is None:
+        return None
+    return (value - _EPOCH).total_seconds()
+
+
+def _check_aggregate(op):
+    if op not in AGGREGATES:
+        raise ValueError("op must be one of %s" % ", ".join(AGGREGATES))
+
+
+def _python_aggregate(values, op):
+    """Aggregates a list of non-None values"""
+    if op == 'count':
+        return len(values)
+    if not values:
+        return 0.0 if op == 'sum' else None
+    if op == 'sum':
+        return float(sum(values))
+    if op == 'mean':
+        return float(sum(values)) / len(values)
+    if op == 'min':
+        return float(min(values))
+    return float(max(values))
+
+
+class LibraryStats(object):
+    """Aggregates over the tracks of a library, e.g. total play time per genre
+
+    Numeric columns and group keys are extracted from the tracks once and
+    kept until the library is re-parsed or updated. With NumPy, columns are
+    float64 arrays (NaN for missing values) and aggregates run over whole
+    arrays; without it the same results come from plain lists. Missing values
+    are left out of every aggregate. Aggregates are floats, counts ints.
+    """
+
+    def __init__(self, library, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise ImportError("use_numpy=True needs NumPy, which is not installed")
+        self.library = library
+        self.use_numpy = use_numpy
+        self._track_map = None
+        self._track_count = -1
+        self._tracks = []
+        self._columns = {}
+        self._groups = {}
+
+    def _check_fresh(self):
+        track_map = self.library.track_map
+        if track_map is not self._track_map or len(track_map) != self._track_count:
+            self._track_map = track_map
+            self._track_count = len(track_map)
+            self._tracks = list(track_map.values())
+            self._columns = {}
+            self._groups = {}
+        return self._tracks
+
+    def column(self, field):
+        """Returns the values of a numeric field, one per track in track_map order"""
+        if field not in NUMERIC_FIELDS:
+            raise ValueError("Track field '%s' is not numeric" % field)
+        tracks = self._check_fresh()
+        column = self._columns.get(field)
+        if column is None:
+            values = [getattr(track, field) for track in tracks]
+            if field in DATE_FIELDS:
+                values = [_epoch_seconds(value) for value in values]
+            if self.use_numpy:
+                column = numpy.array([numpy.nan if value is None else value for value in values],
+                                     dtype=numpy.float64)
+            else:
+                column = values
+            self._columns[field] = column
+        return column
+
+    def groups(self, field):
+        """Returns (keys, codes): the distinct values of a field, and the position in keys of each track's value"""
+        if field not in TRACK_FIELD_NAMES:
+            raise ValueError("Unknown track field '%s'" % field)
+        tracks = self._check_fresh()
+        groups = self._groups.get(field)
+        if groups is None:
+            position_of = {}
+            keys = []
+            codes = []
+            for track in tracks:
+                value = getattr(track, field)
+                position = position_of.get(value)
+                if position is None:
+                    position = position_of[value] = len(keys)
+                    keys.append(value)
+                codes.append(position)
+            if self.use_numpy:
+                codes = numpy.array(codes, dtype=numpy.intp)
+            groups = self._groups[field] = (keys, codes)
+        return groups
+
+    def aggregate(self, field, op='sum'):
+        """Returns one aggregate of a numeric field over the whole library"""
+        _check_aggregate(op)
+        column = self.column(field)
+        if not self.use_numpy:
+            return _python_aggregate([value for value in column if value is not None], op)
+        values = column[~numpy.isnan(column)]
+        if op == 'count':
+            return int(values.size)
+        if values.size == 0:
+            return 0.0 if op == 'sum' else None
+        return float(getattr(values, op)())
+
+    def total(self, field):
+        return self.aggregate(field, 'sum')
+
+    def mean(self, field):
+        return self.aggregate(field, 'mean')
+
+    def _group_values(self, key_field, value_field, op):
+        """Returns (keys, aggregate of each key) with None for empty groups"""
+        _check_aggregate(op)
+        keys, codes = self.groups(key_field)
+        if value_field is None:
+            if op != 'count':
+                raise ValueError("op '%s' needs a value_field" % op)
+            if self.use_numpy:
+                return keys, numpy.bincount(codes, minlength=len(keys)).tolist()
+            counts = [0] * len(keys)
+            for code in codes:
+                counts[code] += 1
+            return keys, counts
+
+        column = self.column(value_field)
+        if not self.use_numpy:
+            grouped = [[] for _ in keys]
+            for code, value in zip(codes, column):
+                if value is not None:
+                    grouped[code].append(value)
+            return keys, [_python_aggregate(values, op) for values in grouped]
+
+        valid = ~numpy.isnan(column)
+        codes = codes[valid]
+        values = column[valid]
+        counts = numpy.bincount(codes, minlength=len(keys))
+        if op == 'count':
+            return keys, counts.tolist()
+        if op == 'sum':
+            return keys, numpy.bincount(codes, weights=values, minlength=len(keys)).tolist()
+        if op == 'mean':
+            sums = numpy.bincount(codes, weights=values, minlength=len(keys))
+            result = sums / numpy.maximum(counts, 1)
+        else:
+            result = numpy.full(len(keys), numpy.inf if op == 'min' else -numpy.inf)
+            getattr(numpy, 'minimum' if op == 'min' else 'maximum').at(result, codes, values)
+        return keys, [None if count == 0 else value for value, count in zip(result.tolist(), counts.tolist())]
+
+    def group_by(self, key_field, value_field=None, op='sum'):
+        """Returns {key: aggregate of value_field over the tracks with that key}
+
+        Without value_field, returns the number of tracks of each key (op 'count'),
+        e.g. group_by('genre', 'total_time') or group_by('artist', 'play_count', 'mean').
+        """
+        if value_field is None and op == 'sum':
+            op = 'count'
+        keys, values = self._group_values(key_field, value_field, op)
+        return dict(zip(keys, values))
+
+    def top(self, key_field, value_field=None, op='sum', k=10):
+        """Returns the k (key, aggregate) pairs with the largest aggregates, largest first
+
+        Tracks without a key_field value and empty groups are not ranked,
+        e.g. top('artist', 'skip_count', k=5) for the most skipped artists.
+        """
+        if value_field is None and op == 'sum':
+            op = 'count'
+        keys, values = self._group_values(key_field, value_field, op)
+        ranked = [(key, value) for key, value in zip(keys, values) if key is not None and value is not None]
+        return heapq.nlargest(k, ranked, key=lambda pair: pair[1])
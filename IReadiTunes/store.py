@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite store of parsed libraries, and a read-only Library reading it lazily.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+from array import array
+from collections.abc import ItemsView, Mapping, ValuesView
+from datetime import datetime
+from urllib.request import pathname2url
+
+from IReadiTunes.IReadiTunes import (Library, PlayList, TRACK_FIELD_NAMES, PLAYLIST_FIELD_NAMES,
+                                     PLIST_DATE_FORMAT, decode_plist_date, _restore_track,
+                                     _TRACK_LOCATION_INDEX)
+
+# bump when the schema changes
+STORE_FORMAT_VERSION = 1
+
+# Library list holding each kind of track, stored in tracks.media_list
+MEDIA_LISTS = ('song_list', 'movie_list', 'podcast_list', 'tvshow_list', 'audiobook_list')
+
+# indexed columns, besides the primary keys
+TRACK_INDEXED_FIELDS = ('persistent_id', 'name', 'artist', 'album', 'album_artist', 'genre', 'year',
+                        'date_added', 'media_list')
+PLAYLIST_INDEXED_FIELDS = ('playlist_persistent_id', 'parent_persistent_id', 'display_path')
+
+# column kinds, used to give back the Python type of the values
+KIND_BOOL = 'bool'
+KIND_DATE = 'date'
+KIND_VALUE = 'value'
+
+# tracks kept by StoredTrackMap between lookups
+_TRACK_CACHE_SIZE = 65536
+
+_DEFAULT_MMAP_SIZE = 256 << 20
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE columns (table_name TEXT, column_name TEXT, kind TEXT, PRIMARY KEY (table_name, column_name));
+CREATE TABLE tracks (position INTEGER NOT NULL UNIQUE, %(track_columns)s, media_list TEXT);
+CREATE TABLE track_extra (track_id INTEGER, key TEXT, value, kind TEXT,
+                          PRIMARY KEY (track_id, key)) WITHOUT ROWID;
+CREATE TABLE playlists (position INTEGER PRIMARY KEY, %(playlist_columns)s, display_path TEXT);
+CREATE TABLE playlist_extra (playlist_position INTEGER, key TEXT, value, kind TEXT,
+                             PRIMARY KEY (playlist_position, key)) WITHOUT ROWID;
+CREATE TABLE playlist_items (playlist_position INTEGER, item_index INTEGER, track_id INTEGER,
+                             PRIMARY KEY (playlist_position, item_index)) WITHOUT ROWID;
+"""
+
+
+def _value_kind(value):
+    if isinstance(value, bool):
+        return KIND_BOOL
+    if isinstance(value, datetime):
+        return KIND_DATE
+    return KIND_VALUE
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime):
+        return value.strftime(PLIST_DATE_FORMAT)
+    return value
+
+
+def _decode_bool(value):
+    if value is None:
+        return None
+    return bool(value)
+
+
+def _decode_date(value):
+    if value is None:
+        return None
+    return decode_plist_date(value)
+
+
+def _decode_value(value):
+    return value
+
+
+_DECODERS = {KIND_BOOL: _decode_bool, KIND_DATE: _decode_date, KIND_VALUE: _decode_value}
+
+
+def _column_kinds(objects, fields):
+    """Returns the kind of each field: bool or date if all its values are, value otherwise"""
+    kinds = {}
+    for obj in objects:
+        for field in fields:
+            value = getattr(obj, field)
+            if value is None:
+                continue
+            kind = _value_kind(value)
+            previous = kinds.get(field)
+            if previous is None:
+                kinds[field] = kind
+            elif previous != kind:
+                kinds[field] = KIND_VALUE
+    return [(field, kinds.get(field, KIND_VALUE)) for field in fields]
+
+
+def _extra_rows(owner, extra_attributes):
+    for key, value in extra_attributes.items():
+        yield owner, key, _encode_value(value), _value_kind(value)
+
+
+def save_library(library, path):
+    """Writes a parsed library to a new SQLite database at path, replacing it atomically
+
+    Tracks, playlists, playlist members and extra attributes go to separate
+    tables, inserted in one transaction; indexes are created after the rows.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            _write_library(connection, library)
+        finally:
+            connection.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _write_library(connection, library):
+    # the file is private until it is renamed, a crash only loses the temporary file
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    tracks = list(library.track_map.values())
+    playlists = library.playlists
+    track_kinds = _column_kinds(tracks, TRACK_FIELD_NAMES)
+    playlist_kinds = _column_kinds(playlists, PLAYLIST_FIELD_NAMES)
+
+    connection.executescript(_SCHEMA % {
+        'track_columns': ', '.join(field + (' INTEGER PRIMARY KEY' if field == 'track_id' else '')
+                                   for field in TRACK_FIELD_NAMES),
+        'playlist_columns': ', '.join(PLAYLIST_FIELD_NAMES)})
+
+    media_list_of = {}
+    for list_name in MEDIA_LISTS:
+        for track in getattr(library, list_name):
+            media_list_of[id(track)] = list_name
+
+    with connection:
+        connection.executemany("INSERT INTO meta VALUES (?, ?)", [('format_version', str(STORE_FORMAT_VERSION))])
+        connection.executemany("INSERT INTO columns VALUES (?, ?, ?)",
+                               [('tracks', field, kind) for field, kind in track_kinds] +
+                               [('playlists', field, kind) for field, kind in playlist_kinds])
+
+        encoders = [_encode_value if kind != KIND_VALUE else None for _, kind in track_kinds]
+        connection.executemany(
+            "INSERT INTO tracks VALUES (%s)" % ', '.join(['?'] * (len(TRACK_FIELD_NAMES) + 2)),
+            ([position] + [getattr(track, field) if encode is None else encode(getattr(track, field))
+                           for field, encode in zip(TRACK_FIELD_NAMES, encoders)] +
+             [media_list_of.get(id(track))]
+             for position, track in enumerate(tracks)))
+        connection.executemany("INSERT OR REPLACE INTO track_extra VALUES (?, ?, ?, ?)",
+                               (row for track in tracks if track._extra_attributes
+                                for row in _extra_rows(track.track_id, track._extra_attributes)))
+
+        connection.executemany(
+            "INSERT INTO playlists VALUES (%s)" % ', '.join(['?'] * (len(PLAYLIST_FIELD_NAMES) + 2)),
+            ([position] + [_encode_value(getattr(playlist, field)) for field in PLAYLIST_FIELD_NAMES] +
+             [playlist.display_path]
+             for position, playlist in enumerate(playlists)))
+        connection.executemany("INSERT INTO playlist_extra VALUES (?, ?, ?, ?)",
+                               (row for position, playlist in enumerate(playlists)
+                                for row in _extra_rows(position, playlist.extra_attributes)))
+        connection.executemany("INSERT INTO playlist_items VALUES (?, ?, ?)",
+                               ((position, index, track_id) for position, playlist in enumerate(playlists)
+                                for index, track_id in enumerate(playlist.track_ids)))
+
+        for field in TRACK_INDEXED_FIELDS:
+            connection.execute("CREATE INDEX tracks_%s ON tracks (%s)" % (field, field))
+        for field in PLAYLIST_INDEXED_FIELDS:
+            connection.execute("CREATE INDEX playlists_%s ON playlists (%s)" % (field, field))
+        connection.execute("CREATE INDEX playlist_items_track_id ON playlist_items (track_id)")
+    connection.execute("ANALYZE")
+
+
+def connect(path, mmap_size=_DEFAULT_MMAP_SIZE):
+    """Opens a store read-only; with mmap_size > 0 pages are read through a shared memory map
+
+    The connection may be closed from another thread than the one using it.
+    """
+    uri = 'file:%s?mode=ro' % pathname2url(os.path.abspath(path))
+    connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    if mmap_size:
+        connection.execute("PRAGMA mmap_size = %d" % int(mmap_size))
+    row = connection.execute("SELECT value FROM meta WHERE key = 'format_version'").fetchone()
+    if row is None or row[0] != str(STORE_FORMAT_VERSION):
+        connection.close()
+        raise ValueError("%s is not a library store of format %d" % (path, STORE_FORMAT_VERSION))
+    return connection
+
+
+class ThreadConnections(object):
+    """Read-only connections to a store, one per thread, each opened on the first use in its thread
+
+    A SQLite connection is not shared between threads: cursors of a thread
+    would otherwise interleave with the queries of another one. Connections
+    stay open until close, threads are expected to be those of a pool.
+    """
+
+    def __init__(self, path, mmap_size=_DEFAULT_MMAP_SIZE):
+        self.path = path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        # opened now, so that a missing or invalid store fails in the constructor
+        self.get()
+
+    def get(self):
+        """Returns the connection of the calling thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path, self.mmap_size)
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        """Closes the connections of all the threads"""
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+            self._local = threading.local()
+        for connection in connections:
+            connection.close()
+
+
+def _decoders(connection, table_name, fields):
+    kinds = dict(connection.execute("SELECT column_name, kind FROM columns WHERE table_name = ?", (table_name,)))
+    return [_DECODERS[kinds.get(field, KIND_VALUE)] for field in fields]
+
+
+def _decode_extra(rows):
+    return dict((key, _decode_date(value) if kind == KIND_DATE else _decode_bool(value) if kind == KIND_BOOL
+                 else value) for key, value, kind in rows)
+
+
+class _TrackValues(ValuesView):
+    def __iter__(self):
+        for _, track in self._mapping.iter_items():
+            yield track
+
+
+class _TrackItems(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class StoredTrackMap(Mapping):
+    """Track ID -> Track read from a store on access, in the order of the parsed track_map
+
+    connections is a ThreadConnections, each thread reads through its own connection.
+    """
+
+    _SELECT = "SELECT %s FROM tracks" % ', '.join(TRACK_FIELD_NAMES)
+
+    def __init__(self, connections):
+        self.connections = connections
+        self._decoders = _decoders(connections.get(), 'tracks', TRACK_FIELD_NAMES)
+        self._cache = {}
+        self._length = None
+
+    @property
+    def connection(self):
+        return self.connections.get()
+
+    def _make_track(self, row, extra_attributes):
+        values = [decode(value) for decode, value in zip(self._decoders, row)]
+        location = values[_TRACK_LOCATION_INDEX]
+        values[_TRACK_LOCATION_INDEX] = None
+        return _restore_track(values, location, extra_attributes or None)
+
+    def __getitem__(self, track_id):
+        track = self._cache.get(track_id)
+        if track is not None:
+            return track
+        row = self.connection.execute(self._SELECT + " WHERE track_id = ?", (track_id,)).fetchone()
+        if row is None:
+            raise KeyError(track_id)
+        extra = _decode_extra(self.connection.execute(
+            "SELECT key, value, kind FROM track_extra WHERE track_id = ?", (track_id,)))
+        track = self._make_track(row, extra)
+        if len(self._cache) >= _TRACK_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[track_id] = track
+        return track
+
+    def __contains__(self, track_id):
+        if track_id in self._cache:
+            return True
+        return self.connection.execute("SELECT 1 FROM tracks WHERE track_id = ?", (track_id,)).fetchone() is not None
+
+    def __iter__(self):
+        for row in self.connection.execute("SELECT track_id FROM tracks ORDER BY position"):
+            yield row[0]
+
+    def __len__(self):
+        if self._length is None:
+            self._length = self.connection.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        return self._length
+
+    def iter_items(self, where='', parameters=()):
+        """Yields (track_id, Track) of the tracks matching an optional SQL condition, in one query"""
+        condition = " WHERE " + where if where else ""
+        extras = {}
+        for track_id, key, value, kind in self.connection.execute(
+                "SELECT track_id, key, value, kind FROM track_extra"):
+            extras.setdefault(track_id, []).append((key, value, kind))
+        cache = self._cache
+        for row in self.connection.execute(self._SELECT + condition + " ORDER BY position", parameters):
+            track_id = row[0]
+            track = cache.get(track_id)
+            if track is None:
+                track = self._make_track(row, _decode_extra(extras.get(track_id, ())))
+            yield track_id, track
+
+    def values(self):
+        return _TrackValues(self)
+
+    def items(self):
+        return _TrackItems(self)
+
+
+class StoredLibrary(Library):
+    """Read-only Library backed by a store written by save_library
+
+    Tracks are read from the database when they are looked up, playlists and
+    the per-kind track lists the first time they are used. Several processes
+    can open the same store; the file is memory mapped and never locked for
+    writing. Library queries, exports and playlist helpers work as usual, from
+    any thread: each thread reads through its own connection. connection is
+    the one of the calling thread, for SQL reports.
+
+    The indexes of tracks (where, count, get) are built in memory from one
+    read of all the tracks, as on a Library; the SQLite indexes serve SQL
+    queries made through connection.
+    """
+
+    # loaded on first access by __getattr__
+    _PLAYLIST_ATTRIBUTES = ('playlists', 'playlist_by_persistent_id', 'root_playlists', 'playlist_by_display_path')
+
+    def __init__(self, path, mmap_size=_DEFAULT_MMAP_SIZE):
+        Library.__init__(self)
+        self.path = path
+        self.connections = ThreadConnections(path, mmap_size)
+        self.track_map = StoredTrackMap(self.connections)
+        self._load_lock = threading.Lock()
+        for name in self._PLAYLIST_ATTRIBUTES + MEDIA_LISTS:
+            delattr(self, name)
+
+    @property
+    def connection(self):
+        return self.connections.get()
+
+    def __getattr__(self, name):
+        # only called for attributes not loaded yet
+        if name in StoredLibrary._PLAYLIST_ATTRIBUTES:
+            with self._load_lock:
+                if name not in self.__dict__:
+                    self._load_playlists()
+            return self.__dict__[name]
+        if name in MEDIA_LISTS:
+            tracks = [track for _, track in self.track_map.iter_items("media_list = ?", (name,))]
+            setattr(self, name, tracks)
+            return tracks
+        raise AttributeError(name)
+
+    def _load_playlists(self):
+        # built apart and set at the end, other threads never see a partial tree
+        loaded = Library()
+        connection = self.connection
+        decoders = _decoders(connection, 'playlists', PLAYLIST_FIELD_NAMES)
+        extras = {}
+        for position, key, value, kind in connection.execute(
+                "SELECT playlist_position, key, value, kind FROM playlist_extra"):
+            extras.setdefault(position, []).append((key, value, kind))
+        members = {}
+        for position, track_id in connection.execute(
+                "SELECT playlist_position, track_id FROM playlist_items ORDER BY playlist_position, item_index"):
+            track_ids = members.get(position)
+            if track_ids is None:
+                track_ids = members[position] = array('i')
+            track_ids.append(track_id)
+
+        for row in connection.execute("SELECT position, %s FROM playlists ORDER BY position" %
+                                      ', '.join(PLAYLIST_FIELD_NAMES)):
+            position = row[0]
+            playlist = PlayList(*[decode(value) for decode, value in zip(decoders, row[1:])])
+            playlist.track_ids = members.get(position, array('i'))
+            playlist._track_map = self.track_map
+            if position in extras:
+                playlist.add_extra_attributes(_decode_extra(extras[position]))
+            loaded.add_playlist(playlist)
+        loaded.generate_playlist_dislay_paths()
+        self.parse_stats.playlists = loaded.parse_stats.playlists
+        self.parse_stats.memberships = loaded.parse_stats.memberships
+        for name in StoredLibrary._PLAYLIST_ATTRIBUTES:
+            setattr(self, name, getattr(loaded, name))
+
+    def parse(self, *args, **kwargs):
+        raise TypeError("StoredLibrary is read-only, parse the XML file with Library")
+
+    def update(self, *args, **kwargs):
+        raise TypeError("StoredLibrary is read-only, parse the XML file with Library")
+
+    def close(self):
+        self.connections.close()
+
+
+def open_library(path, mmap_size=_DEFAULT_MMAP_SIZE):
+    """Returns a StoredLibrary reading the store at path"""
+    return StoredLibrary(path, mmap_size)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Keeping a Library up to date with its file: change detection, debouncing and refresh.
+Mickael <mickael2054dev@gmail.com>
+MIT License
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+from IReadiTunes.IReadiTunes import Library
+
+logger = logging.getLogger(__name__)
+
+# inotify events of the library directory: the file rewritten in place or renamed over
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def file_state(path):
+    """Returns (size, mtime_ns, inode) of a file, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def is_complete(path):
+    """Returns True if the file looks completely written: a closed XML plist or a binary plist trailer"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(8)
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 64))
+            tail = f.read()
+    except OSError:
+        return False
+    if head == b'bplist00':
+        if len(tail) < 32:
+            return False
+        table_offset = struct.unpack('>Q', tail[-8:])[0]
+        return 8 <= table_offset < size - 32
+    return tail.rstrip().endswith(b'</plist>')
+
+
+class _Inotify(object):
+    """Minimal inotify watch of one directory, through the C library"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed")
+
+    def wait(self, timeout):
+        """Waits for events up to timeout seconds, returns the names of the files they concern"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        names = []
+        if not readable:
+            return names
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return names
+        position = 0
+        while position + _INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = _INOTIFY_EVENT.unpack_from(data, position)
+            position += _INOTIFY_EVENT.size
+            names.append(os.fsdecode(data[position:position + length].rstrip(b'\0')))
+            position += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _open_inotify(directory):
+    try:
+        return _Inotify(directory)
+    except (OSError, AttributeError, TypeError):
+        # not Linux, or no inotify in the C library
+        return None
+
+
+class LibraryWatcher(object):
+    """Refreshes a Library when its file is rewritten, and notifies subscribers
+
+    The file is stat'ed every interval seconds (with inotify, changes are
+    also noticed as soon as they happen). A change is only read once the file
+    has not changed for debounce seconds and looks completely written. XML
+    files are refreshed with Library.update, binary plists are parsed again.
+    The new state is swapped into the library in one step (Library.set_state);
+    a thread needing several attributes from the same version should read
+    them from one get_state() call. Subscribers are called as
+    callback(library, changes) from the watching thread.
+    """
+
+    def __init__(self, library, path, interval=1.0, debounce=2.0, use_inotify=None):
+        self.library = library
+        self.path = path
+        self.interval = interval
+        self.debounce = debounce
+        self.use_inotify = use_inotify
+        self.refresh_count = 0
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._loaded_state = file_state(path)
+        self._seen_state = self._loaded_state
+        self._seen_since = time.monotonic()
+
+    def subscribe(self, callback):
+        """Calls callback(library, changes) after each refresh; changes is a LibraryChanges"""
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def check(self):
+        """Stats the file and refreshes the library if it changed and settled, returns True if it was refreshed"""
+        state = file_state(self.path)
+        now = time.monotonic()
+        if state != self._seen_state:
+            self._seen_state = state
+            self._seen_since = now
+            return False
+        if state is None or state == self._loaded_state or now - self._seen_since < self.debounce:
+            return False
+        if not is_complete(self.path):
+            return False
+        self.refresh(state)
+        return True
+
+    def refresh(self, state=None):
+        """Re-reads the file into the library now and notifies the subscribers, returns the LibraryChanges"""
+        with self._lock:
+            if state is None:
+                state = file_state(self.path)
+            try:
+                changes = self._reload()
+            except Exception:
+                logger.exception("Could not refresh the library from %s", self.path)
+                # retried when the file changes again
+                self._loaded_state = state
+                return None
+            self._loaded_state = state
+            self.refresh_count += 1
+        for callback in list(self._subscribers):
+            try:
+                callback(self.library, changes)
+            except Exception:
+                logger.exception("Library subscriber %r failed", callback)
+        return changes
+
+    def _reload(self):
+        from IReadiTunes.bplist import is_binary_plist
+        if not is_binary_plist(self.path):
+            return self.library.update(self.path)
+        from IReadiTunes.diff import diff_libraries
+        parsed = Library()
+        parsed.parse(self.path)
+        changes = diff_libraries(self.library, parsed)
+        self.library.set_state(parsed.get_state())
+        return changes
+
+    def start(self):
+        """Starts watching in a daemon thread"""
+        if self._thread is not None:
+            return self
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='LibraryWatcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the watching thread and waits for it"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        inotify = None
+        if self.use_inotify or self.use_inotify is None:
+            inotify = _open_inotify(os.path.dirname(os.path.abspath(self.path)) or '.')
+            if inotify is None and self.use_inotify:
+                logger.warning("inotify is not available, falling back to stat polling")
+        name = os.path.basename(self.path)
+        try:
+            while not self._stopped.is_set():
+                if inotify is not None:
+                    if name in inotify.wait(self.interval):
+                        # restart the quiet period from the write
+                        self._seen_state = None
+                else:
+                    self._stopped.wait(self.interval)
+                if not self._stopped.is_set():
+                    self.check()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
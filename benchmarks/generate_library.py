@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Writes synthetic "iTunes Music Library.xml" files for benchmarks.
+
+    python benchmarks/generate_library.py 10k library_10k.xml
+
+Libraries look like iTunes exports: songs, movies, podcasts, TV shows and
+audiobooks, shared albums and artists, repeated timestamps, non-ASCII and
+escaped names, unknown extra keys, nested playlist folders and smart
+playlists. The same size and seed always give the same file.
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+
+_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+\t<key>Major Version</key><integer>1</integer>
+\t<key>Minor Version</key><integer>1</integer>
+\t<key>Date</key><date>2020-06-01T12:00:00Z</date>
+\t<key>Application Version</key><string>12.9.5.5</string>
+\t<key>Features</key><integer>5</integer>
+\t<key>Show Content Ratings</key><true/>
+\t<key>Music Folder</key><string>file:///Users/someone/Music/iTunes/iTunes%20Media/</string>
+\t<key>Library Persistent ID</key><string>0123456789ABCDEF</string>
+'''
+
+_GENRES = ['Rock', 'Pop', 'Jazz', 'Classical', 'Electronic', 'Hip-Hop', 'Folk', 'Metal', 'Soundtrack',
+           'R&B', 'Country', 'Blues', 'Reggae', u'Chanson française', 'Podcast']
+_WORDS = ['love', 'night', 'blue', 'fire', 'road', 'dream', 'heart', 'light', 'rain', 'city', 'river',
+          'ghost', 'gold', 'summer', 'dance', u'café', u'über', u'naïve', u'東京', 'rock & roll', '<live>']
+
+# a real library was imported over a few hundred sessions, dates repeat a lot
+_IMPORT_SESSIONS = 300
+
+# base64 "Smart Info" / "Smart Criteria" blobs written by iTunes, from the tests of itunessmart
+# (https://github.com/cvzi/itunessmart, MIT License, Copyright (c) cuzi 2018)
+
+# live updating, no limit
+_INFO = ('AQEAAwAAAAIAAAAZAAAAAAAAAAcAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+         'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA==')
+# live updating, limited to 9876 MB selected by random
+_INFO_LIMIT_MB_RANDOM = ('AQEBAgAAAAIAACaUAAAAAAAAAAcAAAAAAAAAAAAAAAAAAAAAAAAA'
+                         'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                         'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA==')
+# live updating, limited to 25 items selected by highest rating
+_INFO_LIMIT_25_RATED = ('AQEBAwAAABwAAAAZAQAAAAAAAAcAAAAAAAAAAAAAAAAAAAAAAAAA'
+                        'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                        'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA==')
+# Date Modified is after 3/16/2015
+_MODIFIED_AFTER = ('U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAoAAAAQAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAANEtHv8AAAAAAAAAAAAAAAAAAAAB'
+                   'AAAAANEtHv8AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Date Added is in the last 1 weeks
+_ADDED_IN_LAST_WEEK = ('U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                       'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                       'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABAAAAIAAAAAAAAAAAAAAAAAAAAAAAAA'
+                       'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABELa4tri2uLa7//////////wAAAAAACTqA'
+                       'La4tri2uLa4AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Date Added is not in the last 1 months
+_ADDED_NOT_IN_LAST_MONTH = ('U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                            'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                            'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABACAAIAAAAAAAAAAAAAAAAAAAAAAAAA'
+                            'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABELa4tri2uLa7//////////wAAAAAAKBmg'
+                            'La4tri2uLa4AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Artist contains "A" and all of (Artist contains "Ap", Artist contains "OB")
+_ARTIST_ALL_GROUP = ('U0xzdAABAAEAAAACAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                     'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                     'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAQBAAACAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                     'AAAAAAAAAAAAAAAAAAAAAAAAAAACAEEAAAAAAAAAAQEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                     'AAAAAAAAAAAAAAAAAAAAAAAAAAABAFNMc3QAAQABAAAAAgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                     'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                     'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEAQAAAgAAAAAA'
+                     'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABABBAHAAAAAEAQAAAgAA'
+                     'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABABPAEI=')
+# Plays > 15 and any of (Plays > 16, Plays > 17, Plays > 18) and Rating > 89
+_PLAYS_ANY_GROUP = ('U0xzdAABAAEAAAADAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAAAAAAAAAAAAABYAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAABEAAAAAAAAAA8AAAAAAAAAAAAAAAAAAAABAAAAAAAAAA8AAAAAAAAAAAAAAAAAAAAB'
+                    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAQEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAAAAAAAB/FNMc3QAAQABAAAAAwAAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAWAAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAARAAAAAAAAAAQAAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAQ'
+                    'AAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAFgAAABAAAAAAAAAAAAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEQAAAAAAAAAEQAAAAAAAAAAAAAAAAAAAAEAAAAA'
+                    'AAAAEQAAAAAAAAAAAAAAAAAAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABYAAAAQAAAAAAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAAAAAABIAAAAAAAAAAAAAAAAAAAAB'
+                    'AAAAAAAAABIAAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAZAAAAEAAAAAAAAAAA'
+                    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAARAAAAAAAAABZAAAAAAAAAAAAAAAA'
+                    'AAAAAQAAAAAAAABZAAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAA')
+# any of (Media Kind is Music, Media Kind is Music Video) and any of (BPM is 60,
+# BPM is in the range of 70 to 80)
+_MEDIA_KIND_BPM = ('U0xzdAABAAEAAAACAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABAQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAGAU0xzdAABAAEAAAACAAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAADwAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAAAAAAAEAAAAAAAAAAAAAAAAAAAABAAAAAAAAAAEAAAAA'
+                   'AAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA8AAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAARAAAAAAAAAAgAAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAg'
+                   'AAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEBAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAYBTTHN0AAEAAQAAAAIAAAABAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAIwAAAAEAAAAA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEQAAAAAAAAAPAAAAAAAAAAA'
+                   'AAAAAAAAAAEAAAAAAAAAPAAAAAAAAAAAAAAAAAAAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAACMAAAEA'
+                   'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAAAAAAEYAAAAA'
+                   'AAAAAAAAAAAAAAABAAAAAAAAAFAAAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+
+# (Smart Info, Smart Criteria) of the smart playlists, in turn; the last ones hold rules on Media Kind,
+# which the smart playlist evaluator does not support, like most smart playlists of real libraries
+_SMART_BLOBS = [(_INFO, _MODIFIED_AFTER), (_INFO, _ADDED_IN_LAST_WEEK),
+                (_INFO_LIMIT_MB_RANDOM, _ADDED_NOT_IN_LAST_MONTH), (_INFO, _ARTIST_ALL_GROUP),
+                (_INFO, _PLAYS_ANY_GROUP), (_INFO_LIMIT_25_RATED, _MEDIA_KIND_BPM)]
+
+def _date(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _title(rand, words):
+    return ' '.join(rand.choice(_WORDS) for _ in range(words)).title()
+
+
+def _write_value(write, indent, key, value):
+    if value is True or value is False:
+        write('%s<key>%s</key><%s/>\n' % (indent, escape(key), 'true' if value else 'false'))
+    elif isinstance(value, int):
+        write('%s<key>%s</key><integer>%d</integer>\n' % (indent, escape(key), value))
+    elif isinstance(value, datetime):
+        write('%s<key>%s</key><date>%s</date>\n' % (indent, escape(key), _date(value)))
+    elif isinstance(value, tuple):
+        # ('data', base64 text)
+        write('%s<key>%s</key>\n%s<data>\n%s%s\n%s</data>\n' % (indent, escape(key), indent, indent,
+                                                                ('\n' + indent).join(value[1][i:i + 60] for i in
+                                                                                     range(0, len(value[1]), 60)),
+                                                                indent))
+    else:
+        write('%s<key>%s</key><string>%s</string>\n' % (indent, escape(key), escape(value)))
+
+
+def _track(rand, track_id, artists, sessions):
+    artist = rand.choice(artists)
+    album_index = rand.randrange(len(artist[1]))
+    album = artist[1][album_index]
+    roll = rand.random()
+    added = sessions[rand.randrange(len(sessions))]
+    track = [("Track ID", track_id),
+             ("Name", _title(rand, rand.randint(1, 4))),
+             ("Artist", artist[0])]
+    if rand.random() < 0.3:
+        track.append(("Album Artist", artist[0]))
+    if rand.random() < 0.2:
+        track.append(("Composer", rand.choice(artists)[0]))
+    track += [("Album", album),
+              ("Genre", artist[2]),
+              ("Kind", "AAC audio file" if rand.random() < 0.6 else "MPEG audio file"),
+              ("Size", rand.randint(2000000, 15000000)),
+              ("Total Time", rand.randint(90000, 480000)),
+              ("Disc Number", 1), ("Disc Count", 1),
+              ("Track Number", rand.randint(1, 14)), ("Track Count", 14),
+              ("Year", rand.randint(1955, 2020)),
+              ("Date Modified", added + timedelta(days=rand.randint(0, 3))),
+              ("Date Added", added),
+              ("Bit Rate", rand.choice([128, 192, 256, 320])),
+              ("Sample Rate", 44100)]
+    if rand.random() < 0.6:
+        played = added + timedelta(days=rand.randint(1, 400), seconds=rand.randint(0, 86400))
+        track += [("Play Count", rand.randint(1, 120)),
+                  ("Play Date", 3600000000 + rand.randint(0, 10 ** 8)),
+                  ("Play Date UTC", played)]
+    if rand.random() < 0.15:
+        track += [("Skip Count", rand.randint(1, 10)),
+                  ("Skip Date", added + timedelta(days=rand.randint(1, 400)))]
+    if rand.random() < 0.3:
+        track.append(("Rating", rand.choice([20, 40, 60, 80, 100])))
+    if rand.random() < 0.3:
+        track += [("Album Rating", 60), ("Album Rating Computed", True)]
+    if rand.random() < 0.05:
+        track.append(("Loved", True))
+    if rand.random() < 0.1:
+        track.append(("Compilation", True))
+    if rand.random() < 0.3:
+        track += [("Sort Name", track[1][1].lower()), ("Sort Artist", artist[0].lower())]
+    if rand.random() < 0.05:
+        track.append(("Comments", _title(rand, 6)))
+    if rand.random() < 0.05:
+        track.append(("Grouping", _title(rand, 2)))
+    if rand.random() < 0.08:
+        # keys this package does not know, kept in extra_attributes
+        track.append(("Volume Adjustment", rand.randint(-100, 100)))
+    if rand.random() < 0.02:
+        track.append(("Playlist Only", True))
+    track.append(("Persistent ID", '%016X' % rand.getrandbits(64)))
+    track.append(("Track Type", "File"))
+
+    media = 'Music'
+    if roll < 0.03:
+        track += [("Movie", True), ("Has Video", True), ("HD", rand.random() < 0.5),
+                  ("Video Width", 1920), ("Video Height", 1080)]
+        media = 'Movies'
+    elif roll < 0.06:
+        track += [("Podcast", True), ("Unplayed", rand.random() < 0.5)]
+        media = 'Podcasts'
+    elif roll < 0.08:
+        track += [("TV Show", True), ("Series", album), ("Season", rand.randint(1, 6)),
+                  ("Episode Order", rand.randint(1, 24))]
+        media = 'TV Shows'
+    elif roll < 0.09:
+        media = 'Audiobooks'
+    location = 'file:///Users/someone/Music/iTunes/iTunes%%20Media/%s/%s/%s/%02d%%20%s.m4a' % (
+        quote(media), quote(artist[0]), quote(album), track_id % 100, quote(track[1][1]))
+    track.append(("Location", location))
+    track += [("File Folder Count", 5), ("Library Folder Count", 1)]
+    return track
+
+
+def _artists(rand, track_count):
+    artists = []
+    for index in range(max(10, track_count // 40)):
+        name = _title(rand, rand.randint(1, 3)) + (' %d' % index)
+        albums = [_title(rand, rand.randint(1, 3)) for _ in range(rand.randint(1, 6))]
+        artists.append((name, albums, rand.choice(_GENRES)))
+    return artists
+
+
+def _playlists(rand, track_ids, playlist_count):
+    """Returns [(attributes, members)], with a master playlist, distinguished ones, nested folders and smart playlists"""
+    playlists = []
+    persistent_ids = iter('%016X' % (0x4000000000000000 + index) for index in range(playlist_count + 16))
+    playlists.append(([("Name", "Library"), ("Description", ""), ("Master", True), ("Visible", False),
+                       ("Playlist ID", 100000), ("Playlist Persistent ID", next(persistent_ids)),
+                       ("All Items", True)], track_ids))
+    for offset, (name, kind) in enumerate([("Music", 4), ("Movies", 2), ("Podcasts", 10), ("Downloaded", 65)]):
+        playlists.append(([("Name", name), ("Description", ""), ("Playlist ID", 100001 + offset),
+                           ("Playlist Persistent ID", next(persistent_ids)), ("Distinguished Kind", kind),
+                           ("All Items", True)], rand.sample(track_ids, len(track_ids) // 3)))
+
+    folders = []
+    for index in range(len(playlists), playlist_count):
+        attributes = [("Name", _title(rand, rand.randint(1, 3))), ("Description", ""),
+                      ("Playlist ID", 100000 + index), ("Playlist Persistent ID", next(persistent_ids))]
+        if folders and rand.random() < 0.7:
+            attributes.append(("Parent Persistent ID", rand.choice(folders)))
+        members = []
+        if rand.random() < 0.15:
+            attributes.append(("Folder", True))
+            folders.append(attributes[3][1])
+        else:
+            members = rand.sample(track_ids, min(len(track_ids), int(rand.paretovariate(1.2) * 20)))
+            if rand.random() < 0.2:
+                info, criteria = _SMART_BLOBS[index % len(_SMART_BLOBS)]
+                attributes += [("Smart Info", ('data', info)), ("Smart Criteria", ('data', criteria))]
+        attributes.append(("All Items", True))
+        playlists.append((attributes, members))
+    return playlists
+
+
+def generate_library(path, track_count, playlist_count=None, seed=0):
+    """Writes a synthetic library with track_count tracks to path"""
+    rand = random.Random(seed)
+    if playlist_count is None:
+        playlist_count = max(20, min(5000, track_count // 50))
+    base = datetime(2008, 1, 1, 9, 30)
+    sessions = sorted(base + timedelta(days=rand.randint(0, 4000), seconds=rand.randint(0, 86400))
+                      for _ in range(_IMPORT_SESSIONS))
+    artists = _artists(rand, track_count)
+    track_ids = []
+    with open(path, 'w', encoding='utf-8') as f:
+        write = f.write
+        write(_HEADER)
+        write('\t<key>Tracks</key>\n\t<dict>\n')
+        for index in range(track_count):
+            track_id = 1000 + 2 * index
+            track_ids.append(track_id)
+            write('\t\t<key>%d</key>\n\t\t<dict>\n' % track_id)
+            for key, value in _track(rand, track_id, artists, sessions):
+                _write_value(write, '\t\t\t', key, value)
+            write('\t\t</dict>\n')
+        write('\t</dict>\n\t<key>Playlists</key>\n\t<array>\n')
+        for attributes, members in _playlists(rand, track_ids, playlist_count):
+            write('\t\t<dict>\n')
+            for key, value in attributes:
+                _write_value(write, '\t\t\t', key, value)
+            if members:
+                write('\t\t\t<key>Playlist Items</key>\n\t\t\t<array>\n')
+                for track_id in members:
+                    write('\t\t\t\t<dict>\n\t\t\t\t\t<key>Track ID</key><integer>%d</integer>\n\t\t\t\t</dict>\n'
+                          % track_id)
+                write('\t\t\t</array>\n')
+            write('\t\t</dict>\n')
+        write('\t</array>\n</dict>\n</plist>\n')
+
+
+def parse_size(text):
+    """Returns the track count of '10k', '1m' or '2500'"""
+    text = text.strip().lower()
+    if text in SIZES:
+        return SIZES[text]
+    if text.endswith('k'):
+        return int(float(text[:-1]) * 1000)
+    if text.endswith('m'):
+        return int(float(text[:-1]) * 1000000)
+    return int(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic iTunes library XML file")
+    parser.add_argument('size', help="number of tracks: 1k, 10k, 100k, 1m or a number")
+    parser.add_argument('path', help="output XML file")
+    parser.add_argument('--playlists', type=int, default=None, help="number of playlists")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_library(args.path, parse_size(args.size), args.playlists, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Times and memory-profiles IReadiTunes on synthetic libraries.
+
+    python benchmarks/run_benchmarks.py --sizes 1k,10k --output results.json
+    python benchmarks/run_benchmarks.py --sizes 1k,10k --compare results.json
+
+Libraries are generated once into --fixtures (benchmarks/fixtures by default).
+Each phase is timed --repeat times (best and median are kept), then run once
+more under tracemalloc for its peak memory. Results are written as JSON so
+that runs of different versions can be compared with --compare.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import IReadiTunes  # noqa: E402
+from generate_library import generate_library, parse_size  # noqa: E402
+
+DEFAULT_SIZES = '1k,10k'
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture_path(fixtures_dir, size_name):
+    """Returns the synthetic library of a size, generating it on first use"""
+    path = os.path.join(fixtures_dir, 'library_%s.xml' % size_name)
+    if not os.path.exists(path):
+        os.makedirs(fixtures_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        generate_library(tmp_path, parse_size(size_name))
+        os.replace(tmp_path, path)
+    return path
+
+
+def _parsed_root(path):
+    return ET.parse(path).getroot()
+
+
+def _library_with_root(path):
+    library = IReadiTunes.lib_init()
+    library.lib = _parsed_root(path)
+    return library
+
+
+def _library_with_tracks(path):
+    library = _library_with_root(path)
+    library.read_tracks()
+    return library
+
+
+def _parsed_library(path):
+    library = IReadiTunes.lib_init()
+    library.parse(path)
+    return library
+
+
+def phases(path):
+    """Returns [(name, setup, run)]; setup() prepares the input of run, only run is measured"""
+    return [
+        ('parse', lambda: path, lambda p: IReadiTunes.lib_init().parse(p)),
+        ('parse_streaming', lambda: path, lambda p: IReadiTunes.lib_init().parse(p, streaming=True)),
+        ('read_tracks', lambda: _library_with_root(path), lambda library: library.read_tracks()),
+        ('read_playlists', lambda: _library_with_tracks(path), lambda library: library.read_playlists()),
+        ('generate_playlist_dislay_paths', lambda: _parsed_library(path),
+         lambda library: library.generate_playlist_dislay_paths()),
+        ('tracks_get_as_dict', lambda: _parsed_library(path),
+         lambda library: [track.get_as_dict() for track in library.track_map.values()]),
+        ('playlists_get_as_dict', lambda: _parsed_library(path),
+         lambda library: [playlist.get_as_dict() for playlist in library.playlists]),
+    ]
+
+
+def measure(setup, run, repeat):
+    """Returns timings and the tracemalloc peak of run(setup())"""
+    timings = []
+    for _ in range(repeat):
+        argument = setup()
+        gc.collect()
+        start = time.perf_counter()
+        run(argument)
+        timings.append(time.perf_counter() - start)
+        del argument
+
+    argument = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del argument
+    return {'best_seconds': min(timings), 'median_seconds': statistics.median(timings),
+            'repeat': repeat, 'peak_memory_bytes': peak}
+
+
+def run_benchmarks(size_names, repeat, fixtures_dir, only=None):
+    results = []
+    for size_name in size_names:
+        path = fixture_path(fixtures_dir, size_name)
+        for name, setup, run in phases(path):
+            if only and name not in only:
+                continue
+            result = measure(setup, run, repeat)
+            result.update({'size': size_name, 'tracks': parse_size(size_name), 'phase': name,
+                           'file_bytes': os.path.getsize(path)})
+            results.append(result)
+            print("%-6s %-32s best %9.4fs  median %9.4fs  peak %8.1f MB" % (
+                size_name, name, result['best_seconds'], result['median_seconds'],
+                result['peak_memory_bytes'] / 1e6))
+            sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline_path):
+    """Prints the time and memory ratios of results against a previous results file"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = dict(((entry['size'], entry['phase']), entry) for entry in baseline['results'])
+    print("\ncompared to %s (%s):" % (baseline_path, baseline['meta'].get('version')))
+    for entry in results:
+        old = previous.get((entry['size'], entry['phase']))
+        if old is None:
+            continue
+        print("%-6s %-32s time x%.2f  memory x%.2f" % (
+            entry['size'], entry['phase'], entry['best_seconds'] / max(old['best_seconds'], 1e-9),
+            entry['peak_memory_bytes'] / float(max(old['peak_memory_bytes'], 1))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IReadiTunes on synthetic libraries")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="comma separated sizes, e.g. 1k,10k,100k,1m")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--phases', default=None, help="comma separated phases to run, all by default")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help="directory of the generated libraries")
+    parser.add_argument('--output', default=None, help="JSON file to write the results to")
+    parser.add_argument('--compare', default=None, help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+    # unknown-key reports of the parser are not part of the measurement
+    logging.getLogger('IReadiTunes').setLevel(logging.ERROR)
+
+    size_names = [size.strip().lower() for size in args.sizes.split(',') if size.strip()]
+    only = set(args.phases.split(',')) if args.phases else None
+    results = run_benchmarks(size_names, args.repeat, args.fixtures, only)
+    report = {
+        'meta': {
+            'version': IReadiTunes.__version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
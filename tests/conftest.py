@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Small iTunes library XML files written for the tests.
+"""
+
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+import pytest
+
+MEDIA_LISTS = ('song_list', 'movie_list', 'podcast_list', 'tvshow_list', 'audiobook_list')
+
+_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+\t<key>Major Version</key><integer>1</integer>
+\t<key>Minor Version</key><integer>1</integer>
+\t<key>Date</key><date>2020-06-01T12:00:00Z</date>
+\t<key>Application Version</key><string>12.9.5.5</string>
+\t<key>Music Folder</key><string>file:///Users/me/Music/iTunes/iTunes%20Media/</string>
+\t<key>Library Persistent ID</key><string>0123456789ABCDEF</string>
+'''
+
+
+def _value(indent, key, value):
+    if value is True or value is False:
+        return '%s<key>%s</key><%s/>\n' % (indent, escape(key), 'true' if value else 'false')
+    if isinstance(value, int):
+        return '%s<key>%s</key><integer>%d</integer>\n' % (indent, escape(key), value)
+    if isinstance(value, datetime):
+        return '%s<key>%s</key><date>%s</date>\n' % (indent, escape(key), value.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    if isinstance(value, tuple):
+        # ('data', base64 text)
+        return '%s<key>%s</key>\n%s<data>\n%s%s\n%s</data>\n' % (indent, escape(key), indent, indent, value[1], indent)
+    return '%s<key>%s</key><string>%s</string>\n' % (indent, escape(key), escape(value))
+
+
+def library_xml(tracks, playlists=()):
+    """Returns the text of a library of tracks [[(key, value)]] and playlists [([(key, value)], [track id])]"""
+    parts = [_HEADER, '\t<key>Tracks</key>\n\t<dict>\n']
+    for track in tracks:
+        parts.append('\t\t<key>%d</key>\n\t\t<dict>\n' % dict(track)['Track ID'])
+        parts.extend(_value('\t\t\t', key, value) for key, value in track)
+        parts.append('\t\t</dict>\n')
+    parts.append('\t</dict>\n\t<key>Playlists</key>\n\t<array>\n')
+    for attributes, members in playlists:
+        parts.append('\t\t<dict>\n')
+        parts.extend(_value('\t\t\t', key, value) for key, value in attributes)
+        if members:
+            parts.append('\t\t\t<key>Playlist Items</key>\n\t\t\t<array>\n')
+            for track_id in members:
+                parts.append('\t\t\t\t<dict>\n\t\t\t\t\t<key>Track ID</key><integer>%d</integer>\n\t\t\t\t</dict>\n'
+                             % track_id)
+            parts.append('\t\t\t</array>\n')
+        parts.append('\t\t</dict>\n')
+    parts.append('\t</array>\n</dict>\n</plist>\n')
+    return ''.join(parts)
+
+
+@pytest.fixture
+def write_library(tmp_path):
+    """Returns a function writing library_xml(tracks, playlists) to a file and returning its path
+
+    With another encoding than UTF-8, the file declares and uses it.
+    """
+    def write(tracks, playlists=(), name='iTunes Music Library.xml', encoding='UTF-8'):
+        text = library_xml(tracks, playlists)
+        if encoding != 'UTF-8':
+            text = text.replace('encoding="UTF-8"', 'encoding="%s"' % encoding)
+        path = tmp_path / name
+        path.write_bytes(text.encode(encoding))
+        return str(path)
+    return write
+
+
+def snapshot(library):
+    """Returns the content of a parsed library as plain values, equal for two parses of the same file"""
+    return {
+        'tracks': [(track_id, track.get_as_dict()) for track_id, track in library.track_map.items()],
+        'lists': dict((name, [track.track_id for track in getattr(library, name)]) for name in MEDIA_LISTS),
+        'playlists': [(playlist.get_as_dict(include_tracks=False), list(playlist.track_ids),
+                       [track.name for _, track in playlist.tracks],
+                       [child.playlist_persistent_id for child in playlist.children])
+                      for playlist in library.playlists],
+        'roots': [playlist.playlist_persistent_id for playlist in library.root_playlists],
+        'display_paths': sorted(library.playlist_by_display_path),
+    }
+
+
+@pytest.fixture
+def library_snapshot():
+    """Returns snapshot(library)"""
+    return snapshot
+
+
+@pytest.fixture
+def library_text():
+    """Returns library_xml(tracks, playlists), for tests rewriting a library file"""
+    return library_xml
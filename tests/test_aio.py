@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+aparse: parsing off the event loop, with progress and cancellation.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import IReadiTunes.IReadiTunes as IReadiTunes
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.aio import aparse
+
+TRACKS = [[("Track ID", track_id), ("Name", "Track %d" % track_id), ("Genre", "Rock" if track_id % 2 else "Jazz")]
+          for track_id in range(1, 26)]
+PLAYLISTS = [([("Name", "Odd"), ("Playlist ID", 100)], list(range(1, 26, 2)))]
+
+
+@pytest.fixture(autouse=True)
+def progress_interval(monkeypatch):
+    monkeypatch.setattr(IReadiTunes, 'PROGRESS_INTERVAL', 10)
+
+
+def _parse(path):
+    library = Library()
+    library.parse(path)
+    return library
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+def test_aparse(write_library, library_snapshot, streaming):
+    path = write_library(TRACKS, PLAYLISTS)
+    library = Library()
+    calls = []
+
+    async def run():
+        loop_thread = threading.current_thread()
+
+        def progress(phase, done, total):
+            assert threading.current_thread() is loop_thread
+            calls.append((phase, done))
+
+        return await aparse(library, path, progress=progress, streaming=streaming)
+
+    assert asyncio.run(run()) is library
+    assert library_snapshot(library) == library_snapshot(_parse(path))
+    assert library.parse_stats.tracks == 25
+    assert [done for phase, done in calls if phase == 'tracks'] == [10, 20, 25]
+    assert ('playlists', 1) in calls
+
+
+def test_aparse_error_leaves_library(write_library, library_snapshot, tmp_path):
+    library = _parse(write_library(TRACKS, PLAYLISTS))
+    before = library_snapshot(library)
+    broken = tmp_path / 'broken.xml'
+    broken.write_text('<?xml version="1.0" encoding="UTF-8"?>\n<plist version="1.0">\n<dict>\n\t<key>Tracks</key>\n')
+    with pytest.raises(Exception):
+        asyncio.run(aparse(library, str(broken)))
+    assert library_snapshot(library) == before
+
+
+def test_aparse_cancelled(write_library, library_snapshot, monkeypatch):
+    library = _parse(write_library(TRACKS[:3], name='before.xml'))
+    before = library_snapshot(library)
+    path = write_library(TRACKS, PLAYLISTS)
+    resume = threading.Event()
+    reported = []
+    report_progress = Library._report_progress
+
+    def blocking_report_progress(self, phase, done):
+        # the worker waits after its first report until the task has been cancelled
+        reported.append((phase, done))
+        report_progress(self, phase, done)
+        if len(reported) == 1:
+            resume.wait(5)
+
+    monkeypatch.setattr(Library, '_report_progress', blocking_report_progress)
+
+    async def run():
+        semaphore = asyncio.Semaphore(1)
+        task = None
+
+        def progress(phase, done, total):
+            if not task.cancelled():
+                task.cancel()
+                asyncio.get_running_loop().call_soon(resume.set)
+
+        task = asyncio.ensure_future(aparse(library, path, progress=progress, semaphore=semaphore))
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return semaphore
+
+    semaphore = asyncio.run(run())
+    assert not semaphore.locked()
+    # the parse stopped at the report after the cancellation
+    assert reported == [('tracks', 10), ('tracks', 20)]
+    assert library_snapshot(library) == before
+
+
+def test_aparse_concurrent(write_library, library_snapshot, monkeypatch):
+    paths = [write_library(TRACKS[:count], name='%d.xml' % count) for count in (5, 10, 15, 20, 25)]
+    libraries = [Library() for _ in paths]
+    lock = threading.Lock()
+    running = [0, 0]
+    parse = Library.parse
+
+    def counting_parse(self, *args, **kwargs):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        try:
+            return parse(self, *args, **kwargs)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    monkeypatch.setattr(Library, 'parse', counting_parse)
+
+    async def run():
+        semaphore = asyncio.Semaphore(2)
+        await asyncio.gather(*[aparse(library, path, semaphore=semaphore) for library, path in zip(libraries, paths)])
+
+    asyncio.run(run())
+    assert running[1] == 2
+    monkeypatch.setattr(Library, 'parse', parse)
+    assert [library_snapshot(library) for library in libraries] == [library_snapshot(_parse(path)) for path in paths]
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Binary plist libraries: reading them, writing them, and malformed files.
+"""
+
+import re
+import struct
+from datetime import datetime
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.bplist import BinaryPlist, xml_to_bplist
+
+TRACKS = [
+    [("Track ID", 1), ("Name", u"Café & Bar <Live>"), ("Artist", u"東京"), ("Total Time", 215000),
+     ("Size", 2 ** 40 + 5), ("Date Added", datetime(2019, 4, 1, 10, 32)), ("Loved", True), ("Compilation", False),
+     ("Comments", ""), ("Volume Adjustment", -25), ("Persistent ID", '000000000000AB01'),
+     ("Location", 'file:///Users/me/Music/Caf%C3%A9%20%26%20Bar/100%25%20%231.m4a')],
+    [("Track ID", 2), ("Name", "Two"), ("Movie", True), ("Play Date UTC", datetime(2020, 1, 1)),
+     ("Artwork Data", ('data', 'AAECAwQFBgcICQ=='))],
+    [("Track ID", 3), ("Name", "Radio"), ("Location", 'http://example.com/stream.mp3')],
+]
+
+PLAYLISTS = [
+    ([("Master", True), ("Name", "Library"), ("Playlist ID", 100), ("Playlist Persistent ID", 'F000000000000000'),
+      ("Visible", False), ("All Items", True)], [1, 2, 3]),
+    ([("Name", "Parties"), ("Playlist ID", 101), ("Playlist Persistent ID", 'F000000000000001'), ("Folder", True),
+      ("All Items", True)], []),
+    ([("Name", "2019"), ("Playlist ID", 102), ("Playlist Persistent ID", 'F000000000000002'),
+      ("Parent Persistent ID", 'F000000000000001'), ("All Items", True),
+      ("Smart Info", ('data', 'AQEAAwAAAAIAAAAZAAAAAAAAAAcAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=')),
+      ("Unknown Playlist Key", 7)], [3, 1]),
+]
+
+
+def _parse(path):
+    library = Library()
+    library.parse(path)
+    return library
+
+
+@pytest.fixture
+def xml_path(write_library):
+    """The library XML, with <data> values on one line as they are read from binary plists"""
+    path = write_library(TRACKS, PLAYLISTS)
+    with open(path, encoding='utf-8') as f:
+        text = re.sub(r'<data>\s*(\S*)\s*</data>', r'<data>\1</data>', f.read())
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+@pytest.fixture
+def bplist_path(tmp_path, xml_path):
+    path = str(tmp_path / 'library.bplist')
+    xml_to_bplist(xml_path, path)
+    return path
+
+
+def test_xml_to_bplist(xml_path, bplist_path, library_snapshot):
+    xml = _parse(xml_path)
+    binary = _parse(bplist_path)
+    assert library_snapshot(binary) == library_snapshot(xml)
+    assert binary.track_map[1].location == u'file:///Users/me/Music/Café & Bar/100% #1.m4a'
+    assert binary.track_map[1].size == 2 ** 40 + 5 and binary.track_map[1].comments is None
+    assert binary.track_map[1].extra_attributes == {'Volume Adjustment': -25}
+    assert binary.track_map[2].extra_attributes == {'Artwork Data': 'AAECAwQFBgcICQ=='}
+    assert binary.parse_stats.unknown_keys == xml.parse_stats.unknown_keys
+
+
+def test_export_bplist(tmp_path, xml_path, library_snapshot):
+    xml = _parse(xml_path)
+    path = tmp_path / 'exported.bplist'
+    with open(str(path), 'wb') as f:
+        xml.export_bplist(f)
+    assert library_snapshot(_parse(str(path))) == library_snapshot(xml)
+
+
+def _trailer(data):
+    return list(struct.unpack('>6xBBQQQ', data[-32:]))
+
+
+def _with_trailer(data, offset_size, ref_size, object_count, top_object, table_offset):
+    return data[:-32] + struct.pack('>6xBBQQQ', offset_size, ref_size, object_count, top_object, table_offset)
+
+
+def _malformed(data):
+    """Yields (description, bytes) of broken copies of a bplist document"""
+    offset_size, ref_size, object_count, top_object, table_offset = _trailer(data)
+    for length in (8, 39, len(data) // 2, table_offset, len(data) - 33, len(data) - 1):
+        yield 'truncated to %d bytes' % length, data[:length]
+    yield 'table past the end', _with_trailer(data, offset_size, ref_size, object_count, top_object, len(data))
+    yield 'table in the header', _with_trailer(data, offset_size, ref_size, object_count, top_object, 2)
+    yield 'too many objects', _with_trailer(data, offset_size, ref_size, object_count * 4, top_object, table_offset)
+    yield 'no offset size', _with_trailer(data, 0, ref_size, object_count, top_object, table_offset)
+    yield 'no ref size', _with_trailer(data, offset_size, 0, object_count, top_object, table_offset)
+    yield 'top object out of range', _with_trailer(data, offset_size, ref_size, object_count, object_count,
+                                                     table_offset)
+    # an offset of the table pointing past the objects
+    table = bytearray(data)
+    table[table_offset:table_offset + offset_size] = (len(data) - 16).to_bytes(offset_size, 'big')
+    yield 'offset out of range', bytes(table)
+    # a reference of the top dict to an object that does not exist
+    position = BinaryPlist(data).offsets[top_object]
+    references = bytearray(data)
+    references[position + 1:position + 1 + ref_size] = (2 ** (8 * ref_size) - 1).to_bytes(ref_size, 'big')
+    yield 'reference out of range', bytes(references)
+    # the length of the last string running past the end of the objects
+    lengths = bytearray(data)
+    lengths[table_offset - 3] = 0x5F
+    yield 'object past the end', bytes(lengths)
+
+
+def test_malformed(tmp_path, bplist_path):
+    with open(bplist_path, 'rb') as f:
+        data = f.read()
+    path = tmp_path / 'malformed.bplist'
+    for description, malformed in _malformed(data):
+        path.write_bytes(malformed)
+        with pytest.raises(ValueError):
+            _parse(str(path))
+            pytest.fail(description)
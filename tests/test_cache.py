@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Library.parse with a cache_dir: snapshots written, reused, invalidated and recovered from.
+"""
+
+import os
+import pickle
+
+import pytest
+
+from IReadiTunes import cache
+from IReadiTunes.IReadiTunes import Library
+
+PLAYLISTS = [([("Name", "All"), ("Playlist ID", 100), ("Playlist Persistent ID", 'F000000000000001'),
+               ("All Items", True)], [1, 2])]
+
+
+def _tracks(play_count=1, extra=()):
+    tracks = [[("Track ID", 1), ("Name", "One"), ("Play Count", play_count), ("Persistent ID", '000000000000AB01')],
+              [("Track ID", 2), ("Name", "Two"), ("Genre", "Jazz"), ("Persistent ID", '000000000000AB02')]]
+    return tracks + list(extra)
+
+
+def _parse(path, cache_dir=None):
+    library = Library()
+    library.parse(path, cache_dir=cache_dir)
+    return library
+
+
+def _from_snapshot(library):
+    return 'tracks' not in library.parse_stats.timings and 'snapshot_save' not in library.parse_stats.timings
+
+
+def _set_mtime(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def cached(tmp_path, write_library):
+    """Returns (library path, cache dir, snapshot path) after a cold parse"""
+    path = write_library(_tracks(), PLAYLISTS)
+    cache_dir = str(tmp_path / 'cache')
+    _parse(path, cache_dir)
+    return path, cache_dir, cache.snapshot_path(path, cache_dir)
+
+
+def test_cold_parse_writes_snapshot(tmp_path, write_library, library_snapshot):
+    path = write_library(_tracks(), PLAYLISTS)
+    cache_dir = str(tmp_path / 'cache')
+    library = _parse(path, cache_dir)
+    assert not _from_snapshot(library) and 'snapshot_save' in library.parse_stats.timings
+    header = cache.read_snapshot_header(cache.snapshot_path(path, cache_dir))
+    assert header['source'] == os.path.abspath(path)
+    assert header == dict(cache.file_fingerprint(path), version=cache.SNAPSHOT_FORMAT_VERSION, source=header['source'])
+    assert os.listdir(cache_dir) == [os.path.basename(cache.snapshot_path(path, cache_dir))]
+    assert library_snapshot(library) == library_snapshot(_parse(path))
+
+
+def test_warm_hit(cached, library_snapshot):
+    path, cache_dir, snapshot = cached
+    written = os.stat(snapshot).st_mtime_ns
+    warm = _parse(path, cache_dir)
+    assert _from_snapshot(warm) and 'snapshot_load' in warm.parse_stats.timings
+    assert library_snapshot(warm) == library_snapshot(_parse(path))
+    assert (warm.parse_stats.tracks, warm.parse_stats.playlists, warm.parse_stats.memberships) == (2, 1, 2)
+    assert os.stat(snapshot).st_mtime_ns == written
+
+
+def test_touched_file_reuses_snapshot(cached):
+    path, cache_dir, snapshot = cached
+    mtime_ns = os.stat(path).st_mtime_ns + 10 ** 9
+    _set_mtime(path, mtime_ns)
+    assert _from_snapshot(_parse(path, cache_dir))
+    # the header now holds the new mtime, so the next load does not hash the file
+    assert cache.read_snapshot_header(snapshot)['mtime_ns'] == mtime_ns
+
+
+def test_content_change_same_size(cached, library_text):
+    path, cache_dir, snapshot = cached
+    size = os.path.getsize(path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(library_text(_tracks(play_count=7), PLAYLISTS))
+    assert os.path.getsize(path) == size
+    _set_mtime(path, mtime_ns + 10 ** 9)
+    library = _parse(path, cache_dir)
+    assert not _from_snapshot(library) and library.track_map[1].play_count == 7
+    assert cache.read_snapshot_header(snapshot)['sha1'] == cache.file_hash(path)
+    assert _parse(path, cache_dir).track_map[1].play_count == 7
+
+
+def test_size_change(cached, library_text):
+    path, cache_dir, snapshot = cached
+    mtime_ns = os.stat(path).st_mtime_ns
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(library_text(_tracks(extra=[[("Track ID", 3), ("Name", "Three")]]), PLAYLISTS))
+    # even under the old mtime
+    _set_mtime(path, mtime_ns)
+    library = _parse(path, cache_dir)
+    assert not _from_snapshot(library) and sorted(library.track_map) == [1, 2, 3]
+
+
+def _broken_snapshots(data):
+    header_length = len(pickle.dumps(pickle.loads(data), pickle.HIGHEST_PROTOCOL))
+    yield 'empty', b''
+    yield 'garbage', b'not a pickle at all'
+    yield 'header cut', data[:header_length // 2]
+    yield 'header only', data[:header_length]
+    for length in (header_length + 1, (header_length + len(data)) // 2, len(data) - 1):
+        yield 'state cut at %d' % length, data[:length]
+    yield 'other version', pickle.dumps({'version': cache.SNAPSHOT_FORMAT_VERSION - 1}) + data[header_length:]
+
+
+def test_broken_snapshot_falls_back_to_parse(cached, library_snapshot):
+    path, cache_dir, snapshot = cached
+    expected = library_snapshot(_parse(path))
+    with open(snapshot, 'rb') as f:
+        data = f.read()
+    for description, broken in _broken_snapshots(data):
+        with open(snapshot, 'wb') as f:
+            f.write(broken)
+        library = _parse(path, cache_dir)
+        assert not _from_snapshot(library), description
+        assert library_snapshot(library) == expected, description
+        # and the snapshot is written again
+        assert _from_snapshot(_parse(path, cache_dir)), description
+
+
+def test_snapshot_of_other_source(cached, tmp_path, write_library):
+    path, cache_dir, snapshot = cached
+    other = write_library(_tracks(play_count=4), PLAYLISTS, name='other.xml')
+    # a snapshot at the name of other, written for path
+    os.replace(snapshot, cache.snapshot_path(other, cache_dir))
+    assert cache.load_snapshot(other, cache_dir) is None
+    assert _parse(other, cache_dir).track_map[1].play_count == 4
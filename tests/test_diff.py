@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Comparing and merging libraries.
+"""
+
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.diff import diff_libraries, merge_libraries
+
+
+def _track(track_id, name, persistent_id):
+    return [("Track ID", track_id), ("Name", name), ("Artist", "Band"), ("Total Time", 200000),
+            ("Persistent ID", persistent_id)]
+
+
+def _playlist(name, persistent_id, parent=None, folder=False):
+    attributes = [("Name", name), ("Playlist ID", int(persistent_id[-4:], 16)),
+                  ("Playlist Persistent ID", persistent_id)]
+    if parent is not None:
+        attributes.append(("Parent Persistent ID", parent))
+    if folder:
+        attributes.append(("Folder", True))
+    attributes.append(("All Items", True))
+    return attributes
+
+
+def _parse(write_library, tracks, playlists, name):
+    library = Library()
+    library.parse(write_library(tracks, playlists, name=name))
+    return library
+
+
+def test_merge_keeps_playlists_in_folders_matched_by_path(write_library):
+    base = _parse(write_library, [_track(1, "One", 'AAAA000000000001'), _track(2, "Two", 'AAAA000000000002')],
+                  [(_playlist("Parties", 'B000000000000001', folder=True), []),
+                   (_playlist("2018", 'B000000000000002', 'B000000000000001'), [1, 2])], 'base.xml')
+    # another user's library: same folder, other Persistent IDs
+    other = _parse(write_library, [_track(7, "Two", 'CCCC000000000002'), _track(8, "Three", 'CCCC000000000003')],
+                   [(_playlist("Parties", 'C000000000000001', folder=True), []),
+                    (_playlist("2019", 'C000000000000002', 'C000000000000001'), [7, 8]),
+                    (_playlist("Old", 'C000000000000003', 'C000000000000001', folder=True), []),
+                    (_playlist("2010", 'C000000000000004', 'C000000000000003'), [8])], 'other.xml')
+
+    merged = merge_libraries(base, other)
+
+    assert sorted(playlist.display_path for playlist in merged.playlists) == [
+        '/Parties', '/Parties/2018', '/Parties/2019', '/Parties/Old', '/Parties/Old/2010']
+    folder = merged.get_playlist_by_display_path('/Parties')
+    party = merged.get_playlist_by_display_path('/Parties/2019')
+    assert party.parent_persistent_id == folder.playlist_persistent_id == 'B000000000000001'
+    assert [merged.track_map[track_id].name for track_id in party.track_ids] == ["Two", "Three"]
+    assert merged.get_playlist_by_display_path('/Parties/Old').parent_persistent_id == 'B000000000000001'
+    # the libraries merged are left as they were
+    assert other.get_playlist_by_display_path('/Parties/2019').parent_persistent_id == 'C000000000000001'
+
+
+def test_merge_appends_each_member_once(write_library):
+    base = _parse(write_library, [_track(1, "One", 'AAAA000000000001'), _track(2, "Two", 'AAAA000000000002')],
+                  [(_playlist("Mix", 'B000000000000001'), [1, 2])], 'base.xml')
+    # the same track twice in the playlist, and a track already in it
+    other = _parse(write_library, [_track(7, "Two", 'AAAA000000000002'), _track(8, "Three", 'CCCC000000000003')],
+                   [(_playlist("Mix", 'B000000000000001'), [8, 7, 8])], 'other.xml')
+
+    merged = merge_libraries(base, other, other)
+
+    mix = merged.get_playlist_by_display_path('/Mix')
+    assert [merged.track_map[track_id].name for track_id in mix.track_ids] == ["One", "Two", "Three"]
+    assert mix.track_id_set() == frozenset(mix.track_ids)
+    assert len(merged.track_map) == 3
+
+
+def test_diff(write_library):
+    old = _parse(write_library, [_track(1, "One", 'AAAA000000000001'), _track(2, "Two", 'AAAA000000000002')],
+                 [(_playlist("Mix", 'B000000000000001'), [1, 2])], 'old.xml')
+    new = _parse(write_library, [_track(5, "One", 'AAAA000000000001'), _track(6, "Three", 'AAAA000000000003')],
+                 [(_playlist("Mix", 'B000000000000001'), [5])], 'new.xml')
+
+    diff = diff_libraries(old, new)
+    assert diff.matched_tracks == {1: 5}
+    assert (diff.added_tracks, diff.removed_tracks, diff.changed_tracks) == ([6], [2], [])
+    assert diff.changed_playlists == ['B000000000000001']
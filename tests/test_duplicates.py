@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Duplicate tracks: pair scores, blocking keys and clusters.
+"""
+
+import itertools
+import random
+from datetime import datetime
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.duplicates import _TrackKey, blocking_keys, score_pair
+
+
+def _track(track_id, name, artist=None, total_time=None, album=None, **values):
+    track = [("Track ID", track_id), ("Name", name)]
+    if artist is not None:
+        track.append(("Artist", artist))
+    if album is not None:
+        track.append(("Album", album))
+    if total_time is not None:
+        track.append(("Total Time", total_time))
+    return track + sorted(values.items())
+
+
+def _library(write_library, tracks, name='library.xml'):
+    library = Library()
+    library.parse(write_library(tracks, name=name))
+    return library
+
+
+def _keys(library):
+    cache = {}
+    return dict((track_id, _TrackKey(track, cache)) for track_id, track in library.track_map.items())
+
+
+def _clusters(clusters):
+    return [cluster.track_ids for cluster in clusters]
+
+
+TRACKS = [
+    # imported twice
+    _track(1, u'Hey Jude', u'The Beatles', 431000, u'1', **{"Bit Rate": 128, "Play Count": 3}),
+    _track(2, u'Hey Jude', u'the beatles', 431500, u'1', **{"Bit Rate": 256}),
+    # ripped again, with an accent lost and another album
+    _track(3, u'Café Society', u'Someone', 200000, u'Live', **{"Date Added": datetime(2019, 1, 1)}),
+    _track(4, u'Cafe Society', u'Someone', 202000, u'Studio', **{"Date Added": datetime(2018, 1, 1)}),
+    # the same file under two Track IDs
+    _track(5, u'Track 01', u'Unknown', 180000, **{"Size": 4000001, "Location": 'file:///Music/a.mp3'}),
+    _track(6, u'Other name', u'Other artist', 180000, **{"Size": 4000001}),
+    # the same name by other artists, and a live version far longer
+    _track(7, u'Hey Jude', u'Wilson Pickett', 240000),
+    _track(8, u'Cafe Society', u'Someone', 420000, u'Live'),
+    # same Persistent ID
+    _track(9, u'Yesterday', **{"Persistent ID": '000000000000AB09'}),
+    _track(10, u'Yesterday (Remastered)', u'The Beatles', **{"Persistent ID": '000000000000AB09'}),
+]
+
+
+def test_known_clusters(write_library):
+    library = _library(write_library, TRACKS)
+    clusters = library.find_duplicates()
+    # equal confidences by first Track ID
+    assert _clusters(clusters) == [[1, 2], [9, 10], [5, 6], [3, 4]]
+    assert clusters[1].confidence == 1.0 and clusters[2].confidence == 0.95
+    assert list(clusters[0].pairs) == [(1, 2)] and clusters[0].pairs[(1, 2)] == clusters[0].confidence
+    # highest bit rate, then the first added
+    assert clusters[0].best(library.track_map) == 2
+    assert clusters[3].best(library.track_map) == 4
+    assert _clusters(library.find_duplicates(threshold=0.99)) == [[1, 2], [9, 10]]
+
+
+def test_score_pair(write_library):
+    keys = _keys(_library(write_library, TRACKS))
+    assert score_pair(keys[9], keys[10]) == 1.0
+    assert score_pair(keys[1], keys[2]) == pytest.approx(1.0)
+    assert score_pair(keys[5], keys[6]) == 0.95
+    assert score_pair(keys[1], keys[2]) > score_pair(keys[3], keys[4]) > score_pair(keys[3], keys[8])
+    assert score_pair(keys[1], keys[7]) < 0.85
+    assert score_pair(keys[1], keys[2]) == score_pair(keys[2], keys[1])
+
+
+def test_blocking_keys(write_library):
+    keys = _keys(_library(write_library, TRACKS))
+    assert list(blocking_keys(keys[1])) == [('artist_name', 'the beatles', 'hey jude'),
+                                           ('name_time', 'hey jude', 107), ('name_time_shifted', 'hey jude', 108)]
+    assert ('size', 4000001) in blocking_keys(keys[6])
+    assert ('persistent_id', '000000000000AB09') in blocking_keys(keys[9])
+
+
+def test_pairs_without_a_common_block_are_not_scored(write_library):
+    # a one-word name is only blocked with its artist, spelled differently here
+    tracks = [_track(1, u'Intro', u'The Beatles', 60000, u'Live'), _track(2, u'Intro', u'Beatles', 60000, u'Live')]
+    library = _library(write_library, tracks)
+    keys = _keys(library)
+    assert score_pair(keys[1], keys[2]) >= 0.8
+    assert not set(blocking_keys(keys[1])) & set(blocking_keys(keys[2]))
+    assert library.find_duplicates(threshold=0.8) == []
+
+    # two words or more are also blocked on name and duration
+    tracks = [_track(1, u'Intro Theme', u'The Beatles', 60000, u'Live'),
+              _track(2, u'Intro Theme', u'Beatles', 61900, u'Live')]
+    assert _clusters(_library(write_library, tracks, 'two.xml').find_duplicates(threshold=0.8)) == [[1, 2]]
+
+
+def test_large_blocks_are_skipped(write_library):
+    tracks = [_track(track_id, u'Track', u'Various', 1000 * track_id) for track_id in range(1, 8)]
+    library = _library(write_library, tracks)
+    assert _clusters(library.find_duplicates(threshold=0.5)) == [list(range(1, 8))]
+    assert library.find_duplicates(threshold=0.5, max_block_size=6) == []
+
+
+def test_clusters_are_transitive(write_library):
+    # 1-2, 2-3 and 4-5 are linked, 1 and 3 are too far apart, 3 and 4 are linked weakly
+    tracks = [_track(1, u'Hey Jude', u'The Beatles', 431000, u'1'),
+              _track(2, u'Hey Jude', u'The Beatles', 434000, u'1'),
+              _track(3, u'Hey Jude', u'The Beatles', 437000, u'1'),
+              _track(4, u'Hey Jude', u'The Beatles', 439000, u'Past Masters'),
+              _track(5, u'Hey Jude', u'The Beatles', 439000, u'Past Masters')]
+    library = _library(write_library, tracks)
+    keys = _keys(library)
+    assert score_pair(keys[1], keys[3]) < 0.85 <= score_pair(keys[3], keys[4]) < score_pair(keys[1], keys[2])
+    clusters = library.find_duplicates()
+    assert _clusters(clusters) == [[1, 2, 3, 4, 5]]
+    assert clusters[0].confidence == min(clusters[0].pairs.values()) == score_pair(keys[3], keys[4])
+    assert (1, 3) not in clusters[0].pairs and len(clusters[0].pairs) == 4
+
+
+def _components(track_ids, links):
+    """Returns the sorted connected components of the links, by a depth-first search"""
+    neighbours = dict((track_id, set()) for track_id in track_ids)
+    for a, b in links:
+        neighbours[a].add(b)
+        neighbours[b].add(a)
+    seen = set()
+    components = []
+    for track_id in sorted(track_ids):
+        if track_id in seen or not neighbours[track_id]:
+            continue
+        component = []
+        stack = [track_id]
+        seen.add(track_id)
+        while stack:
+            current = stack.pop()
+            component.append(current)
+            for other in neighbours[current] - seen:
+                seen.add(other)
+                stack.append(other)
+        components.append(sorted(component))
+    return sorted(components)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_same_clusters_as_connected_components(write_library, seed):
+    rng = random.Random(seed)
+    names = [u'Hey Jude', u'Let It Be', u'Come Together', u'Something', u'Intro']
+    artists = [u'The Beatles', u'Beatles', u'Joe Cocker', None]
+    tracks = [_track(track_id, rng.choice(names), rng.choice(artists), rng.randrange(60, 70) * 3000,
+                     rng.choice([u'Abbey Road', u'Live', None]), **({"Size": rng.randrange(5)} if rng.random() < 0.3
+                                                                   else {}))
+              for track_id in range(1, 61)]
+    library = _library(write_library, tracks)
+    keys = _keys(library)
+    links = [(a, b) for a, b in itertools.combinations(sorted(keys), 2)
+             if set(blocking_keys(keys[a])) & set(blocking_keys(keys[b])) and score_pair(keys[a], keys[b]) >= 0.85]
+    clusters = library.find_duplicates()
+    assert sorted(_clusters(clusters)) == _components(keys, links)
+    for cluster in clusters:
+        assert all(pair in links for pair in cluster.pairs)
+        assert len(cluster.pairs) == len(cluster) - 1
+        assert cluster.confidence == min(cluster.pairs.values())
+    assert [cluster.confidence for cluster in clusters] == sorted((cluster.confidence for cluster in clusters),
+                                                                  reverse=True)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+JSON Lines and CSV exporters, M3U playlist trees.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from urllib.parse import quote
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library, TRACK_FIELD_NAMES
+
+TRACKS = [
+    [("Track ID", 1), ("Name", "Track #1?"), ("Artist", "Band"), ("Total Time", 61000),
+     ("Location", 'file://' + quote('/Users/me/Music/Band/Track #1?.mp3'))],
+    [("Track ID", 2), ("Name", "100% Pure"), ("Total Time", 180500),
+     ("Location", 'file://localhost' + quote('/Users/me/Music/100% Pure #2.m4a'))],
+    [("Track ID", 3), ("Name", "Radio"), ("Location", 'http://example.com/stream.mp3')],
+]
+
+PLAYLISTS = [
+    ([("Name", "Parties"), ("Playlist ID", 10), ("Playlist Persistent ID", 'A000000000000001'), ("Folder", True),
+      ("All Items", True)], []),
+    ([("Name", "2019"), ("Playlist ID", 11), ("Playlist Persistent ID", 'A000000000000002'),
+      ("Parent Persistent ID", 'A000000000000001'), ("All Items", True)], [1, 2, 3]),
+]
+
+
+RECORD_TRACKS = [
+    [("Track ID", 1), ("Name", u'Say "Hi", Café'), ("Artist", "Band"), ("Total Time", 61000),
+     ("Date Added", datetime(2019, 4, 1, 10, 32)), ("Loved", True), ("Comments", "line one\nline two"),
+     ("Persistent ID", '000000000000AB01'), ("Volume Adjustment", -25)],
+    [("Track ID", 2), ("Name", "Two"), ("Persistent ID", '000000000000AB02'), ("Artwork Data", ('data', 'AAEC'))],
+]
+
+RECORD_PLAYLISTS = [
+    ([("Name", "Mix"), ("Playlist ID", 100), ("Playlist Persistent ID", 'F000000000000001'), ("Distinguished Kind", 4),
+      ("Unknown Playlist Key", 1)], [2, 1, 2]),
+    ([("Name", "Empty"), ("Playlist ID", 101), ("Playlist Persistent ID", 'F000000000000002')], []),
+]
+
+
+@pytest.fixture
+def records_library(write_library):
+    library = Library()
+    library.parse(write_library(RECORD_TRACKS, RECORD_PLAYLISTS))
+    return library
+
+
+def _json(value):
+    """Returns value as it reads back from JSON, dates written as in the XML file"""
+    return json.loads(json.dumps(value, default=lambda date: date.strftime('%Y-%m-%dT%H:%M:%SZ')))
+
+
+def _lines(export, *args):
+    fp = io.StringIO()
+    count = export(fp, *args)
+    lines = fp.getvalue().splitlines()
+    assert count == len(lines)
+    return [json.loads(line) for line in lines]
+
+
+def test_tracks_jsonl(records_library):
+    records = _lines(records_library.export_tracks_jsonl)
+    assert records == [_json(track.get_as_dict()) for track in records_library.track_map.values()]
+    assert records[0]['date_added'] == '2019-04-01T10:32:00Z' and records[0]['name'] == u'Say "Hi", Café'
+    assert records[1]['Artwork Data'].split() == ['AAEC']
+    assert _lines(records_library.export_tracks_jsonl, ['name', 'genre']) == [{'name': u'Say "Hi", Café'},
+                                                                             {'name': 'Two'}]
+    with pytest.raises(ValueError):
+        records_library.export_tracks_jsonl(io.StringIO(), ['name', 'not_a_field'])
+
+
+@pytest.mark.parametrize('track_ref', ['track_id', 'persistent_id', 'embed'])
+def test_playlists_jsonl(records_library, track_ref):
+    records = _lines(records_library.export_playlists_jsonl, track_ref, True)
+    expected = [_json(playlist.get_as_dict(True)) for playlist in records_library.playlists]
+    if track_ref == 'track_id':
+        expected[0]['tracks'] = [2, 1, 2]
+    elif track_ref == 'persistent_id':
+        expected[0]['tracks'] = ['000000000000AB02', '000000000000AB01', '000000000000AB02']
+    assert records == expected
+    assert 'tracks' not in records[1] and records[0]['distinguished_kind_label'] == 'AudioBooks'
+    assert records[0]['Unknown Playlist Key'] == 1
+
+
+def test_playlists_jsonl_track_ref(records_library):
+    with pytest.raises(ValueError):
+        records_library.export_playlists_jsonl(io.StringIO(), 'name')
+
+
+def test_csv(records_library):
+    fp = io.StringIO(newline='')
+    assert records_library.export_csv(fp) == 2
+    rows = list(csv.reader(io.StringIO(fp.getvalue(), newline='')))
+    assert rows[0] == list(TRACK_FIELD_NAMES) and len(rows) == 3
+    first = dict(zip(rows[0], rows[1]))
+    assert first['name'] == u'Say "Hi", Café' and first['comments'] == 'line one\nline two'
+    assert (first['date_added'], first['loved'], first['total_time'], first['genre']) == (
+        '2019-04-01T10:32:00Z', 'True', '61000', '')
+
+    fp = io.StringIO(newline='')
+    records_library.export_csv(fp, ['track_id', 'name'])
+    assert list(csv.reader(io.StringIO(fp.getvalue(), newline=''))) == [['track_id', 'name'],
+                                                                        ['1', u'Say "Hi", Café'], ['2', 'Two']]
+    with pytest.raises(ValueError):
+        records_library.export_csv(io.StringIO(), ['Name'])
+
+
+def test_m3u_entries_keep_special_characters(tmp_path, write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, PLAYLISTS))
+    report = library.export_m3u_tree(str(tmp_path / 'm3u'))
+
+    assert report.written == ['Parties/2019.m3u8']
+    assert (tmp_path / 'm3u' / 'Parties' / '2019.m3u8').read_text(encoding='utf-8') == (
+        '#EXTM3U\n'
+        '#EXTINF:61,Band - Track #1?\n'
+        '/Users/me/Music/Band/Track #1?.mp3\n'
+        '#EXTINF:180,100% Pure\n'
+        '/Users/me/Music/100% Pure #2.m4a\n'
+        '#EXTINF:-1,Radio\n'
+        'http://example.com/stream.mp3\n')
+
+
+def test_m3u_prefix_map(tmp_path, write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, PLAYLISTS))
+    library.export_m3u_tree(str(tmp_path / 'm3u'), extended=False, prefix_map=[('/Users/me/Music', '/mnt/nas')])
+
+    assert (tmp_path / 'm3u' / 'Parties' / '2019.m3u8').read_text(encoding='utf-8') == (
+        '/mnt/nas/Band/Track #1?.mp3\n'
+        '/mnt/nas/100% Pure #2.m4a\n'
+        'http://example.com/stream.mp3\n')
+
+
+LATIN_1_TRACKS = TRACKS + [
+    [("Track ID", 4), ("Name", u"Été"), ("Artist", u"Café"), ("Total Time", 1000),
+     ("Location", 'file://' + quote(u'/Users/me/Music/Café/Été.mp3'))],
+    [("Track ID", 5), ("Name", u"東京"), ("Artist", u"歌手"), ("Total Time", 2000),
+     ("Location", 'file://' + quote(u'/Users/me/Music/歌手/東京.mp3'))],
+    [("Track ID", 6), ("Name", u"Tōkyō"), ("Total Time", 3000),
+     ("Location", 'file://' + quote('/Users/me/Music/Tokyo.mp3'))],
+]
+
+
+def test_m3u_leaves_out_paths_it_cannot_encode(tmp_path, write_library, caplog):
+    playlists = [([("Name", "Mix"), ("Playlist ID", 12), ("Playlist Persistent ID", 'A000000000000003'),
+                   ("All Items", True)], [4, 5, 6, 1])]
+    library = Library()
+    library.parse(write_library(LATIN_1_TRACKS, playlists))
+    report = library.export_m3u_tree(str(tmp_path / 'm3u'), extension='m3u')
+
+    assert report.written == ['Mix.m3u'] and report.skipped_entries == 1
+    # titles are written with '?' for the characters Latin-1 does not have, paths never are
+    assert (tmp_path / 'm3u' / 'Mix.m3u').read_bytes().decode('latin-1') == (
+        u'#EXTM3U\n'
+        u'#EXTINF:1,Café - Été\n'
+        u'/Users/me/Music/Café/Été.mp3\n'
+        u'#EXTINF:3,T?ky?\n'
+        u'/Users/me/Music/Tokyo.mp3\n'
+        u'#EXTINF:61,Band - Track #1?\n'
+        u'/Users/me/Music/Band/Track #1?.mp3\n')
+    assert u'/Users/me/Music/歌手/東京.mp3' in caplog.text
+
+    report = library.export_m3u_tree(str(tmp_path / 'm3u8'))
+    assert report.skipped_entries == 0
+    assert u'/Users/me/Music/歌手/東京.mp3\n' in (tmp_path / 'm3u8' / 'Mix.m3u8').read_text(encoding='utf-8')
+
+
+def _playlist(name, number, members, parent=None):
+    attributes = [("Name", name), ("Playlist ID", 20 + number), ("Playlist Persistent ID", 'B%015X' % number),
+                  ("All Items", True)]
+    if parent is not None:
+        attributes.append(("Parent Persistent ID", 'A000000000000001'))
+    return attributes, members
+
+
+def _parse(write_library, playlists):
+    library = Library()
+    library.parse(write_library(TRACKS, PLAYLISTS[:1] + playlists))
+    return library
+
+
+def test_m3u_manifest(tmp_path, write_library):
+    directory = str(tmp_path / 'm3u')
+    first = [_playlist("A", 1, [1]), _playlist("B", 2, [2], parent=True), _playlist("C", 3, [3])]
+    report = _parse(write_library, first).export_m3u_tree(directory)
+    assert sorted(report.written) == ['A.m3u8', 'C.m3u8', 'Parties/B.m3u8']
+
+    report = _parse(write_library, first).export_m3u_tree(directory)
+    assert report.written == [] and sorted(report.unchanged) == ['A.m3u8', 'C.m3u8', 'Parties/B.m3u8']
+
+    # A changed, B rewritten as its file was truncated, C removed
+    (tmp_path / 'm3u' / 'Parties' / 'B.m3u8').write_text('')
+    second = [_playlist("A", 1, [1, 2]), _playlist("B", 2, [2], parent=True)]
+    report = _parse(write_library, second).export_m3u_tree(directory)
+    assert (sorted(report.written), report.unchanged, report.removed) == (['A.m3u8', 'Parties/B.m3u8'], [],
+                                                                          ['C.m3u8'])
+    assert sorted(path.name for path in (tmp_path / 'm3u').iterdir()) == ['.m3u_manifest.json', 'A.m3u8', 'Parties']
+    assert '/Users/me/Music/100% Pure #2.m4a' in (tmp_path / 'm3u' / 'A.m3u8').read_text(encoding='utf-8')
+
+    # without remove_stale, files of deleted playlists are kept, and removed by a later export
+    report = _parse(write_library, second[:1]).export_m3u_tree(directory, remove_stale=False)
+    assert (report.written, report.unchanged, report.removed) == ([], ['A.m3u8'], [])
+    assert (tmp_path / 'm3u' / 'Parties' / 'B.m3u8').exists()
+    report = _parse(write_library, second[:1]).export_m3u_tree(directory)
+    assert report.removed == ['Parties/B.m3u8'] and not (tmp_path / 'm3u' / 'Parties' / 'B.m3u8').exists()
+
+
+def test_m3u_removes_only_its_files(tmp_path, write_library):
+    directory = tmp_path / 'm3u'
+    _parse(write_library, [_playlist("A", 1, [1])]).export_m3u_tree(str(directory))
+    outside = [tmp_path / 'outside.m3u8', tmp_path / 'outside.txt', directory / 'notes.txt', tmp_path / 'm3u2.m3u8']
+    for path in outside:
+        path.write_text('keep')
+    manifest = json.loads((directory / '.m3u_manifest.json').read_text(encoding='utf-8'))
+    for relative_path in ['../outside.m3u8', 'Parties/../../outside.m3u8', str(tmp_path / 'outside.m3u8'),
+                          '../outside.txt', 'notes.txt', '../m3u2.m3u8', '.']:
+        manifest['files'][relative_path] = ['0' * 40, 4]
+    (directory / '.m3u_manifest.json').write_text(json.dumps(manifest), encoding='utf-8')
+
+    report = _parse(write_library, [_playlist("A", 1, [1])]).export_m3u_tree(str(directory))
+    assert report.removed == [] and report.unchanged == ['A.m3u8']
+    assert [path.read_text() for path in outside] == ['keep'] * len(outside)
+
+
+def test_m3u_playlists_out_of_the_directory(tmp_path, write_library):
+    library = _parse(write_library, [_playlist("A", 1, [1]), _playlist("Escape", 2, [1])])
+    # display paths of playlists names never leave the directory, those set by hand may
+    playlist = library.get_playlist_by_display_path('/Escape')
+    playlist.display_path = '/../Escape'
+    library.playlist_by_display_path = {'/A': library.get_playlist_by_display_path('/A'), '/../Escape': playlist}
+    report = library.export_m3u_tree(str(tmp_path / 'm3u'))
+    assert report.written == ['A.m3u8']
+    assert not (tmp_path / 'Escape.m3u8').exists()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Track locations resolved to local paths and checked on disk.
+"""
+
+from urllib.parse import quote
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.files import location_to_path
+
+FILE_NAMES = ['Track #1?.mp3', '100% Pure.m4a', 'Why? #2 50%20off.mp3', u'Café & Bar.mp3']
+
+
+@pytest.mark.parametrize('location, path', [
+    ('file:///Users/me/Music/Track #1?.mp3', '/Users/me/Music/Track #1?.mp3'),
+    ('file:///Users/me/Music/100% Pure.m4a', '/Users/me/Music/100% Pure.m4a'),
+    ('file://localhost/Users/me/Music/a?b#c.mp3', '/Users/me/Music/a?b#c.mp3'),
+    ('file://localhost/C:/Music/Track #1.mp3', 'C:/Music/Track #1.mp3'),
+    ('file://server/share/Track.mp3', None),
+    ('http://example.com/stream.mp3', None),
+    ('', None),
+    (None, None),
+])
+def test_location_to_path(location, path):
+    assert location_to_path(location) == path
+
+
+def test_location_to_path_prefix_map():
+    assert location_to_path('file:///Users/me/Music/#1.mp3', [('/Users/me/Music', '/mnt/nas')]) == '/mnt/nas/#1.mp3'
+
+
+def test_check_files_with_special_characters(tmp_path, write_library):
+    tracks = []
+    for index, name in enumerate(FILE_NAMES):
+        path = tmp_path / name
+        path.write_bytes(b'x' * (index + 1))
+        tracks.append([("Track ID", index + 1), ("Name", name), ("Size", index + 1),
+                       ("Location", 'file://' + quote(str(path)))])
+    library = Library()
+    library.parse(write_library(tracks))
+
+    assert library.track_paths() == dict((index + 1, str(tmp_path / name)) for index, name in enumerate(FILE_NAMES))
+    report = library.check_files(check_mtime=False)
+    assert report.checked == len(FILE_NAMES)
+    assert not report
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Library.parse with lazy=True, checked against an eager parse of the same file.
+"""
+
+import copy
+import pickle
+from datetime import datetime
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library, Track
+from IReadiTunes.lazy import LazyTrack, decode_raw_text
+
+# written with the placeholder text, then replaced by the raw XML
+_RAW_VALUES = [
+    ('NAME', 'Rock &amp; Roll &#x2013; &#233;t&#xE9; &lt;Live&gt; &quot;1&quot; &apos;2&apos;'),
+    ('ARTIST', 'Caf&#xe9; &#x1F3B8;'),
+    ('COMMENTS', 'first line\r\nsecond line\rthird&#13;'),
+    ('GENRE', '  spaced  '),
+]
+
+
+def _track(track_id, name, **values):
+    values.setdefault("Artist", "Someone")
+    track = [("Track ID", track_id), ("Name", name), ("Kind", "AAC audio file"), ("Total Time", 200000 + track_id),
+             ("Date Modified", datetime(2019, 1, track_id, 10, 0))]
+    track += sorted(values.items())
+    track += [("Persistent ID", '%016X' % (0xABC0 + track_id)), ("Track Type", "File"),
+              ("Location", 'file:///Users/me/Music/Caf%C3%A9%20%26%20Bar/%25%2023%20%3F.m4a')]
+    return track
+
+
+def _tracks():
+    return [_track(1, "NAME", **{"Genre": "GENRE", "Comments": "COMMENTS", "Play Count": 3, "Loved": True}),
+            _track(2, "Two", **{"Artist": "ARTIST", "Rating": 80, "Loved": False}),
+            _track(3, "Three", **{"Album": "EMPTY", "Sort Name": "EMPTY", "Podcast": True}),
+            _track(4, "Four", **{"Volume Adjustment": 12, "Artwork Count": 1, "Custom &amp; Key": "EXTRA",
+                                 "Play Date UTC": datetime(2020, 1, 1), "Movie": True}),
+            _track(5, "Five", **{"Stream Data": ('data', 'AAEC AwQF\n\tBgcI')})]
+
+
+def _write(write_library, line_end='\n'):
+    path = write_library(_tracks(), [([("Name", "All"), ("Playlist ID", 100), ("All Items", True)],
+                                      [1, 2, 3, 4, 5])])
+    with open(path, 'rb') as f:
+        text = f.read().decode('utf-8')
+    if line_end != '\n':
+        text = text.replace('\n', line_end)
+    for placeholder, raw in _RAW_VALUES:
+        text = text.replace('>%s<' % placeholder, '>%s<' % raw)
+    text = text.replace('<string>EMPTY</string>', '<string/>', 1).replace('<string>EMPTY</string>', '<string></string>')
+    text = text.replace('<key>Custom &amp;amp; Key</key>', '<key>Custom &#x26; Key</key>')
+    text = text.replace('<string>EXTRA</string>', '<string>x &gt; y</string>')
+    with open(path, 'wb') as f:
+        f.write(text.encode('utf-8'))
+    return path
+
+
+def _parse(path, **parse_options):
+    library = Library()
+    library.parse(path, **parse_options)
+    return library
+
+
+@pytest.mark.parametrize('line_end', ['\n', '\r\n'])
+def test_same_as_eager(write_library, library_snapshot, line_end):
+    path = _write(write_library, line_end)
+    lazy = _parse(path, lazy=True)
+    eager = _parse(path)
+    assert all(type(track) is LazyTrack for track in lazy.track_map.values())
+    assert library_snapshot(lazy) == library_snapshot(eager)
+
+
+def test_decoded_values(write_library):
+    tracks = _parse(_write(write_library, '\r\n'), lazy=True).track_map
+    assert tracks[1].name == u'Rock & Roll – \xe9t\xe9 <Live> "1" \'2\''
+    assert tracks[1].comments == 'first line\nsecond line\nthird\r'
+    assert tracks[1].genre == '  spaced  '
+    assert tracks[2].artist == u'Caf\xe9 \U0001F3B8'
+    assert tracks[3].album is None and tracks[3].sort_name is None
+    assert tracks[4].artwork_count == 1
+    assert tracks[4].extra_attributes == {'Volume Adjustment': 12, 'Custom & Key': 'x > y'}
+    assert tracks[5].extra_attributes == {'Stream Data': '\n\t\t\tAAEC AwQF\n\tBgcI\n\t\t\t'}
+    assert tracks[1].location == u'file:///Users/me/Music/Café & Bar/% 23 ?.m4a'
+    assert tracks[2].loved is False and tracks[3].loved is None
+
+
+def test_values_are_decoded_once(write_library):
+    track = _parse(_write(write_library), lazy=True).track_map[1]
+    assert track.name is track.name
+    track.name = 'Renamed'
+    track.genre = None
+    assert (track.name, track.genre, track.comments) == ('Renamed', None, 'first line\nsecond line\nthird\r')
+
+
+@pytest.mark.parametrize('clone', [lambda track: pickle.loads(pickle.dumps(track)), copy.copy, copy.deepcopy])
+def test_clone_is_plain_track(write_library, clone):
+    path = _write(write_library)
+    eager = _parse(path).track_map
+    for track_id, track in _parse(path, lazy=True).track_map.items():
+        cloned = clone(track)
+        assert type(cloned) is Track
+        assert cloned.get_as_dict() == eager[track_id].get_as_dict()
+
+
+def test_blocks_with_arrays_are_parsed(write_library, library_snapshot):
+    path = _write(write_library)
+    with open(path, 'rb') as f:
+        data = f.read()
+    data = data.replace(b'<key>Artwork Count</key>',
+                        b'<key>Ratings</key><array><integer>1</integer></array>\n<!-- c --><key>Artwork Count</key>')
+    with open(path, 'wb') as f:
+        f.write(data)
+    lazy = _parse(path, lazy=True)
+    assert type(lazy.track_map[4]) is Track and type(lazy.track_map[1]) is LazyTrack
+    assert library_snapshot(lazy) == library_snapshot(_parse(path))
+
+
+def test_blocks_with_other_values_are_parsed(write_library, library_snapshot, caplog):
+    path = _write(write_library)
+    with open(path, 'rb') as f:
+        data = f.read()
+    data = data.replace(b'<key>Rating</key><integer>80</integer>',
+                        b'<key>Rating</key><real>80.0</real><key>Volume Gain</key><real>-1.5</real>')
+    with open(path, 'wb') as f:
+        f.write(data)
+    lazy = _parse(path, lazy=True)
+    lazy_warnings = [record.getMessage() for record in caplog.records]
+    caplog.clear()
+    eager = _parse(path)
+    assert type(lazy.track_map[2]) is Track and type(lazy.track_map[1]) is LazyTrack
+    assert library_snapshot(lazy) == library_snapshot(eager)
+    assert lazy.track_map[2].rating == '80.0'
+    # reported as the eager parse does
+    assert lazy_warnings == [record.getMessage() for record in caplog.records] and len(lazy_warnings) == 2
+    assert "What to do for plist attribute 'Volume Gain' of type 'real', value '-1.5'" in lazy_warnings
+    assert lazy.parse_stats.unknown_keys['Volume Gain'] == eager.parse_stats.unknown_keys['Volume Gain'] == 1
+
+
+@pytest.mark.parametrize('raw, text', [
+    (b'', None),
+    (b'a &amp;amp; b', 'a &amp; b'),
+    (b'&#x41;&#66;&#x1F3B8;', u'AB\U0001F3B8'),
+    (b'a\r\n\rb', 'a\n\nb'),
+])
+def test_decode_raw_text(raw, text):
+    assert decode_raw_text(raw) == text
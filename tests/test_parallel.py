@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Library.parse with workers, checked against a serial parse of the same file.
+"""
+
+import re
+from datetime import datetime
+
+import pytest
+
+import IReadiTunes.IReadiTunes as IReadiTunes
+from IReadiTunes.IReadiTunes import Library
+
+# Track ID -> how its dict is written
+EMPTY_TRACKS = {1: '<dict/>', 4: '<dict />', 5: '<dict></dict>', 8: '<dict/>', 12: '<dict></dict>'}
+
+
+def _tracks():
+    tracks = []
+    for track_id in range(1, 13):
+        track = [("Track ID", track_id), ("Name", u"Track %d & Café" % track_id),
+                 ("Artist", "Artist %d" % (track_id % 3)), ("Total Time", 1000 * track_id), ("Date Added", datetime(2019, 1, track_id)),
+                 ("Location", 'file:///Users/me/Music/Track%%20%d.m4a' % track_id)]
+        if track_id % 4 == 2:
+            track.append(("Movie", True))
+        if track_id % 3 == 0:
+            track.append(("Unknown Key %d" % (track_id % 2), track_id))
+        # no whitespace between the last value and the end of the dict
+        track.append(("Loved", track_id % 2 == 0))
+        tracks.append(track)
+    return tracks
+
+
+def _playlists():
+    return [([("Name", "All"), ("Playlist ID", 100), ("All Items", True)],
+             [track_id for track_id in range(1, 13) if track_id not in EMPTY_TRACKS])]
+
+
+def _write(write_library):
+    path = write_library(_tracks(), _playlists())
+    with open(path) as f:
+        text = f.read()
+    text = re.sub(r'(/>|</\w+>)\n\t\t</dict>', r'\1</dict>', text)
+    for track_id, empty in EMPTY_TRACKS.items():
+        text = re.sub(r'<key>%d</key>\n\t\t<dict>.*?</dict>' % track_id, '<key>%d</key>\n\t\t%s' % (track_id, empty),
+                      text, count=1, flags=re.S)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def _parse(path, **parse_options):
+    library = Library()
+    library.parse(path, **parse_options)
+    return library
+
+
+@pytest.mark.parametrize('workers, min_chunk_tracks', [(2, 1), (3, 1), (2, 2), (4, 256)])
+def test_same_as_serial(write_library, library_snapshot, monkeypatch, workers, min_chunk_tracks):
+    # chunks of a few tracks, starting and ending on empty dicts
+    monkeypatch.setattr(IReadiTunes, '_MIN_CHUNK_TRACKS', min_chunk_tracks)
+    path = _write(write_library)
+    blocks = IReadiTunes.scan_track_blocks(open(path, 'rb').read())[2]
+    assert len(blocks) == 12 and blocks[0][0] == blocks[0][1] and blocks[11][0] == blocks[11][1]
+    serial = _parse(path)
+    parallel = _parse(path, workers=workers)
+    assert library_snapshot(parallel) == library_snapshot(serial)
+    assert parallel.parse_stats.tracks == serial.parse_stats.tracks == 12
+    assert parallel.parse_stats.unknown_keys == serial.parse_stats.unknown_keys == {'Unknown Key 0': 1,
+                                                                                   'Unknown Key 1': 2}
+
+
+def test_not_utf8_is_parsed_serially(write_library, library_snapshot):
+    path = write_library(_tracks(), _playlists(), encoding='ISO-8859-1')
+    assert library_snapshot(_parse(path, workers=2)) == library_snapshot(_parse(path))
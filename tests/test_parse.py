@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Library.parse: streaming and DOM parses of the same file, plist value decoding, stats and progress.
+"""
+
+import io
+import logging
+import tracemalloc
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import pytest
+
+import IReadiTunes.IReadiTunes as IReadiTunes
+from IReadiTunes.IReadiTunes import (Library, PLAYLIST_ATTRIBUTE_INDEX, TRACK_ATTRIBUTE_INDEX, TRACK_ATTRIBUTE_NAMES,
+                                     TRACK_FIELD_NAMES, decode_plist_date, iter_library_items)
+
+
+def _tracks():
+    return [
+        [("Track ID", 1), ("Name", u"Café & Bar <Live>"), ("Artist", u"東京"), ("Genre", "Rock"), ("Year", 1999),
+         ("Total Time", 215000), ("Size", 2 ** 33), ("Date Added", datetime(2019, 4, 1, 10, 32)), ("Loved", True),
+         ("Persistent ID", '000000000000AB01'), ("Location", 'file:///Users/me/Music/Caf%C3%A9%20%26%20Bar.m4a')],
+        [("Track ID", 2), ("Name", "Film"), ("Movie", True), ("Has Video", True), ("Unknown Key", 3)],
+        [("Track ID", 3), ("Name", "Episode"), ("Podcast", True), ("Artwork Data", ('data', 'AAECAwQF'))],
+        [("Track ID", 4), ("Name", "Show"), ("TV Show", True), ("Season", 2)],
+        [("Track ID", 5), ("Name", "Book"), ("Location", 'file:///Users/me/Music/Audiobooks/Book.m4b')],
+        [("Track ID", 6), ("Name", "Feed"), ("Genre", "Podcast"), ("Location", 'http://example.com/feed.mp3')],
+        [("Track ID", 7), ("Name", ""), ("Comments", "line one\nline two"), ("Compilation", False)],
+    ]
+
+
+def _playlists():
+    return [([("Master", True), ("Name", "Library"), ("Playlist ID", 100),
+              ("Playlist Persistent ID", 'F000000000000000'), ("Visible", False), ("All Items", True)],
+             [1, 2, 3, 4, 5, 6, 7]),
+            ([("Name", "Parties"), ("Playlist ID", 101), ("Playlist Persistent ID", 'F000000000000001'),
+              ("Folder", True), ("All Items", True)], []),
+            ([("Name", "2019/2020"), ("Playlist ID", 102), ("Playlist Persistent ID", 'F000000000000002'),
+              ("Parent Persistent ID", 'F000000000000001'), ("All Items", True), ("Unknown Playlist Key", 1)],
+             [7, 1, 1]),
+            ([("Name", "Movies"), ("Playlist ID", 103), ("Playlist Persistent ID", 'F000000000000003'),
+              ("Distinguished Kind", 2), ("All Items", True)], [2])]
+
+
+def _parse(source, **parse_options):
+    library = Library()
+    library.parse(source, **parse_options)
+    return library
+
+
+@pytest.mark.parametrize('as_file', [False, True])
+def test_streaming_same_as_dom(write_library, library_snapshot, as_file):
+    path = write_library(_tracks(), _playlists())
+    dom = _parse(path)
+    if as_file:
+        with open(path, 'rb') as f:
+            streamed = _parse(io.BytesIO(f.read()), streaming=True)
+    else:
+        streamed = _parse(path, streaming=True)
+    assert library_snapshot(streamed) == library_snapshot(dom)
+    assert [len(getattr(streamed, name)) for name in ('song_list', 'movie_list', 'podcast_list', 'tvshow_list',
+                                                     'audiobook_list')] == [2, 1, 2, 1, 1]
+    assert streamed.parse_stats.unknown_keys == dom.parse_stats.unknown_keys == {
+        'Unknown Key': 1, 'Artwork Data': 1, 'Unknown Playlist Key': 1}
+    # the element tree is not kept
+    assert streamed.lib == 0 and dom.lib.tag == 'plist'
+
+
+def test_iter_library_items(write_library):
+    items = []
+    for kind, elem in iter_library_items(write_library(_tracks(), _playlists())):
+        # the number of children of each element as it is yielded
+        items.append((kind, len(elem)))
+    assert [kind for kind, _ in items] == ['track'] * 7 + ['end_tracks'] + ['playlist'] * 4 + ['end_playlists']
+    # a track dict is complete
+    assert items[0][1] == 2 * len(_tracks()[0])
+    # consumed dicts are dropped from their section
+    assert items[7][1] == 0 and items[-1][1] == 0
+
+
+def test_streaming_peak_memory(write_library):
+    tracks = [[("Track ID", track_id), ("Name", "Track %d" % track_id), ("Artist", "Artist %d" % (track_id % 50)),
+               ("Total Time", 1000 * track_id), ("Location", 'file:///Users/me/Music/%d.mp3' % track_id)]
+              for track_id in range(1, 2001)]
+    path = write_library(tracks, [([("Name", "All"), ("Playlist ID", 100)], list(range(1, 2001)))])
+    peaks = {}
+    for streaming in (False, True):
+        tracemalloc.start()
+        try:
+            library = _parse(path, streaming=streaming)
+            peaks[streaming] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert len(library.track_map) == 2000
+        del library
+    # the DOM holds every element of the file on top of the tracks
+    assert peaks[True] * 2 < peaks[False]
+
+
+@pytest.mark.parametrize('text, value', [
+    ('2019-04-01T10:32:07Z', datetime(2019, 4, 1, 10, 32, 7)),
+    ('1904-01-01T00:00:00Z', datetime(1904, 1, 1)),
+    ('2020-02-29T23:59:59Z', datetime(2020, 2, 29, 23, 59, 59)),
+])
+def test_decode_plist_date(text, value):
+    IReadiTunes._date_cache.clear()
+    assert decode_plist_date(text) == value
+    # repeated timestamps share one datetime
+    assert decode_plist_date(text) is decode_plist_date(text)
+    assert decode_plist_date(text) == datetime.strptime(text, IReadiTunes.PLIST_DATE_FORMAT)
+
+
+@pytest.mark.parametrize('text', ['2019-04-01T10:32:07', '2019-13-01T10:32:07Z', '2019-04-01 10:32:07Z', ''])
+def test_decode_plist_date_invalid(text):
+    with pytest.raises(ValueError):
+        decode_plist_date(text)
+
+
+def test_date_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(IReadiTunes, '_DATE_CACHE_SIZE', 3)
+    IReadiTunes._date_cache.clear()
+    for second in range(10):
+        decode_plist_date('2019-04-01T10:32:%02dZ' % second)
+        assert len(IReadiTunes._date_cache) <= 3
+
+
+def test_attribute_index():
+    assert len(TRACK_ATTRIBUTE_INDEX) == len(TRACK_ATTRIBUTE_NAMES) == len(TRACK_FIELD_NAMES)
+    assert TRACK_FIELD_NAMES[TRACK_ATTRIBUTE_INDEX["Play Date UTC"]] == 'play_date_utc'
+    assert TRACK_FIELD_NAMES[TRACK_ATTRIBUTE_INDEX["Album Artist"]] == 'album_artist'
+
+
+def test_decode_plist_dict(caplog):
+    elem = ET.fromstring(
+        '<dict><key>Track ID</key><integer>-7</integer><key>Name</key><string>A &amp; B</string>'
+        '<key>Artist</key><string/><key>Loved</key><true/><key>Compilation</key><false/>'
+        '<key>Date Added</key><date>2019-04-01T10:32:07Z</date><key>Rating</key><real>80.5</real>'
+        '<key>Other</key><integer>3</integer><key>Data</key><data>AAEC</data></dict>')
+    missing_attribute_tags = {'Other': 1}
+    att_list, extra_attributes, items = Library().decode_plist_dict(elem, TRACK_ATTRIBUTE_INDEX,
+                                                                    missing_attribute_tags)
+    values = dict(zip(TRACK_FIELD_NAMES, att_list))
+    assert (values['track_id'], values['name'], values['artist'], values['loved'], values['compilation']) == (
+        -7, 'A & B', None, True, False)
+    assert values['date_added'] == datetime(2019, 4, 1, 10, 32, 7)
+    # a tag without a decoder is kept as text and reported
+    assert values['rating'] == '80.5'
+    assert [record.getMessage() for record in caplog.records] == [
+        "What to do for plist attribute 'Rating' of type 'real', value '80.5'"]
+    assert extra_attributes == {'Other': 3, 'Data': 'AAEC'} and items is None
+    assert missing_attribute_tags == {'Other': 2, 'Data': 1}
+
+
+def test_playlist_items():
+    elem = ET.fromstring(
+        '<dict><key>Name</key><string>Mix</string><key>Playlist ID</key><integer>5</integer>'
+        '<key>Playlist Items</key><array><dict><key>Track ID</key><integer>2</integer></dict></array></dict>')
+    att_list, extra_attributes, items = Library().decode_plist_dict(elem, PLAYLIST_ATTRIBUTE_INDEX, {},
+                                                                    "Playlist Items")
+    assert att_list[PLAYLIST_ATTRIBUTE_INDEX["Name"]] == 'Mix'
+    assert att_list[PLAYLIST_ATTRIBUTE_INDEX["Playlist ID"]] == 5
+    assert items.tag == 'array' and len(items) == 1 and extra_attributes == {}
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_parse_stats(write_library, capsys, caplog, streaming):
+    caplog.set_level(logging.INFO)
+    library = _parse(write_library(_tracks(), _playlists()), streaming=streaming)
+    stats = library.parse_stats
+    assert (stats.tracks, stats.playlists, stats.memberships) == (7, 4, 11)
+    assert stats.unknown_keys == {'Unknown Key': 1, 'Artwork Data': 1, 'Unknown Playlist Key': 1}
+    phases = ['display_paths', 'playlists', 'tracks'] if streaming else ['display_paths', 'playlists', 'tracks',
+                                                                          'xml_load']
+    assert sorted(stats.timings) == phases and all(seconds >= 0 for seconds in stats.timings.values())
+    assert stats.as_dict() == {'timings': stats.timings, 'tracks': 7, 'playlists': 4, 'memberships': 11,
+                               'unknown_keys': stats.unknown_keys}
+    assert repr(stats).startswith('<ParseStats 7 tracks, 4 playlists, 11 memberships, 3 unknown keys, ')
+    # diagnostics are logged, nothing is printed
+    assert capsys.readouterr().out == ''
+    assert [record.getMessage() for record in caplog.records] == [
+        'tracks: keys without attribute, kept in extra_attributes: Artwork Data, Unknown Key',
+        'playlists: keys without attribute, kept in extra_attributes: Unknown Playlist Key']
+    # a new parse starts new stats
+    library.parse(write_library([_tracks()[0]], name='one.xml'), streaming=streaming)
+    assert library.parse_stats is not stats and library.parse_stats.playlists == 0
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_progress(write_library, monkeypatch, streaming):
+    monkeypatch.setattr(IReadiTunes, 'PROGRESS_INTERVAL', 2)
+    calls = []
+    library = _parse(write_library(_tracks(), _playlists()), streaming=streaming,
+                     progress=lambda phase, done, total: calls.append((phase, done, total)))
+    # the totals are known from the tree, not while streaming
+    tracks_total, playlists_total = (None, None) if streaming else (7, 4)
+    assert calls == [('tracks', 2, tracks_total), ('tracks', 4, tracks_total), ('tracks', 6, tracks_total),
+                     ('tracks', 7, tracks_total), ('playlists', 2, playlists_total), ('playlists', 4, playlists_total)]
+    assert library._progress is None and library._progress_total is None
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Playlist members, the track to playlists index, set operations between playlists and the folder tree.
+"""
+
+from array import array
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library
+
+
+def _playlist(name, number, parent=None, folder=False):
+    attributes = [("Name", name), ("Playlist ID", 100 + number),
+                  ("Playlist Persistent ID", '%016X' % (0xF000 + number))]
+    if parent is not None:
+        attributes.append(("Parent Persistent ID", '%016X' % (0xF000 + parent)))
+    if folder:
+        attributes.append(("Folder", True))
+    return attributes
+
+
+TRACKS = [[("Track ID", track_id), ("Name", "Track %d" % track_id)] for track_id in range(1, 7)]
+
+PLAYLISTS = [(_playlist("Library", 0), [1, 2, 3, 4, 5, 6]),
+             (_playlist("Rock", 1), [3, 1, 5, 1]),
+             (_playlist("Jazz", 2), [2, 5, 4]),
+             (_playlist("Empty", 3), [])]
+
+
+@pytest.fixture
+def library(write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, PLAYLISTS))
+    return library
+
+
+def _names(playlists):
+    return [playlist.name for playlist in playlists]
+
+
+def test_members(library):
+    rock = library.playlists[1]
+    assert rock.track_ids == array('i', [3, 1, 5, 1])
+    assert len(rock.tracks) == 4
+    assert list(rock.tracks) == [(track_id, library.track_map[track_id]) for track_id in (3, 1, 5, 1)]
+    assert rock.tracks[0] == (3, library.track_map[3]) and rock.tracks[-1][1] is library.track_map[1]
+    assert rock.tracks[1:3] == [(1, library.track_map[1]), (5, library.track_map[5])]
+    assert rock.track_id_set() == frozenset([1, 3, 5])
+    assert rock.contains_track(5) and not rock.contains_track(2)
+    assert len(library.playlists[3].tracks) == 0 and library.playlists[3].track_id_set() == frozenset()
+
+
+def test_unknown_member(write_library):
+    with pytest.raises(KeyError):
+        Library().parse(write_library(TRACKS, [(_playlist("Broken", 1), [1, 7])]))
+
+
+def test_set_operations(library):
+    rock, jazz, empty = library.playlists[1:]
+    assert rock.union(jazz) == array('i', [3, 1, 5, 1, 2, 4])
+    assert rock.intersection(jazz) == array('i', [5])
+    assert rock.difference(jazz) == array('i', [3, 1, 1])
+    assert jazz.difference(rock) == array('i', [2, 4])
+    # with Track IDs instead of a playlist
+    assert jazz.union([6, 2, 6]) == array('i', [2, 5, 4, 6])
+    assert rock.intersection((1, 2)) == array('i', [1, 1])
+    assert rock.difference(array('i', [1])) == array('i', [3, 5])
+    assert empty.union(jazz) == jazz.track_ids and rock.intersection(empty) == array('i')
+    # the playlists are left as they were
+    assert rock.track_ids == array('i', [3, 1, 5, 1]) and jazz.track_ids == array('i', [2, 5, 4])
+
+
+def test_playlists_for_track(library):
+    assert _names(library.playlists_for_track(1)) == ['Library', 'Rock']
+    assert _names(library.playlists_for_track(5)) == ['Library', 'Rock', 'Jazz']
+    assert _names(library.playlists_for_track(6)) == ['Library']
+    assert library.playlists_for_track(99) == []
+    for track_id in library.track_map:
+        assert library.playlists_for_track(track_id) == [playlist for playlist in library.playlists
+                                                         if track_id in playlist.track_ids]
+
+
+def test_playlists_for_track_after_changes(library, write_library):
+    assert _names(library.playlists_for_track(6)) == ['Library']
+    # a playlist added to the library
+    added = Library()
+    added.parse(write_library(TRACKS, [(_playlist("Six", 4), [6])], name='added.xml'))
+    library.playlists.append(added.playlists[0])
+    assert _names(library.playlists_for_track(6)) == ['Library', 'Six']
+    # a new list of playlists, as update leaves
+    library.playlists = [added.playlists[0], library.playlists[1]]
+    assert _names(library.playlists_for_track(6)) == ['Six']
+    assert _names(library.playlists_for_track(1)) == ['Rock']
+
+
+TREE = [(_playlist("Library", 0), [1, 2, 3]),
+        (_playlist("Music", 1, folder=True), []),
+        (_playlist("Rock: 70's", 2, parent=1, folder=True), []),
+        (_playlist("Best [live]", 3, parent=2), [1]),
+        (_playlist("Jazz", 4, parent=1), [2]),
+        # its parent is not in the library
+        (_playlist("Orphan", 5, parent=99), [3]),
+        # 6 and 7 are each the parent of the other, 8 is under 7, 9 is its own parent
+        (_playlist("Loop A", 6, parent=7), []),
+        (_playlist("Loop B", 7, parent=6), []),
+        (_playlist("Under B", 8, parent=7), []),
+        (_playlist("Self", 9, parent=9), []),
+        # the same path as Jazz
+        (_playlist("Jazz", 10, parent=1), [3])]
+
+
+@pytest.fixture
+def tree(write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, TREE))
+    return library
+
+
+def _paths(playlists):
+    return [playlist.display_path for playlist in playlists]
+
+
+def test_display_paths(tree):
+    assert _paths(tree.playlists) == ['/Library', '/Music', "/Music/Rock_ 70_s", "/Music/Rock_ 70_s/Best _live",
+                                      '/Music/Jazz', '/Orphan', '/Loop A', '/Loop A/Loop B', '/Loop A/Loop B/Under B',
+                                      '/Self', '/Music/Jazz']
+    # the first of two playlists with the same path is found by it
+    assert tree.get_playlist_by_display_path('/Music/Jazz') is tree.playlists[4]
+    assert tree.get_playlist_by_display_path("/Music/Rock_ 70_s/Best _live").track_ids == array('i', [1])
+    assert tree.get_playlist_by_display_path('/Missing') is None
+
+
+def test_tree(tree):
+    by_name = dict((playlist.name, playlist) for playlist in tree.playlists[:10])
+    assert _names(tree.root_playlists) == ['Library', 'Music', 'Orphan', 'Loop A', 'Self']
+    assert _names(by_name['Music'].children) == ["Rock: 70's", 'Jazz', 'Jazz']
+    assert by_name['Best [live]'].parent is by_name["Rock: 70's"]
+    # a loop is cut at its first playlist in library order
+    assert by_name['Loop A'].parent is None and by_name['Loop B'].parent is by_name['Loop A']
+    assert _names(by_name['Loop A'].children) == ['Loop B'] and _names(by_name['Loop B'].children) == ['Under B']
+    assert by_name['Orphan'].parent is None and by_name['Self'].parent is None and by_name['Self'].children == []
+    # every playlist is in the tree once
+    assert sorted(map(id, tree.iter_playlist_subtree())) == sorted(map(id, tree.playlists))
+
+
+def test_subtree(tree):
+    assert _names(tree.iter_playlist_subtree('/Music')) == ['Music', "Rock: 70's", 'Best [live]', 'Jazz', 'Jazz']
+    assert _names(tree.playlists[1].iter_subtree()) == _names(tree.iter_playlist_subtree(tree.playlists[1]))
+    assert _names(tree.iter_playlist_subtree('/Loop A')) == ['Loop A', 'Loop B', 'Under B']
+    assert _names(tree.iter_playlist_subtree())[:3] == ['Library', 'Music', "Rock: 70's"]
+    with pytest.raises(KeyError):
+        list(tree.iter_playlist_subtree('/Missing'))
+
+
+def test_tree_is_rebuilt(tree, library_snapshot):
+    before = library_snapshot(tree)
+    tree.generate_playlist_dislay_paths()
+    assert library_snapshot(tree) == before
+    # moved out of its folder
+    tree.playlists[3].parent_persistent_id = None
+    tree.generate_playlist_dislay_paths()
+    assert tree.playlists[3].display_path == '/Best _live' and tree.playlists[2].children == []
+    assert tree.get_playlist_by_display_path("/Music/Rock_ 70_s/Best _live") is None
+
+
+def test_downloaded_playlists(write_library):
+    playlists = [(_playlist("Downloaded", number) + [("Distinguished Kind", kind)], [])
+                 for number, kind in ((1, 65), (2, 66), (3, 67), (4, 22))]
+    library = Library()
+    library.parse(write_library(TRACKS, playlists))
+    assert _paths(library.playlists) == ['/Downloaded_music', '/Downloaded_movies', '/Downloaded_tv_shows',
+                                         '/Downloaded_22']
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Indexed track queries, and their asyncio variants.
+"""
+
+import asyncio
+import sys
+import threading
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.store import StoredLibrary
+
+GENRES = ['Rock', 'Jazz', 'Pop']
+
+TRACKS = [[("Track ID", track_id), ("Name", "Track %d" % track_id), ("Artist", "Artist %d" % (track_id % 7)),
+           ("Genre", GENRES[track_id % 3]), ("Year", 1990 + track_id % 20)] for track_id in range(1, 301)]
+
+
+@pytest.fixture(params=['library', 'stored'])
+def library(request, tmp_path, write_library):
+    library = Library()
+    library.parse(write_library(TRACKS))
+    if request.param == 'library':
+        yield library
+        return
+    path = str(tmp_path / 'library.db')
+    library.export_sqlite(path)
+    stored = StoredLibrary(path)
+    yield stored
+    stored.close()
+
+
+def test_where(library):
+    tracks = library.tracks.where(genre='Rock', year__gte=2005)
+    assert [track.track_id for track in tracks] == [track_id for track_id in range(1, 301)
+                                                    if track_id % 3 == 0 and track_id % 20 >= 15]
+    assert library.tracks.count(artist__iexact='ARTIST 3') == len([i for i in range(1, 301) if i % 7 == 3])
+    assert library.tracks.get(name__startswith='Track 29').track_id == 29
+    assert library.tracks.get(genre='Blues') is None
+
+
+def test_async_queries(library):
+    async def run():
+        # several queries at once, the first ones build the indexes in worker threads
+        return await asyncio.gather(library.tracks.awhere(genre='Rock'), library.tracks.awhere(genre='Jazz'),
+                                    library.tracks.acount(year__lt=2000), library.tracks.aget(artist='Artist 5'),
+                                    library.tracks.awhere(genre='Rock', year=1995))
+
+    rock, jazz, count, track, rock_1995 = asyncio.run(run())
+    assert [track.track_id for track in rock] == [track_id for track_id in range(1, 301) if track_id % 3 == 0]
+    assert [track.track_id for track in jazz] == [track_id for track_id in range(1, 301) if track_id % 3 == 1]
+    assert count == len([track_id for track_id in range(1, 301) if track_id % 20 < 10])
+    assert track.track_id == 5
+    assert [track.track_id for track in rock_1995] == [45, 105, 165, 225, 285]
+
+
+
+def test_queries_while_the_library_changes(write_library):
+    # the library switches between two states with different track orders while
+    # several threads query it; every result must come entirely from one state
+    library = Library()
+    library.parse(write_library(TRACKS[::-1][:250], name='second.xml'))
+    second = library.get_state()
+    library = Library()
+    library.parse(write_library(TRACKS, name='first.xml'))
+    first = library.get_state()
+    expected = [[track for track in state['track_map'].values() if track.genre == 'Rock' and track.year >= 2000]
+                for state in (first, second)]
+    stop = threading.Event()
+    errors = []
+
+    def swap():
+        while not stop.is_set():
+            library.set_state(first)
+            library.set_state(second)
+
+    def query():
+        try:
+            for _ in range(1000):
+                if library.tracks.where(genre='Rock', year__gte=2000) not in expected:
+                    errors.append('where')
+                if library.tracks.get(genre='Rock', year__gte=2000) not in (expected[0][0], expected[1][0]):
+                    errors.append('get')
+        except Exception as e:
+            errors.append(repr(e))
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    threads = [threading.Thread(target=query) for _ in range(4)]
+    swapper = threading.Thread(target=swap)
+    try:
+        swapper.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        stop.set()
+        swapper.join()
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Full-text search: tokens, prefix and fuzzy matching, ranking, and the index kept in sync with update.
+"""
+
+from datetime import datetime
+
+import pytest
+
+import IReadiTunes.search as search
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.search import InvertedIndex, edit_distance, tokenize, trigrams
+
+# name, artist, comments
+DOCUMENTS = {
+    1: (u'Yesterday', u'The Beatles', None),
+    2: (u'Let It Be', u'The Beatles', u'yesterday once more'),
+    3: (u'Beatles Medley', u'Cover Band', None),
+    4: (u'Café del Mar', u'Energy 52', u'Beetles and beatniks'),
+    5: (u'Yellow Submarine', u'The Beatles', None),
+    6: (u'Submarino', u'Los Beatles', u'Live'),
+    7: (u'Be', u'Bee Gees', u'let it be'),
+}
+
+
+def _index():
+    index = InvertedIndex([8, 6, 1])
+    for document, texts in DOCUMENTS.items():
+        index.add(document, texts)
+    return index
+
+
+def _brute_force(index, query, prefix=True, fuzzy=True):
+    """Returns {document: score} of every document matching query, scored term by term"""
+    terms = tokenize(query)
+    scores = {}
+    for document, tokens in index.document_tokens.items():
+        weights = dict(tokens)
+        total = 0
+        for position, term in enumerate(terms):
+            matches = index.expand(term, prefix and position == len(terms) - 1, fuzzy)
+            best = max([weights[token] * quality for token, quality in matches if token in weights] or [0])
+            if not best:
+                break
+            total += best
+        else:
+            scores[document] = total
+    return scores
+
+
+@pytest.mark.parametrize('text, tokens', [
+    (u'Café  del-Mar', ['cafe', 'del', 'mar']),
+    (u'ÉTÉ Straße', ['ete', 'strasse']),
+    (u'AC/DC 2', ['ac', 'dc', '2']),
+    (None, []),
+])
+def test_tokenize(text, tokens):
+    assert tokenize(text) == tokens
+
+
+def test_trigrams_and_edit_distance():
+    assert trigrams('abcd') == {'$ab', 'abc', 'bcd', 'cd$'}
+    assert trigrams('a') == {'$a$'}
+    assert edit_distance('beatles', 'beetles', 2) == 1
+    assert edit_distance('beatles', 'baetles', 2) == 2
+    assert edit_distance('beatles', 'bottles', 1) == 2
+    assert edit_distance('abc', 'abcdef', 2) == 3
+
+
+def test_expand():
+    index = _index()
+    assert index.expand('beatles') == [('beatles', 1.0)]
+    assert sorted(index.expand('be', prefix=True)) == [('be', 1.0), ('beatles', 0.75), ('beatniks', 0.75),
+                                                      ('bee', 0.75), ('beetles', 0.75)]
+    # too short to be a prefix
+    assert index.expand('b', prefix=True) == []
+    # fuzzy only when nothing matched exactly
+    assert index.expand('beatles', fuzzy=True) == [('beatles', 1.0)]
+    assert sorted(index.expand('beatls', fuzzy=True)) == [('beatles', 0.5)]
+    assert index.expand('beatls') == []
+    # one edit below FUZZY_TWO_EDITS_LENGTH, two from it
+    assert index.expand('submrne', fuzzy=True) == []
+    assert index.expand('submerrine', fuzzy=True) == [('submarine', 0.3)]
+    # too short to be fuzzy
+    assert index.expand('bea', fuzzy=True) == []
+
+
+def test_ranking():
+    index = _index()
+    # a match in the name before one in the artist, before one in the comments
+    assert [document for document, _ in index.search('yesterday')] == [1, 2]
+    results = index.search('beatles', prefix=False, fuzzy=False)
+    assert results[0] == (3, 8) and sorted(results[1:]) == [(1, 6), (2, 6), (5, 6), (6, 6)]
+    # exact before prefix, before a fuzzy match
+    assert index.search('beetle') == [(4, 0.75)]
+    assert index.search('submarine') == [(5, 8)]
+    assert index.search('submarne') == [(5, 4.0), (6, 8 * 0.3)]
+    assert index.search('beatles submarine')[0] == (5, 14)
+    assert index.search('nothing here') == [] and index.search('') == [] and index.search('beatles', limit=0) == []
+
+
+@pytest.mark.parametrize('score_each_ratio', [0, 16, 1000])
+@pytest.mark.parametrize('query', ['beatles', 'the beatles', 'be', 'let be', 'beatls yelow', 'the bea', 'submarin',
+                                   'cafe energy', 'live be'])
+def test_same_scores_as_brute_force(monkeypatch, query, score_each_ratio):
+    # 0 always takes the combinations of tiers, 1000 always scores each candidate
+    monkeypatch.setattr(search, 'SCORE_EACH_RATIO', score_each_ratio)
+    index = _index()
+    expected = _brute_force(index, query)
+    results = index.search(query, limit=100)
+    assert dict(results) == expected
+    assert [score for _, score in results] == sorted(expected.values(), reverse=True)
+    # the best ones within a limit
+    limited = index.search(query, limit=2)
+    assert [score for _, score in limited] == sorted(expected.values(), reverse=True)[:2]
+    assert all(expected[document] == score for document, score in limited)
+
+
+def test_remove():
+    index = _index()
+    index.remove(4)
+    index.remove(4)
+    assert 'beetles' not in index.vocabulary and 'cafe' not in index.postings
+    assert all('beetles' not in tokens for tokens in index.trigram_tokens.values())
+    assert index.expand('beetles', prefix=True) == [] and index.search('cafe') == []
+    # re-adding a document replaces its tokens
+    index.add(1, (u'Tomorrow', None, None))
+    assert index.search('yesterday') == [(2, 1)]
+    assert len(index) == 6
+
+
+def _track(track_id, name, artist, album=None, modified=1):
+    track = [("Track ID", track_id), ("Name", name), ("Artist", artist), ("Date Modified", datetime(2020, 1, modified))]
+    if album is not None:
+        track.append(("Album", album))
+    return track + [("Persistent ID", '%016X' % (0xAB00 + track_id))]
+
+
+TRACKS = [_track(1, u'Yesterday', u'The Beatles', u'Help!'), _track(2, u'Let It Be', u'The Beatles'),
+          _track(3, u'Stayin Alive', u'Bee Gees'), _track(4, u'Café del Mar', u'Energy 52')]
+PLAYLISTS = [([("Name", "Summer Party"), ("Playlist ID", 100), ("Playlist Persistent ID", 'F000000000000001')],
+              [1, 2]),
+             ([("Name", "Party Classics"), ("Playlist ID", 101), ("Playlist Persistent ID", 'F000000000000002')],
+              [3])]
+
+
+def _ids(tracks):
+    return sorted(track.track_id for track in tracks)
+
+
+def test_library_search(write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, PLAYLISTS))
+    assert _ids(library.search('beatls')) == [1, 2]
+    assert _ids(library.search('beatles help')) == [1]
+    assert _ids(library.search('cafe')) == [4]
+    assert [playlist.name for playlist in library.search_playlists('summer part')] == ['Summer Party']
+    assert sorted(playlist.name for playlist in library.search_playlists('party')) == ['Party Classics',
+                                                                                     'Summer Party']
+
+
+def test_sync_after_update(write_library, library_text):
+    path = write_library(TRACKS, PLAYLISTS)
+    library = Library()
+    library.parse(path)
+    index = library.search_index
+    assert index.sync() == 4 and index.sync() == 0
+    assert _ids(library.search('yesterday')) == [1]
+
+    tracks = [_track(1, u'Tomorrow', u'The Beatles', u'Help!', modified=2), TRACKS[1], TRACKS[3],
+              _track(5, u'Yellow', u'Coldplay')]
+    playlists = [([("Name", "Winter Party"), ("Playlist ID", 100), ("Playlist Persistent ID", 'F000000000000001')],
+                  [1, 2])]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(library_text(tracks, playlists))
+    library.update(path)
+    # track 1 changed, 3 removed and 5 added, 2 and 4 are kept as they were
+    assert index.sync() == 3
+    assert index.tracks.document_tokens.keys() == library.track_map.keys()
+    assert library.search('yesterday') == [] and library.search('gees') == []
+    assert _ids(library.search('tomorrow')) == [1] and _ids(library.search('yelow')) == [5]
+    assert _ids(library.search('beatles')) == [1, 2]
+    assert [playlist.name for playlist in library.search_playlists('party')] == ['Winter Party']
+    assert 'yesterday' not in index.tracks.vocabulary and 'stayin' not in index.tracks.vocabulary
+
+    # the same as an index built from scratch
+    fresh = Library()
+    fresh.parse(path)
+    fresh.search_index.sync()
+    assert index.tracks.postings == fresh.search_index.tracks.postings
+    assert index.tracks.vocabulary == fresh.search_index.tracks.vocabulary
+    assert index.tracks.trigram_tokens == fresh.search_index.tracks.trigram_tokens
+
+
+def test_update_tracks(write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, PLAYLISTS))
+    assert _ids(library.search('yesterday')) == [1]
+    library.track_map[1].name = u'Tomorrow'
+    del library.track_map[4]
+    library.search_index.update_tracks([1, 4])
+    assert library.search('yesterday') == [] and _ids(library.search('tomorrow')) == [1]
+    assert library.search('cafe') == []
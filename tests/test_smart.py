@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Smart playlist blobs: decoding real iTunes blobs and evaluating them.
+
+The blobs were written by iTunes, they come from the tests of itunessmart
+(https://github.com/cvzi/itunessmart, MIT License, Copyright (c) cuzi 2018).
+"""
+
+import base64
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.smart import (decode_smart_criteria, decode_smart_info, decode_smart_playlist, KIND_GROUP,
+                               RULE_CONTAINS, RULE_GREATER, RULE_IS, RULE_OTHER, SmartPlaylistEvaluator)
+
+# live updating, no limit
+INFO = ('AQEAAwAAAAIAAAAZAAAAAAAAAAcAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+        'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA==')
+# limited to 9876 MB selected by random
+INFO_LIMIT_MB_RANDOM = ('AQEBAgAAAAIAACaUAAAAAAAAAAcAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                        'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA==')
+# limited to 25 items selected by highest rating
+INFO_LIMIT_25_RATED = ('AQEBAwAAABwAAAAZAQAAAAAAAAcAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+                       'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA==')
+
+# Album Artist is "Beenie Man" and Album is "Art and Life"
+ALBUM_ARTIST_AND_ALBUM = (
+    'U0xzdAABAAEAAAACAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEcBAAAB'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAUAEIAZQBlAG4AaQBlACAATQBhAG4AAAAD'
+    'AQAAAQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAGABBAHIAdAAgAGEAbgBkACAATABp'
+    'AGYAZQ==')
+# Plays is 999999
+PLAYS_IS = (
+    'U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABYAAAAB'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAAAAPQj8AAAAAAAAAAAAAAAAAAAAB'
+    'AAAAAAAPQj8AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Plays is in the range of 512 to 999999
+PLAYS_RANGE = (
+    'U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABYAAAEA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAAAAAAgAAAAAAAAAAAAAAAAAAAAAB'
+    'AAAAAAAPQj8AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Date Modified is after 3/16/2015
+MODIFIED_AFTER = (
+    'U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAoAAAAQ'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAANEtHv8AAAAAAAAAAAAAAAAAAAAB'
+    'AAAAANEtHv8AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Date Modified is in the range of 3/16/2015 to 3/16/2015
+MODIFIED_RANGE = (
+    'U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAoAAAEA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAANErzYAAAAAAAAAAAAAAAAAAAAAB'
+    'AAAAANEtHv8AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Date Added is in the last 1 weeks
+ADDED_IN_LAST_WEEK = (
+    'U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABAAAAIA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABELa4tri2uLa7//////////wAAAAAACTqA'
+    'La4tri2uLa4AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Date Added is not in the last 1 months
+ADDED_NOT_IN_LAST_MONTH = (
+    'U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABACAAIA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABELa4tri2uLa7//////////wAAAAAAKBmg'
+    'La4tri2uLa4AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Playlist is 2271DF30754D3E1A
+IN_PLAYLIST = (
+    'U0xzdAABAAEAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAACgAAAAB'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEInHfMHVNPhoAAAAAAAAAAAAAAAAAAAAB'
+    'InHfMHVNPhoAAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+# Artist contains "A" and all of (Artist contains "Ap", Artist contains "OB")
+ARTIST_ALL_GROUP = (
+    'U0xzdAABAAEAAAACAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAQBAAAC'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAACAEEAAAAAAAAAAQEAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABAFNMc3QAAQABAAAAAgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEAQAAAgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAABABBAHAAAAAEAQAAAgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABABP'
+    'AEI=')
+# Plays > 15 and any of (Plays > 16, Plays > 17, Plays > 18) and Rating > 89
+PLAYS_ANY_GROUP = (
+    'U0xzdAABAAEAAAADAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABYAAAAQ'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAAAAAAA8AAAAAAAAAAAAAAAAAAAAB'
+    'AAAAAAAAAA8AAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAQEAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAB/FNMc3QAAQABAAAAAwAAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAWAAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAARAAAAAAAAAAQAAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAQAAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAFgAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEQAAAAAAAAAEQAAAAAAAAAA'
+    'AAAAAAAAAAEAAAAAAAAAEQAAAAAAAAAAAAAAAAAAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABYAAAAQAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAAAAAABIAAAAAAAAAAAAAAAAAAAABAAAAAAAAABIAAAAA'
+    'AAAAAAAAAAAAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAZAAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAARAAAAAAAAABZAAAAAAAAAAAAAAAAAAAAAQAAAAAAAABZAAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAA')
+# any of (Media Kind is Music, Media Kind is Music Video) and any of (BPM is 60, BPM is in the range of 70 to 80)
+MEDIA_KIND_BPM = (
+    'U0xzdAABAAEAAAACAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAB'
+    'AQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAGAU0xzdAABAAEAAAACAAAAAQAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAADwAAAABAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAABEAAAAAAAAAAEAAAAAAAAAAAAAAAAAAAABAAAAAAAAAAEAAAAAAAAAAAAAAAAAAAAB'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA8AAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAARAAAAAAAAAAgAAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAgAAAAAAAAAAAAAAAAAAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAEBAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAYBTTHN0AAEAAQAAAAIAAAAB'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAIwAAAAEAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEQAAAAAAAAAPAAAAAAAAAAAAAAAAAAAAAEAAAAAAAAAPAAAAAAAAAAA'
+    'AAAAAAAAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAACMAAAEAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAABEAAAAAAAAAEYAAAAAAAAAAAAAAAAAAAABAAAAAAAAAFAAAAAAAAAAAAAAAAAAAAABAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAA=')
+
+NOW = datetime(2020, 6, 1, 12, 0)
+
+TRACKS = [
+    [("Track ID", 1), ("Name", "Zion"), ("Artist", "Beenie Man"), ("Album Artist", "Beenie Man"),
+     ("Album", "Art and Life"), ("Play Count", 20), ("Rating", 100), ("Date Added", NOW - timedelta(days=3)),
+     ("Date Modified", datetime(2015, 3, 17, 8, 0))],
+    [("Track ID", 2), ("Name", "Sunday"), ("Artist", "Apollo Bob"), ("Album", "Other"), ("Play Count", 17),
+     ("Rating", 40), ("Date Added", datetime(2010, 1, 1)), ("Date Modified", datetime(2015, 3, 16, 12, 0))],
+    [("Track ID", 3), ("Name", "Waterloo"), ("Artist", "Abba"), ("Album", "Art and Life"), ("Play Count", 999999),
+     ("Rating", 100), ("Date Added", NOW - timedelta(days=60)), ("Date Modified", datetime(2015, 3, 1))],
+    [("Track ID", 4), ("Name", "Bohemian Rhapsody"), ("Artist", "Queen"), ("Album", "A Night at the Opera"),
+     ("Date Added", NOW - timedelta(days=10)), ("Date Modified", datetime(2015, 3, 1))],
+]
+
+
+def _playlist(index, criteria, info=INFO, members=(4,)):
+    attributes = [("Name", "Smart %d" % index), ("Playlist ID", 200 + index),
+                  ("Playlist Persistent ID", '%016X' % (0x5000000000000000 + index)), ("All Items", True),
+                  ("Smart Info", ('data', info)), ("Smart Criteria", ('data', criteria))]
+    return attributes, list(members)
+
+
+def _zero_filled(length):
+    return base64.b64encode(b'SLst' + bytes(length - 4)).decode('ascii')
+
+
+def _truncated(criteria, length):
+    return base64.b64encode(base64.b64decode(criteria)[:length]).decode('ascii')
+
+
+def _rules(smart_playlist):
+    return [(rule.attribute, rule.operator, rule.negated, rule.value, rule.value_b) for rule in smart_playlist.rules]
+
+
+def test_decode_strings():
+    smart_playlist = decode_smart_criteria(ALBUM_ARTIST_AND_ALBUM)
+    assert smart_playlist.match_all
+    assert _rules(smart_playlist) == [('album_artist', RULE_IS, False, 'Beenie Man', None),
+                                      ('album', RULE_IS, False, 'Art and Life', None)]
+
+
+def test_decode_numbers():
+    assert _rules(decode_smart_criteria(PLAYS_IS)) == [('play_count', RULE_IS, False, 999999, 999999)]
+    assert _rules(decode_smart_criteria(PLAYS_RANGE)) == [('play_count', RULE_OTHER, False, 512, 999999)]
+
+
+def test_decode_dates():
+    end_of_day = datetime(2015, 3, 16, 23, 59, 59)
+    assert _rules(decode_smart_criteria(MODIFIED_AFTER)) == [
+        ('date_modified', RULE_GREATER, False, end_of_day, end_of_day)]
+    assert _rules(decode_smart_criteria(MODIFIED_RANGE)) == [
+        ('date_modified', RULE_OTHER, False, datetime(2015, 3, 16), end_of_day)]
+
+
+def test_decode_relative_dates():
+    rule, = decode_smart_criteria(ADDED_IN_LAST_WEEK).rules
+    assert (rule.attribute, rule.relative, rule.negated, rule.value) == ('date_added', True, False, timedelta(weeks=1))
+    rule, = decode_smart_criteria(ADDED_NOT_IN_LAST_MONTH).rules
+    # iTunes months are 2628000 seconds
+    assert (rule.attribute, rule.relative, rule.negated, rule.value) == (
+        'date_added', True, True, timedelta(seconds=2628000))
+
+
+def test_decode_playlist_rule():
+    assert _rules(decode_smart_criteria(IN_PLAYLIST)) == [(None, RULE_IS, False, '2271DF30754D3E1A', None)]
+
+
+def test_decode_groups():
+    smart_playlist = decode_smart_criteria(ARTIST_ALL_GROUP)
+    artist, group = smart_playlist.rules
+    assert (artist.attribute, artist.operator, artist.value) == ('artist', RULE_CONTAINS, 'A')
+    assert group.kind == KIND_GROUP and group.value.match_all
+    assert _rules(group.value) == [('artist', RULE_CONTAINS, False, 'Ap', None),
+                                   ('artist', RULE_CONTAINS, False, 'OB', None)]
+
+    smart_playlist = decode_smart_criteria(PLAYS_ANY_GROUP)
+    assert smart_playlist.match_all and smart_playlist.supported
+    plays, group, rating = smart_playlist.rules
+    assert not group.value.match_all
+    assert [rule.value for rule in group.value.rules] == [16, 17, 18]
+    assert [rule.value for rule in smart_playlist.iter_rules()] == [15, group.value, 16, 17, 18, 89]
+
+
+def test_unknown_field_is_not_supported():
+    smart_playlist = decode_smart_criteria(MEDIA_KIND_BPM)
+    media_kind, bpm = smart_playlist.rules
+    assert not media_kind.value.match_all and not media_kind.supported
+    assert _rules(bpm.value) == [('bpm', RULE_IS, False, 60, 60), ('bpm', RULE_OTHER, False, 70, 80)]
+    assert not smart_playlist.supported
+
+
+def test_decode_info():
+    smart_playlist = decode_smart_info(INFO)
+    assert smart_playlist.live_update and smart_playlist.match_rules and not smart_playlist.limit
+    smart_playlist = decode_smart_info(INFO_LIMIT_MB_RANDOM)
+    assert smart_playlist.limit
+    assert (smart_playlist.limit_method, smart_playlist.limit_value, smart_playlist.selection_method) == (2, 9876, 2)
+    smart_playlist = decode_smart_info(INFO_LIMIT_25_RATED)
+    assert (smart_playlist.limit_method, smart_playlist.limit_value, smart_playlist.selection_method) == (3, 25, 0x1c)
+
+
+@pytest.mark.parametrize('criteria', [_zero_filled(140), _zero_filled(200), _zero_filled(8),
+                                      _truncated(ALBUM_ARTIST_AND_ALBUM, 150),
+                                      _truncated(ALBUM_ARTIST_AND_ALBUM, 200),
+                                      _truncated(PLAYS_ANY_GROUP, 400)])
+def test_malformed_criteria(criteria):
+    with pytest.raises(ValueError):
+        decode_smart_criteria(criteria)
+
+
+def test_malformed_playlist_is_not_supported(write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, [_playlist(1, _zero_filled(140))]))
+    playlist = library.get_playlist_by_display_path('/Smart 1')
+    smart_playlist = decode_smart_playlist(playlist)
+    assert smart_playlist.error is not None and not smart_playlist.supported
+    with pytest.raises(ValueError):
+        library.evaluate_smart_playlist(playlist, now=NOW)
+
+
+def test_unsupported_playlist_is_not_evaluated(write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, [_playlist(1, MEDIA_KIND_BPM)]))
+    playlist = library.get_playlist_by_display_path('/Smart 1')
+    with pytest.raises(ValueError):
+        library.evaluate_smart_playlist(playlist, now=NOW)
+    with pytest.raises(ValueError):
+        SmartPlaylistEvaluator(library, NOW).evaluate(decode_smart_playlist(playlist))
+
+
+@pytest.mark.parametrize('criteria, info, expected', [
+    (ALBUM_ARTIST_AND_ALBUM, INFO, [1]),
+    (PLAYS_IS, INFO, [3]),
+    (PLAYS_RANGE, INFO, [3]),
+    (MODIFIED_AFTER, INFO, [1]),
+    (MODIFIED_RANGE, INFO, [2]),
+    (ADDED_IN_LAST_WEEK, INFO, [1]),
+    (ADDED_NOT_IN_LAST_MONTH, INFO_LIMIT_MB_RANDOM, [2, 3]),
+    (IN_PLAYLIST, INFO, [2]),
+    (ARTIST_ALL_GROUP, INFO, [2]),
+    (PLAYS_ANY_GROUP, INFO, [1, 3]),
+])
+def test_evaluate(write_library, criteria, info, expected):
+    member_of = ([("Name", "Members"), ("Playlist ID", 100), ("Playlist Persistent ID", '2271DF30754D3E1A'),
+                  ("All Items", True)], [2])
+    library = Library()
+    library.parse(write_library(TRACKS, [member_of, _playlist(1, criteria, info)]))
+    playlist = library.get_playlist_by_display_path('/Smart 1')
+    assert sorted(library.evaluate_smart_playlist(playlist, now=NOW)) == expected
+
+
+@pytest.mark.parametrize('now', [NOW, NOW.replace(tzinfo=timezone.utc),
+                                 datetime(2020, 6, 1, 14, 0, tzinfo=timezone(timedelta(hours=2)))])
+def test_evaluate_now(write_library, now):
+    library = Library()
+    library.parse(write_library(TRACKS, [_playlist(1, ADDED_IN_LAST_WEEK)]))
+    playlist = library.get_playlist_by_display_path('/Smart 1')
+    assert list(library.evaluate_smart_playlist(playlist, now=now)) == [1]
+    # a week after NOW, the track added 3 days before it is no longer in the last week
+    assert list(library.evaluate_smart_playlist(playlist, now=now + timedelta(days=5))) == []
+
+
+def test_evaluate_default_now(write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, [_playlist(1, ADDED_IN_LAST_WEEK)]))
+    assert list(library.evaluate_smart_playlist(library.get_playlist_by_display_path('/Smart 1'))) == []
+
+
+def test_refresh_leaves_undecodable_playlists(write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, [_playlist(1, ALBUM_ARTIST_AND_ALBUM),
+                                         _playlist(2, _zero_filled(140)),
+                                         _playlist(3, _zero_filled(200)),
+                                         _playlist(4, _truncated(PLAYS_IS, 180)),
+                                         _playlist(5, MEDIA_KIND_BPM)]))
+    assert library.refresh_smart_playlists(now=NOW) == ['5000000000000001']
+    members = dict((playlist.name, list(playlist.track_ids)) for playlist in library.playlists)
+    assert members == {'Smart 1': [1], 'Smart 2': [4], 'Smart 3': [4], 'Smart 4': [4], 'Smart 5': [4]}
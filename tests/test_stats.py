@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+LibraryStats: aggregates over the whole library and per group, with and without NumPy.
+"""
+
+from datetime import datetime
+
+import pytest
+
+import IReadiTunes.stats as stats
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.stats import LibraryStats
+
+
+def _track(track_id, genre, artist, total_time=None, play_count=None, **values):
+    track = [("Track ID", track_id), ("Name", "Track %d" % track_id)]
+    if genre is not None:
+        track.append(("Genre", genre))
+    if artist is not None:
+        track.append(("Artist", artist))
+    if total_time is not None:
+        track.append(("Total Time", total_time))
+    if play_count is not None:
+        track.append(("Play Count", play_count))
+    return track + sorted(values.items())
+
+
+TRACKS = [
+    _track(1, "Rock", "Muse", 200000, 10, **{"Skip Count": 1, "Date Added": datetime(1970, 1, 2)}),
+    _track(2, "Rock", "Muse", 300000, None, **{"Skip Count": 4}),
+    _track(3, "Jazz", "Miles", 600000, 2, **{"Date Added": datetime(1970, 1, 1, 0, 1)}),
+    _track(4, "Rock", "Blur", None, 5),
+    _track(5, None, "Blur", 100000, 0, **{"Skip Count": 4}),
+    # nothing to aggregate in its genre
+    _track(6, "Ambient", None),
+]
+
+
+@pytest.fixture(params=[False, True], ids=['python', 'numpy'])
+def library_stats(request, write_library):
+    if request.param:
+        pytest.importorskip('numpy')
+    library = Library()
+    library.parse(write_library(TRACKS))
+    return LibraryStats(library, use_numpy=request.param)
+
+
+def test_aggregate(library_stats):
+    assert library_stats.total('total_time') == 1200000.0
+    assert library_stats.mean('play_count') == 17 / 4.0
+    assert library_stats.aggregate('play_count', 'count') == 4
+    assert library_stats.aggregate('total_time', 'min') == 100000.0
+    assert library_stats.aggregate('skip_count', 'max') == 4.0
+    # dates as seconds since 1970
+    assert library_stats.aggregate('date_added', 'min') == 60.0 and library_stats.total('date_added') == 86460.0
+    # nothing to aggregate
+    assert library_stats.total('bpm') == 0.0 and library_stats.mean('bpm') is None
+    assert library_stats.aggregate('bpm', 'count') == 0 and library_stats.aggregate('bpm', 'max') is None
+    assert type(library_stats.total('play_count')) is float and type(library_stats.aggregate('size', 'count')) is int
+
+
+def test_group_by(library_stats):
+    assert library_stats.group_by('genre') == {'Rock': 3, 'Jazz': 1, None: 1, 'Ambient': 1}
+    assert library_stats.group_by('genre', 'total_time') == {'Rock': 500000.0, 'Jazz': 600000.0, None: 100000.0,
+                                                             'Ambient': 0.0}
+    assert library_stats.group_by('genre', 'play_count', 'mean') == {'Rock': 7.5, 'Jazz': 2.0, None: 0.0,
+                                                                     'Ambient': None}
+    assert library_stats.group_by('artist', 'skip_count', 'count') == {'Muse': 2, 'Miles': 0, 'Blur': 1, None: 0}
+    assert library_stats.group_by('artist', 'total_time', 'min') == {'Muse': 200000.0, 'Miles': 600000.0,
+                                                                     'Blur': 100000.0, None: None}
+    assert library_stats.group_by('artist', 'total_time', 'max') == {'Muse': 300000.0, 'Miles': 600000.0,
+                                                                     'Blur': 100000.0, None: None}
+    assert library_stats.group_by('loved') == {None: 6}
+
+
+def test_top(library_stats):
+    assert library_stats.top('artist', 'skip_count', k=2) == [('Muse', 5.0), ('Blur', 4.0)]
+    assert library_stats.top('genre', 'total_time', k=10) == [('Jazz', 600000.0), ('Rock', 500000.0),
+                                                              ('Ambient', 0.0)]
+    # empty groups and tracks without a key are not ranked
+    assert library_stats.top('artist', 'play_count', 'mean') == [('Muse', 10.0), ('Blur', 2.5), ('Miles', 2.0)]
+    assert library_stats.top('genre', k=1) == [('Rock', 3)]
+
+
+def test_same_as_pure_python(write_library):
+    pytest.importorskip('numpy')
+    library = Library()
+    library.parse(write_library(TRACKS))
+    python, numpy = LibraryStats(library, use_numpy=False), LibraryStats(library, use_numpy=True)
+    for op in stats.AGGREGATES:
+        for field in ('total_time', 'play_count', 'skip_count', 'date_added', 'bpm'):
+            assert numpy.aggregate(field, op) == python.aggregate(field, op)
+            assert numpy.group_by('genre', field, op) == python.group_by('genre', field, op)
+
+
+def test_invalid_arguments(library_stats):
+    with pytest.raises(ValueError):
+        library_stats.column('name')
+    with pytest.raises(ValueError):
+        library_stats.groups('not_a_field')
+    with pytest.raises(ValueError):
+        library_stats.aggregate('size', 'median')
+    with pytest.raises(ValueError):
+        library_stats.group_by('genre', op='mean')
+
+
+def test_numpy_missing(monkeypatch, write_library):
+    monkeypatch.setattr(stats, 'numpy', None)
+    library = Library()
+    library.parse(write_library(TRACKS))
+    with pytest.raises(ImportError):
+        LibraryStats(library, use_numpy=True)
+    assert library.stats.use_numpy is False and library.stats.total('total_time') == 1200000.0
+
+
+def test_columns_follow_the_library(library_stats, write_library):
+    column = library_stats.column('total_time')
+    assert library_stats.column('total_time') is column
+    library = library_stats.library
+    # a track added in place
+    more = Library()
+    more.parse(write_library([_track(7, "Jazz", "Miles", 50000)], name='more.xml'))
+    library.add_track(more.track_map[7])
+    assert library_stats.total('total_time') == 1250000.0
+    assert library_stats.group_by('genre')['Jazz'] == 2
+    # a new track_map, as update leaves
+    library.track_map = dict((track_id, track) for track_id, track in library.track_map.items() if track_id != 3)
+    assert library_stats.total('total_time') == 650000.0
+    assert 'Miles' in library_stats.group_by('artist') and library_stats.group_by('artist')['Miles'] == 1
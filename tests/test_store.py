@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite stores of parsed libraries.
+"""
+
+import threading
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.store import StoredLibrary
+
+TRACKS = [
+    [("Track ID", 1), ("Name", "One"), ("Artist", "Muse"), ("Genre", "Rock"), ("Year", 2003)],
+    [("Track ID", 2), ("Name", "Two"), ("Artist", "Air"), ("Genre", "Electronic"), ("Year", 1998)],
+    [("Track ID", 3), ("Name", "Three"), ("Artist", "Muse"), ("Genre", "Rock"), ("Year", 2006)],
+]
+
+PLAYLISTS = [
+    ([("Name", "Folder"), ("Playlist ID", 10), ("Playlist Persistent ID", 'A000000000000001'), ("Folder", True),
+      ("All Items", True)], []),
+    ([("Name", "Mix"), ("Playlist ID", 11), ("Playlist Persistent ID", 'A000000000000002'),
+      ("Parent Persistent ID", 'A000000000000001'), ("All Items", True)], [3, 1]),
+]
+
+
+@pytest.fixture
+def stored(tmp_path, write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, PLAYLISTS))
+    path = str(tmp_path / 'library.db')
+    library.export_sqlite(path)
+    stored = StoredLibrary(path)
+    yield stored
+    stored.close()
+
+
+def test_stored_library(stored):
+    assert [track.name for track in stored.track_map.values()] == ["One", "Two", "Three"]
+    assert [track.name for track in stored.tracks.where(genre='Rock')] == ["One", "Three"]
+    playlist = stored.get_playlist_by_display_path('/Folder/Mix')
+    assert list(playlist.track_ids) == [3, 1]
+
+
+def test_stored_library_from_other_threads(stored):
+    results = {}
+    errors = []
+
+    def run(index):
+        try:
+            results[index] = ([track.name for track in stored.tracks.where(artist='Muse')],
+                              stored.track_map[2].name, stored.get_playlist_by_display_path('/Folder/Mix').name,
+                              stored.connection.execute("SELECT COUNT(*) FROM tracks").fetchone()[0])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert list(results.values()) == [(["One", "Three"], "Two", "Mix", 3)] * 4
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Track objects: slots, extra attributes, pickling and copies.
+"""
+
+import copy
+import pickle
+from datetime import datetime
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library, TRACK_FIELD_NAMES, Track
+
+TRACKS = [
+    [("Track ID", 1), ("Name", u"Café"), ("Artist", "Someone"), ("Play Count", 4),
+     ("Date Added", datetime(2019, 4, 1, 10, 32)), ("Loved", True), ("Volume Adjustment", -25),
+     ("Location", 'file:///Users/me/Music/100%2520off%20%231.m4a')],
+    [("Track ID", 2), ("Name", "Plain")],
+]
+
+
+@pytest.fixture
+def library(write_library):
+    library = Library()
+    library.parse(write_library(TRACKS, [([("Name", "All"), ("Playlist ID", 100)], [1, 2])]))
+    return library
+
+
+def test_slots(library):
+    track = library.track_map[1]
+    assert not hasattr(track, '__dict__')
+    assert set(TRACK_FIELD_NAMES) <= set(Track.__slots__)
+    with pytest.raises(AttributeError):
+        track.not_an_attribute = 1
+    assert track.name == u'Café' and track.play_count == 4 and track.genre is None
+    assert track.location == u'file:///Users/me/Music/100%20off #1.m4a'
+
+
+def test_extra_attributes(library):
+    track = library.track_map[1]
+    assert track.extra_attributes == {'Volume Adjustment': -25}
+    plain = library.track_map[2]
+    # no dict until one is needed
+    assert plain._extra_attributes is None and plain.get_as_dict() == {'track_id': 2, 'name': 'Plain'}
+    plain.add_extra_attribute('Key', 'value')
+    assert plain.get_as_dict() == {'track_id': 2, 'name': 'Plain', 'Key': 'value'}
+
+
+@pytest.mark.parametrize('clone', [lambda track: pickle.loads(pickle.dumps(track)),
+                                   lambda track: pickle.loads(pickle.dumps(track, 0)), copy.copy, copy.deepcopy])
+def test_clone(library, clone):
+    for track in library.track_map.values():
+        cloned = clone(track)
+        assert type(cloned) is Track and cloned is not track
+        assert cloned.get_as_dict() == track.get_as_dict()
+    # the location is not unquoted a second time
+    assert clone(library.track_map[1]).location == u'file:///Users/me/Music/100%20off #1.m4a'
+
+
+def test_deep_copy_extra_attributes(library):
+    track = library.track_map[1]
+    for cloned in (copy.deepcopy(track), pickle.loads(pickle.dumps(track))):
+        cloned.add_extra_attribute('Other', 1)
+    assert track.extra_attributes == {'Volume Adjustment': -25}
+
+
+def test_pickled_library(library, library_snapshot):
+    restored = Library()
+    restored.set_state(pickle.loads(pickle.dumps(library.get_state(), pickle.HIGHEST_PROTOCOL)))
+    assert library_snapshot(restored) == library_snapshot(library)
+    # the tracks of the lists and playlists are the objects of track_map
+    assert restored.song_list[0] is restored.track_map[1]
+    assert restored.playlists[0].tracks[1][1] is restored.track_map[2]
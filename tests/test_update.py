@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Library.update, checked against a fresh parse of the same file.
+"""
+
+from datetime import datetime
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library, scan_track_blocks
+
+
+def _track(track_id, name, **values):
+    track = [("Track ID", track_id), ("Name", name), ("Artist", "Rock & Roll <Live>"), ("Album", u"Café"),
+             ("Kind", "AAC audio file"), ("Total Time", 200000 + track_id),
+             ("Date Modified", datetime(2019, 1, track_id, 10, 0)), ("Date Added", datetime(2018, 5, 1))]
+    track += sorted(values.items())
+    track += [("Persistent ID", '%016X' % (0xABC0 + track_id)), ("Track Type", "File"),
+              ("Location", 'file:///Users/me/Music/%d.m4a' % track_id)]
+    return track
+
+
+def _tracks():
+    return [_track(1, "One", **{"Play Count": 3, "Play Date UTC": datetime(2020, 1, 1)}),
+            _track(2, "Two", **{"Rating": 80, "Loved": True}),
+            _track(3, "Three", **{"Podcast": True, "Volume Adjustment": 12}),
+            _track(4, "Four", **{"Movie": True, "Has Video": True}),
+            _track(5, "Five")]
+
+
+def _playlist(name, number, parent=None, folder=False):
+    attributes = [("Name", name), ("Playlist ID", 100 + number),
+                  ("Playlist Persistent ID", '%016X' % (0xF000 + number))]
+    if parent is not None:
+        attributes.append(("Parent Persistent ID", '%016X' % (0xF000 + parent)))
+    if folder:
+        attributes.append(("Folder", True))
+    attributes.append(("All Items", True))
+    return attributes
+
+
+def _playlists(tracks):
+    track_ids = [dict(track)["Track ID"] for track in tracks]
+    return [([("Master", True), ("Visible", False)] + _playlist("Library", 0), track_ids),
+            (_playlist("Parties", 1, folder=True), []),
+            (_playlist("Mix", 2, parent=1), [track_id for track_id in track_ids if track_id != 4]),
+            (_playlist("Sleep", 3, parent=1), [track_id for track_id in (5, 1) if track_id in track_ids]),
+            (_playlist("Films", 4), [4])]
+
+
+def _state(library):
+    """Values of the tracks and playlists objects of a library, to check that update leaves them as they were"""
+    return ([track.get_as_dict() for track in library.track_map.values()],
+            [(playlist.get_as_dict(include_tracks=False), list(playlist.track_ids), playlist.parent)
+             for playlist in library.playlists])
+
+
+@pytest.fixture
+def check_update(write_library, library_snapshot):
+    """Returns check(tracks, playlists, encoding, **parse_options)
+
+    It parses the base library with parse_options, updates it from a file of
+    tracks and playlists, compares it with a fresh parse of that file and
+    returns the LibraryChanges.
+    """
+    def check(tracks, playlists=None, encoding='UTF-8', **parse_options):
+        tracks_before = _tracks()
+        path = write_library(tracks_before, _playlists(tracks_before), encoding=encoding)
+        library = Library()
+        library.parse(path, **parse_options)
+        before = Library()
+        before.__dict__.update(library.__dict__)
+        old_state = _state(before)
+
+        path = write_library(tracks, _playlists(tracks) if playlists is None else playlists, encoding=encoding)
+        changes = library.update(path)
+        fresh = Library()
+        fresh.parse(path)
+        assert library_snapshot(library) == library_snapshot(fresh)
+        # unchanged tracks are kept, the tracks and playlists of the previous state are not modified
+        for track_id in set(library.track_map) - set(changes.added_tracks) - set(changes.changed_tracks):
+            assert library.track_map[track_id] is before.track_map[track_id]
+        assert _state(before) == old_state
+        return changes
+    return check
+
+
+def _changes(changes):
+    return (changes.added_tracks, changes.removed_tracks, changes.changed_tracks,
+            changes.added_playlists, changes.removed_playlists, changes.changed_playlists)
+
+
+def test_layout_is_scanned(write_library):
+    with open(write_library(_tracks(), _playlists(_tracks())), 'rb') as f:
+        assert scan_track_blocks(f.read()) is not None
+
+
+def test_unchanged(check_update):
+    assert _changes(check_update(_tracks())) == ([], [], [], [], [], [])
+
+
+def test_play_count_changed(check_update):
+    tracks = _tracks()
+    tracks[0] = _track(1, "One", **{"Play Count": 4, "Play Date UTC": datetime(2020, 2, 1)})
+    assert _changes(check_update(tracks)) == ([], [], [1], [], [], [])
+
+
+def test_track_added(check_update):
+    tracks = _tracks() + [_track(6, "Six & Seven", **{"Play Count": 1})]
+    assert _changes(check_update(tracks)) == ([6], [], [], [], [], ['000000000000F000', '000000000000F002'])
+
+
+def test_track_removed(check_update):
+    tracks = [track for track in _tracks() if dict(track)["Track ID"] != 5]
+    assert _changes(check_update(tracks)) == ([], [5], [], [], [], ['000000000000F000', '000000000000F002',
+                                                                     '000000000000F003'])
+
+
+def test_playlist_renamed(check_update):
+    tracks = _tracks()
+    playlists = _playlists(tracks)
+    # the folder: its playlists are kept but get new display paths
+    playlists[1] = (_playlist("Parties 2020", 1, folder=True), [])
+    changes = check_update(tracks, playlists)
+    assert _changes(changes) == ([], [], [], [], [], ['000000000000F001'])
+
+
+def test_playlist_added_and_removed(check_update):
+    tracks = _tracks()
+    playlists = _playlists(tracks)
+    del playlists[4]
+    playlists.append((_playlist("Road", 5, parent=1), [2, 3]))
+    assert _changes(check_update(tracks, playlists)) == ([], [], [], ['000000000000F005'], ['000000000000F004'],
+                                                         [])
+
+
+def test_iterparse_fallback(check_update):
+    # not UTF-8: scan_track_blocks gives up and update reads the file with the XML parser
+    tracks = _tracks()
+    tracks[1] = _track(2, "Two", **{"Rating": 100, "Loved": True})
+    tracks.append(_track(6, u"Été"))
+    changes = check_update(tracks, encoding='ISO-8859-1')
+    assert _changes(changes) == ([6], [], [2], [], [], ['000000000000F000', '000000000000F002'])
+
+
+def test_iterparse_fallback_layout(write_library):
+    with open(write_library(_tracks(), _playlists(_tracks()), encoding='ISO-8859-1'), 'rb') as f:
+        assert scan_track_blocks(f.read()) is None
+
+
+def test_lazy_library(check_update):
+    tracks = _tracks()
+    tracks[0] = _track(1, "One", **{"Play Count": 4, "Play Date UTC": datetime(2020, 2, 1)})
+    tracks = [track for track in tracks if dict(track)["Track ID"] != 3] + [_track(6, "Six")]
+    changes = check_update(tracks, lazy=True)
+    assert _changes(changes) == ([6], [3], [1], [], [], ['000000000000F000', '000000000000F002'])
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+LibraryWatcher: change detection, debouncing and refresh.
+"""
+
+import os
+import threading
+
+import pytest
+
+from IReadiTunes.IReadiTunes import Library
+from IReadiTunes.bplist import xml_to_bplist
+from IReadiTunes.watch import LibraryWatcher, _open_inotify, file_state, is_complete
+
+PLAYLISTS = [([("Name", "All"), ("Playlist ID", 100), ("Playlist Persistent ID", 'F000000000000001'),
+               ("All Items", True)], [1, 2])]
+
+
+def _tracks(play_count=1, extra=()):
+    tracks = [[("Track ID", 1), ("Name", "One"), ("Play Count", play_count), ("Persistent ID", '000000000000AB01')],
+              [("Track ID", 2), ("Name", "Two"), ("Persistent ID", '000000000000AB02')]]
+    return tracks + list(extra)
+
+
+def _rewrite(path, text):
+    """Writes text over the file, making sure its stat changes"""
+    before = file_state(path)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    if before is not None and file_state(path) == before:
+        os.utime(path, ns=(before[1] + 1000000, before[1] + 1000000))
+
+
+@pytest.fixture
+def watched(write_library):
+    """Returns (library, watcher, changes received by a subscriber) over a parsed library, with debounce=0"""
+    path = write_library(_tracks(), PLAYLISTS)
+    library = Library()
+    library.parse(path)
+    watcher = LibraryWatcher(library, path, interval=0.01, debounce=0)
+    received = []
+    watcher.subscribe(lambda library, changes: received.append(changes))
+    yield library, watcher, received
+    watcher.stop()
+
+
+def test_is_complete(tmp_path, write_library):
+    path = write_library(_tracks(), PLAYLISTS)
+    assert is_complete(path)
+    text = open(path).read()
+    truncated = tmp_path / 'truncated.xml'
+    truncated.write_text(text[:-len('</plist>\n')])
+    assert not is_complete(str(truncated))
+    assert not is_complete(str(tmp_path / 'missing.xml'))
+
+    bplist = tmp_path / 'library.bplist'
+    xml_to_bplist(path, str(bplist))
+    assert is_complete(str(bplist))
+    data = bplist.read_bytes()
+    for length in (8, 30, len(data) - 10):
+        truncated.write_bytes(data[:length])
+        assert not is_complete(str(truncated))
+
+
+def test_rewrite_is_picked_up_once(watched, library_text):
+    library, watcher, received = watched
+    assert not watcher.check()
+    _rewrite(watcher.path, library_text(_tracks(play_count=2), PLAYLISTS))
+    # first seen, then settled
+    assert [watcher.check(), watcher.check(), watcher.check()] == [False, True, False]
+    assert watcher.refresh_count == 1
+    assert library.track_map[1].play_count == 2
+    assert [changes.changed_tracks for changes in received] == [[1]]
+
+
+def test_truncated_file_is_not_read(watched, library_text):
+    library, watcher, received = watched
+    text = library_text(_tracks(play_count=3, extra=[[("Track ID", 3), ("Name", "Three")]]), PLAYLISTS)
+    _rewrite(watcher.path, text[:len(text) // 2])
+    assert [watcher.check(), watcher.check(), watcher.check()] == [False, False, False]
+    assert received == [] and library.track_map[1].play_count == 1
+
+    _rewrite(watcher.path, text)
+    assert [watcher.check(), watcher.check()] == [False, True]
+    assert library.track_map[1].play_count == 3 and sorted(library.track_map) == [1, 2, 3]
+    assert [(changes.added_tracks, changes.changed_tracks) for changes in received] == [([3], [1])]
+
+
+def test_debounce(write_library, library_text):
+    path = write_library(_tracks(), PLAYLISTS)
+    library = Library()
+    library.parse(path)
+    watcher = LibraryWatcher(library, path, debounce=60)
+    _rewrite(path, library_text(_tracks(play_count=2), PLAYLISTS))
+    assert [watcher.check(), watcher.check()] == [False, False]
+    assert library.track_map[1].play_count == 1
+    watcher.debounce = 0
+    assert watcher.check()
+
+
+def test_failed_refresh_keeps_library(watched, library_text, library_snapshot):
+    library, watcher, received = watched
+    before = library_snapshot(library)
+    _rewrite(watcher.path, '<?xml version="1.0" encoding="UTF-8"?>\n<plist><dict><key>Tracks</key></plist>\n')
+    assert [watcher.check(), watcher.check()] == [False, True]
+    assert received == [] and watcher.refresh_count == 0
+    assert library_snapshot(library) == before
+    # not retried until the file changes again
+    assert not watcher.check()
+
+    _rewrite(watcher.path, library_text(_tracks(play_count=2), PLAYLISTS))
+    assert [watcher.check(), watcher.check()] == [False, True]
+    assert library.track_map[1].play_count == 2
+
+
+def test_failing_subscriber(watched, library_text):
+    library, watcher, received = watched
+
+    def fail(library, changes):
+        raise RuntimeError("subscriber failure")
+
+    watcher.unsubscribe(watcher._subscribers[0])
+    watcher.subscribe(fail)
+    watcher.subscribe(lambda library, changes: received.append(changes))
+    _rewrite(watcher.path, library_text(_tracks(play_count=2), PLAYLISTS))
+    assert [watcher.check(), watcher.check()] == [False, True]
+    assert len(received) == 1
+
+
+def test_binary_plist_is_parsed_again(tmp_path, write_library, library_snapshot):
+    path = str(tmp_path / 'library.bplist')
+    xml_to_bplist(write_library(_tracks(), PLAYLISTS, name='first.xml'), path)
+    library = Library()
+    library.parse(path)
+    watcher = LibraryWatcher(library, path, debounce=0)
+    received = []
+    watcher.subscribe(lambda library, changes: received.append(changes))
+
+    before = file_state(path)
+    xml_to_bplist(write_library(_tracks(play_count=5, extra=[[("Track ID", 3), ("Name", "Three")]]), PLAYLISTS,
+                                name='second.xml'), path)
+    if file_state(path) == before:
+        os.utime(path, ns=(before[1] + 1000000, before[1] + 1000000))
+    assert [watcher.check(), watcher.check()] == [False, True]
+    fresh = Library()
+    fresh.parse(path)
+    assert library_snapshot(library) == library_snapshot(fresh)
+    assert [(changes.added_tracks, changes.changed_tracks) for changes in received] == [([3], [1])]
+
+
+def test_get_state_is_consistent_during_refreshes(watched, library_text):
+    library, watcher, received = watched
+    texts = [library_text(_tracks(play_count=count, extra=[[("Track ID", 3 + count), ("Name", "New")]]), PLAYLISTS)
+             for count in range(10)]
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        while not stop.is_set():
+            state = library.get_state()
+            tracks = set(map(id, state['track_map'].values()))
+            if not all(id(track) in tracks for track in state['song_list']):
+                errors.append(state)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for text in texts:
+            _rewrite(watcher.path, text)
+            assert [watcher.check(), watcher.check()] == [False, True]
+    finally:
+        stop.set()
+        reader.join()
+    assert errors == [] and watcher.refresh_count == len(texts)
+
+
+def _watch_in_thread(watcher, library_text):
+    refreshed = threading.Event()
+    watcher.subscribe(lambda library, changes: refreshed.set())
+    with watcher:
+        _rewrite(watcher.path, library_text(_tracks(play_count=7), PLAYLISTS))
+        assert refreshed.wait(5)
+    assert watcher._thread is None
+    assert watcher.library.track_map[1].play_count == 7
+
+
+def test_polling_thread(watched, library_text):
+    library, watcher, received = watched
+    watcher.use_inotify = False
+    _watch_in_thread(watcher, library_text)
+
+
+def test_inotify_thread(watched, library_text):
+    library, watcher, received = watched
+    inotify = _open_inotify(os.path.dirname(watcher.path))
+    if inotify is None:
+        pytest.skip("inotify is not available")
+    try:
+        _rewrite(watcher.path, open(watcher.path).read())
+        assert os.path.basename(watcher.path) in inotify.wait(1)
+    finally:
+        inotify.close()
+    watcher._loaded_state = watcher._seen_state = file_state(watcher.path)
+    watcher.interval = 0.2
+    watcher.use_inotify = True
+    _watch_in_thread(watcher, library_text)